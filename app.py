@@ -1,21 +1,142 @@
-from flask import Flask, request, jsonify, render_template
+import io
+import os
+import time
+
+from flask import Flask, Response, g, request, jsonify, render_template, send_file
+from flask.json.provider import DefaultJSONProvider
 
 from firstProj import (
     students,          # the main dictionary
     load_data,         # to load students on startup
+    reset_students,    # to load students and build the aggregates
+    sync_changes,      # changes made by other worker processes (GRADING_SHARED)
+    feed,              # GET /events
+    data_version,      # GET /students payload cache and GET /rankings cache
+    versioned_snapshot,  # GET /students payload cache
+    student_version,   # GET /students/<name> and /search/<name> cache
+    subject_version,   # GET /subjects/<subject>/average cache
+    normalize_subject, # GET /subjects/<subject>/average cache
     save_data,         # to persist changes
     addStudent,        # POST /students
     setGrade,          # POST /grades
+    importGrades,      # POST /grades/bulk
+    applyGradeOperations,  # PATCH /grades
     removeGrade,       # DELETE /grades
+    removeStudents,    # DELETE /students/<name>
     normalize_name,    # DELETE /students
     getStudentReport,  # GET /students/<name> and /search/<name>
+    searchStudents,    # GET /search and suggestions for /search/<name>
+    iterStudentReports,  # GET /reports
     getRankings,       # GET /rankings
-    getSubjectAverage  # GET /subjects/<subject>/average
+    getSubjectAverage, # GET /subjects/<subject>/average
+    getSubjectStats,   # GET /subjects/<subject>/stats
+    getClassStats,     # GET /stats
+    listClasses, createClass, addClassStudent, removeClassStudent,  # /classes and its students
+    setClassGrade, removeClassGrade,                                # /classes/<id>/grades
+    getClassStudentReport, getClassRankings, getClassSubjectAverage, freezeClass,
+    getTranscript      # GET /students/<name>/transcript
 )
 
+import events
+import export
+import metrics
+import serializer
+import stats
+from cache import VersionedCache
+
+RESPONSE_CACHE_SIZE = 4096   # Encoded read responses kept in memory (least recently used are dropped)
+SEARCH_MAX_LIMIT = 100       # Most results one GET /search returns
+
+# Sampling profiler (see metrics.SamplingProfiler): "1" starts it with the app; it can
+# also be switched on and off with POST /metrics/profiler. The PROFILE_KEEP slowest
+# requests seen while it runs have their profiles written to PROFILE_FOLDER.
+PROFILE = os.environ.get("GRADING_PROFILE", "0") != "0"
+PROFILE_FOLDER = "profiles"
+PROFILE_KEEP = 20
+PROFILE_INTERVAL = 0.005     # Seconds between stack samples
+
+# Report-card exports (see export.py) run as background jobs, one at a time, each
+# rendered by a pool of EXPORT_WORKERS processes into EXPORT_FOLDER/<job id>.zip
+EXPORT_FOLDER = "exports"
+EXPORT_WORKERS = int(os.environ.get("GRADING_EXPORT_WORKERS", "0")) or os.cpu_count() or 1
+
+# Server-sent events (see events.py) pushed to dashboards on GET /events
+EVENTS_POLL = 1.0            # Seconds an idle /events stream waits before checking for other workers' changes
+EVENTS_KEEPALIVE = 15        # Seconds between comments that keep an idle /events connection open
+
+
+class StudentJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes through serializer (orjson when installed)."""
+
+    def dumps(self, obj, **kwargs):
+        return serializer.dumps(obj, pretty="indent" in kwargs)
+
+
 app = Flask(__name__)
+app.json = StudentJSONProvider(app)
+
+reset_students(load_data())
+
+# Encoded GET /students body and the data version it was built from.
+# The ETag includes the start time so it changes across restarts too.
+_students_payload = (None, b"")
+_started = format(int(time.time()), "x")
+
+# Encoded read responses, tagged with the version of the data they were built from
+response_cache = VersionedCache(max_entries=RESPONSE_CACHE_SIZE)
+
+profiler = metrics.SamplingProfiler(PROFILE_FOLDER, interval=PROFILE_INTERVAL, keep=PROFILE_KEEP)
+if PROFILE:
+    profiler.enable()
+
+
+@app.before_request
+def start_timer():
+    # An event stream lasts as long as the client stays, so it is neither timed nor profiled
+    if (metrics.enabled() or profiler.running) and request.endpoint != "change_feed":
+        g.request_start = time.perf_counter()
+        g.profile = profiler.start()
+
+
+@app.before_request
+def apply_other_workers_changes():
+    # Other worker processes may have changed the data since the last request;
+    # applying their changes bumps the versions that the response caches check
+    sync_changes()
 
-students.update(load_data())
+
+@app.after_request
+def record_request(response):
+    start = g.get("request_start")
+    if start is None:
+        return response
+    # Route templates, not paths, so every student shares one series
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    method, status, profile = request.method, response.status_code, g.get("profile")
+
+    def finish():
+        # Runs once the body has been sent, so streamed responses are timed in full
+        seconds = time.perf_counter() - start
+        metrics.observe("request_duration_seconds", seconds, method=method, route=route, status=status)
+        profiler.finish(profile, f"{method} {route}", seconds)
+
+    response.call_on_close(finish)
+    return response
+
+
+def cached_json(key, stamp, compute):
+    """Serve compute()'s (result, status) from response_cache while `stamp` is unchanged."""
+    def build():
+        result, status = compute()
+        return serializer.dumps_bytes(result), status
+
+    body, status = response_cache.get(key, stamp, build)
+    return Response(body, status=status, mimetype="application/json")
+
+
+def _report_response(name):
+    report = getStudentReport(name)
+    return report, 200 if report.get("success") else 404
 
 
 @app.route("/")
@@ -28,7 +149,16 @@ def home():
 
 @app.route("/students", methods=["GET"])
 def get_students():
-    return jsonify(students)
+    global _students_payload
+    version, payload = _students_payload
+    if version != data_version():
+        version, snapshot = versioned_snapshot()
+        payload = serializer.dumps_bytes(snapshot)
+        _students_payload = (version, payload)
+
+    response = Response(payload, mimetype="application/json")
+    response.set_etag(f"{_started}-{version}")
+    return response.make_conditional(request)
 
 
 
@@ -78,12 +208,53 @@ def add_grade():
 
 
 
+@app.route("/grades", methods=["PATCH"])
+def batch_grades():
+    # { "operations": [ { "op": "add" | "remove" | "replace", "name": ..., "subject": ..., ... } ] }
+    data = request.get_json(silent=True)
+    operations = data.get("operations") if isinstance(data, dict) else data
+    if operations is None:
+        return jsonify({"success": False, "message": "operations are required"}), 400
+
+    result = applyGradeOperations(operations)
+    if result["applied"]:
+        save_data(students)
+
+    return jsonify(result), 200 if result["success"] else 400
+
+
+
+
+@app.route("/grades/bulk", methods=["POST"])
+def bulk_import_grades():
+    # Accept either a multipart upload in the "file" field or the raw request body
+    upload = request.files.get("file")
+    if upload is not None:
+        stream, filename, mimetype = upload.stream, upload.filename or "", upload.mimetype
+    else:
+        stream, filename, mimetype = request.stream, "", request.mimetype
+
+    fmt = request.args.get("format")
+    if fmt is None:
+        if filename.endswith(".jsonl") or filename.endswith(".ndjson") or "ndjson" in mimetype or "jsonl" in mimetype:
+            fmt = "jsonl"
+        else:
+            fmt = "csv"
+
+    lines = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    result = importGrades(lines, fmt=fmt)
+    if result.get("imported"):
+        save_data(students)
+
+    return jsonify(result), 200 if result["success"] else 400
+
+
+
+
 @app.route("/students/<name>", methods=["GET"])
 def student_report(name):
-    report = getStudentReport(name)
-    if not report.get("success"):
-        return jsonify(report), 404
-    return jsonify(report), 200
+    name = normalize_name(name)
+    return cached_json(("student", name), student_version(name), lambda: _report_response(name))
 
 
 @app.route("/reports", methods=["GET"])
@@ -94,26 +265,54 @@ def all_student_reports():
             "message": "No students found."
         }), 404
 
-    all_reports = []
+    min_average = request.args.get("min_average", type=float)
+    if "min_average" in request.args and min_average is None:
+        return jsonify({"success": False, "message": "min_average must be a number"}), 400
+
+    reports = iterStudentReports(
+        subject=request.args.get("subject"),
+        min_average=min_average,
+        letter=request.args.get("letter"),
+    )
+    dumps = serializer.dumps
+
+    # Reports are encoded and sent as they are built, so nothing holds the whole class
+    if request.args.get("format") == "ndjson" or request.accept_mimetypes.best == "application/x-ndjson":
+        def generate_ndjson():
+            for report in reports:
+                yield dumps(report) + "\n"
 
-    for name in students:
-        report = getStudentReport(name)
-        if report.get("success"):
-            all_reports.append(report)
+        return Response(generate_ndjson(), mimetype="application/x-ndjson")
 
-    return jsonify({
-        "success": True,
-        "reports": all_reports
-    }), 200
+    def generate_json():
+        yield '{"success":true,"reports":['
+        separator = ""
+        for report in reports:
+            yield separator + dumps(report)
+            separator = ","
+        yield "]}\n"
+
+    return Response(generate_json(), mimetype="application/json")
 
 
 
 @app.route("/rankings", methods=["GET"])
 def rankings():
-    result = getRankings()
-    if not result.get("success"):
-        return jsonify(result), 404
-    return jsonify(result), 200
+    limit = request.args.get("limit", type=int)
+    offset = request.args.get("offset", 0, type=int)
+    around = request.args.get("around")
+
+    if (limit is not None and limit < 0) or offset < 0:
+        return jsonify({"success": False, "message": "limit and offset must not be negative"}), 400
+
+    if around is not None:
+        around = normalize_name(around)
+
+    def compute():
+        result = getRankings(limit=limit, offset=offset, around=around)
+        return result, 200 if result.get("success") else 404
+
+    return cached_json(("rankings", limit, offset, around), data_version(), compute)
 
 
 
@@ -152,7 +351,7 @@ def delete_student(name):
     if name not in students:
         return jsonify({"success": False, "message": f"Student '{name}' not found."}), 404
 
-    students.pop(name)
+    removeStudents([name])
     save_data(students)
     return jsonify({"success": True, "message": f"Student '{name}' removed."}), 200
 
@@ -161,20 +360,301 @@ def delete_student(name):
 
 @app.route("/subjects/<subject>/average", methods=["GET"])
 def subject_average(subject):
-    result = getSubjectAverage(subject)
-    if not result.get("success"):
-        return jsonify(result), 404
-    return jsonify(result), 200
+    subject = normalize_subject(subject)
 
+    def compute():
+        result = getSubjectAverage(subject)
+        return result, 200 if result.get("success") else 404
 
+    return cached_json(("subject_average", subject), subject_version(subject), compute)
+
+
+
+
+def _percentiles_arg():
+    """Parse ?percentiles=5,50,95; returns None for a bad value."""
+    raw = request.args.get("percentiles")
+    if raw is None:
+        return stats.DEFAULT_PERCENTILES
+    try:
+        percentiles = tuple(float(p) for p in raw.split(",") if p.strip())
+    except ValueError:
+        return None
+    if not percentiles or not all(0 <= p <= 100 for p in percentiles):
+        return None
+    return percentiles
+
+
+@app.route("/subjects/<subject>/stats", methods=["GET"])
+def subject_stats(subject):
+    subject = normalize_subject(subject)
+    percentiles = _percentiles_arg()
+    if percentiles is None:
+        return jsonify({"success": False, "message": "percentiles must be numbers from 0 to 100"}), 400
+
+    def compute():
+        result = getSubjectStats(subject, percentiles)
+        return result, 200 if result.get("success") else 404
+
+    return cached_json(("subject_stats", subject, percentiles), subject_version(subject), compute)
+
+
+@app.route("/stats", methods=["GET"])
+def class_stats():
+    percentiles = _percentiles_arg()
+    if percentiles is None:
+        return jsonify({"success": False, "message": "percentiles must be numbers from 0 to 100"}), 400
+
+    def compute():
+        result = getClassStats(percentiles)
+        return result, 200 if result.get("success") else 404
+
+    return cached_json(("class_stats", percentiles), data_version(), compute)
+
+
+@app.route("/search", methods=["GET"])
+def search_students():
+    query = request.args.get("q", "")
+    limit = request.args.get("limit", 10, type=int)
+    fuzzy = request.args.get("fuzzy", "1") != "0"
+
+    if not query.strip():
+        return jsonify({"success": False, "message": "q is required"}), 400
+    if not 0 < limit <= SEARCH_MAX_LIMIT:
+        return jsonify({"success": False, "message": f"limit must be from 1 to {SEARCH_MAX_LIMIT}"}), 400
+
+    # Not cached: queries typed a keystroke at a time are rarely repeated, and would push
+    # reports out of response_cache
+    return jsonify(searchStudents(query, limit, fuzzy)), 200
 
 
 @app.route("/search/<name>", methods=["GET"])
 def search_student(name):
-    report = getStudentReport(name)
-    if not report.get("success"):
-        return jsonify(report), 404
-    return jsonify(report), 200
+    name = normalize_name(name)
+    if name not in students:
+        suggestions = [match["name"] for match in searchStudents(name, limit=5)["results"]]
+        return jsonify({"success": False, "message": f"Student '{name}' not found.",
+                        "suggestions": suggestions}), 404
+    return cached_json(("student", name), student_version(name), lambda: _report_response(name))
+
+
+
+
+# Class and term shards (see classes.py)
+
+
+CLASS_ERROR_STATUS = {"invalid": 400, "not_found": 404, "exists": 409, "frozen": 409}
+
+
+def _class_status(result, ok=200):
+    return ok if result["success"] else CLASS_ERROR_STATUS[result["error"]]
+
+
+@app.route("/classes", methods=["GET"])
+def get_classes():
+    return jsonify(listClasses()), 200
+
+
+@app.route("/classes", methods=["POST"])
+def create_class():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or "id" not in data:
+        return jsonify({"success": False, "message": "Class id is required"}), 400
+
+    result = createClass(data["id"], data.get("class"), data.get("term"))
+    return jsonify(result), _class_status(result, 201)
+
+
+@app.route("/classes/<class_id>/students", methods=["POST"])
+def add_class_student(class_id):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or "name" not in data:
+        return jsonify({"success": False, "message": "Student name is required"}), 400
+
+    result = addClassStudent(class_id, data["name"])
+    return jsonify(result), _class_status(result, 201)
+
+
+@app.route("/classes/<class_id>/students/<name>", methods=["GET"])
+def class_student_report(class_id, name):
+    result = getClassStudentReport(class_id, name)
+    return jsonify(result), _class_status(result)
+
+
+@app.route("/classes/<class_id>/students/<name>", methods=["DELETE"])
+def delete_class_student(class_id, name):
+    result = removeClassStudent(class_id, name)
+    return jsonify(result), _class_status(result)
+
+
+@app.route("/classes/<class_id>/grades", methods=["POST"])
+def add_class_grade(class_id):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get("name") or not data.get("subject") or data.get("grades") is None:
+        return jsonify({"success": False, "message": "Missing required fields"}), 400
+
+    result = setClassGrade(class_id, data["name"], data["subject"], data["grades"])
+    return jsonify(result), _class_status(result, 201)
+
+
+@app.route("/classes/<class_id>/grades", methods=["DELETE"])
+def delete_class_grade(class_id):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get("name") or not data.get("subject") or data.get("grade") is None:
+        return jsonify({"success": False, "message": "Missing required fields"}), 400
+
+    result = removeClassGrade(class_id, data["name"], data["subject"], data["grade"])
+    return jsonify(result), _class_status(result)
+
+
+@app.route("/classes/<class_id>/rankings", methods=["GET"])
+def class_rankings(class_id):
+    limit = request.args.get("limit", type=int)
+    offset = request.args.get("offset", 0, type=int)
+    if (limit is not None and limit < 0) or offset < 0:
+        return jsonify({"success": False, "message": "limit and offset must not be negative"}), 400
+
+    result = getClassRankings(class_id, limit=limit, offset=offset)
+    return jsonify(result), _class_status(result)
+
+
+@app.route("/classes/<class_id>/subjects/<subject>/average", methods=["GET"])
+def class_subject_average(class_id, subject):
+    result = getClassSubjectAverage(class_id, subject)
+    return jsonify(result), _class_status(result)
+
+
+@app.route("/classes/<class_id>/freeze", methods=["POST"])
+def freeze_class(class_id):
+    result = freezeClass(class_id)
+    return jsonify(result), _class_status(result)
+
+
+@app.route("/students/<name>/transcript", methods=["GET"])
+def student_transcript(name):
+    result = getTranscript(name)
+    return jsonify(result), _class_status(result)
+
+
+
+
+# Change feed
+
+
+@app.route("/events", methods=["GET"])
+def change_feed():
+    last_id = request.headers.get("Last-Event-ID")
+    subscription = events.Subscription(feed, last_id)
+
+    def generate():
+        try:
+            yield events.RETRY + events.encode(subscription.missed)
+            idle = 0.0
+            while True:
+                entries = subscription.get(EVENTS_POLL)
+                if entries:
+                    yield events.encode(entries)
+                    idle = 0.0
+                    continue
+                # Changes made by other workers are published here once applied
+                sync_changes()
+                idle += EVENTS_POLL
+                if idle >= EVENTS_KEEPALIVE:
+                    yield events.KEEPALIVE
+                    idle = 0.0
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+
+
+# Report-card exports
+
+
+export_jobs = export.ExportJobs(EXPORT_FOLDER, workers=EXPORT_WORKERS)
+
+
+@app.route("/exports", methods=["POST"])
+def start_export():
+    data = request.get_json(silent=True) or {}
+    fmt = data.get("format", "pdf")
+    if fmt not in export.FORMATS:
+        return jsonify({"success": False, "message": f"format must be one of {', '.join(export.FORMATS)}"}), 400
+    min_average = data.get("min_average")
+    if min_average is not None and not isinstance(min_average, (int, float)):
+        return jsonify({"success": False, "message": "min_average must be a number"}), 400
+
+    filters = {"subject": data.get("subject"), "min_average": min_average, "letter": data.get("letter")}
+    total = len(students) if not any(value is not None for value in filters.values()) else None
+    job = export_jobs.start(iterStudentReports(**filters), fmt, total, data.get("title", "Report Card"))
+    return jsonify({"success": True, "job": job.to_dict()}), 202
+
+
+@app.route("/exports", methods=["GET"])
+def list_exports():
+    return jsonify({"success": True, "jobs": [job.to_dict() for job in export_jobs.jobs()]}), 200
+
+
+@app.route("/exports/<job_id>", methods=["GET"])
+def export_status(job_id):
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": f"Export '{job_id}' not found."}), 404
+    return jsonify({"success": True, "job": job.to_dict()}), 200
+
+
+@app.route("/exports/<job_id>/download", methods=["GET"])
+def download_export(job_id):
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": f"Export '{job_id}' not found."}), 404
+    if job.status != "finished":
+        return jsonify({"success": False, "message": f"Export '{job_id}' is {job.status}.", "job": job.to_dict()}), 409
+    return send_file(os.path.abspath(job.path), mimetype="application/zip", as_attachment=True,
+                     download_name=f"report_cards_{job.format}.zip")
+
+
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({"success": True, "cache": response_cache.stats()}), 200
+
+
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    cache = response_cache.stats()
+    gauges = [
+        ("students", "Students in the roster.", len(students)),
+        ("response_cache_entries", "Encoded responses held in the response cache.", cache["entries"]),
+        ("response_cache_hits", "Response cache lookups served from the cache.", cache["hits"]),
+        ("response_cache_misses", "Response cache lookups that built the response.", cache["misses"]),
+        ("profiler_running", "Whether the sampling profiler is running.", int(profiler.running)),
+    ]
+    return Response(metrics.registry.render(gauges), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/metrics/profiler", methods=["GET"])
+def profiler_status():
+    return jsonify({"success": True, "running": profiler.running, "profiles": profiler.profiles()}), 200
+
+
+@app.route("/metrics/profiler", methods=["POST"])
+def toggle_profiler():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get("enabled"), bool):
+        return jsonify({"success": False, "message": "enabled must be true or false"}), 400
+
+    if data["enabled"]:
+        profiler.enable()
+    else:
+        profiler.disable()
+    return jsonify({"success": True, "running": profiler.running, "profiles": profiler.profiles()}), 200
 
 
 if __name__ == "__main__":
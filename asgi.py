@@ -0,0 +1,405 @@
+import argparse
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import unquote
+
+# Async serving mode: the Flask app from app.py behind an ASGI interface.
+#   uvicorn asgi:application      (or any ASGI server)
+#   python asgi.py --port 5000    (uvicorn when installed, else the small server below)
+# Handlers run unchanged on a thread pool, so the event loop only moves bytes and
+# can hold thousands of idle or polling connections. GET /events streams are served
+# on the event loop itself, so open dashboards do not tie up handler threads. Changes are persisted by the
+# "batched" writer thread (see writer.py): a handler's save_data returns at once,
+# and the response to a changing request is sent when its write has finished,
+# without a thread waiting for it (or a 500 if the write failed).
+
+os.environ.setdefault("GRADING_PERSISTENCE", "batched")
+os.environ.setdefault("GRADING_SAVE_WAIT", "0")
+
+import events  # noqa: E402
+import firstProj  # noqa: E402  (the settings above must be in place first)
+import serializer  # noqa: E402
+from app import EVENTS_KEEPALIVE, EVENTS_POLL, app  # noqa: E402
+
+HANDLER_THREADS = 32        # Threads running Flask handlers
+BODY_CHUNK = 64 * 1024      # Response bytes gathered on a handler thread per event loop hop
+CHANGING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+_executor = ThreadPoolExecutor(max_workers=HANDLER_THREADS, thread_name_prefix="handler")
+
+
+class _RequestBody(io.RawIOBase):
+    """wsgi.input for a body still arriving, read on a handler thread.
+
+    Each further chunk is taken from receive() on the event loop when the handler
+    asks for it, so a large upload is never held in memory whole.
+    """
+
+    def __init__(self, first, receive, loop):
+        self._buffer = first
+        self._receive = receive
+        self._loop = loop
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and not self._done:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message["type"] == "http.disconnect":
+                raise ConnectionError("client disconnected before sending the whole body")
+            self._buffer = message.get("body", b"")
+            self._done = not message.get("more_body")
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def _environ(scope, body):
+    """Build a WSGI environ from an ASGI http scope and the request body, bytes or a _RequestBody."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)) if isinstance(body, bytes) else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body) if isinstance(body, bytes) else io.BufferedReader(body, BODY_CHUNK),
+        "wsgi.input_terminated": True,  # read the input to its end, whatever Content-Length says
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name == "CONTENT_LENGTH":
+            if not isinstance(body, bytes):
+                environ["CONTENT_LENGTH"] = value
+        else:
+            key = "HTTP_" + name
+            environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+
+def _read_chunk(iterator):
+    """Gather up to BODY_CHUNK bytes from a WSGI body; fewer means it is exhausted."""
+    parts, size = [], 0
+    for part in iterator:
+        parts.append(part)
+        size += len(part)
+        if size >= BODY_CHUNK:
+            break
+    return b"".join(parts)
+
+
+def _close(iterable):
+    if hasattr(iterable, "close"):
+        iterable.close()
+
+
+def _start(environ):
+    """Run the Flask app for one request and read the start of its body.
+
+    Returns (status, headers, first chunk, iterable), where iterable is None when the
+    whole body fit in the first chunk, so most responses need one thread hop.
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    iterable = app.wsgi_app(environ, start_response)
+    try:
+        iterator = iter(iterable)
+        chunk = _read_chunk(iterator)
+    except BaseException:
+        _close(iterable)
+        raise
+    if len(chunk) < BODY_CHUNK:
+        _close(iterable)
+        return response["status"], response["headers"], chunk, None
+    return response["status"], response["headers"], chunk, (iterator, iterable)
+
+
+async def _durable():
+    """Wait until every change saved so far has been written by the batched writer.
+
+    Returns None, or the exception of the write that failed to save them.
+    """
+    if firstProj.PERSISTENCE_MODE != "batched" or firstProj.STORAGE_BACKEND != "json":
+        return None
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    firstProj.save_worker().on_durable(lambda error: loop.call_soon_threadsafe(done.set_result, error))
+    return await done
+
+
+async def _send_save_error(send, error):
+    body = serializer.dumps_bytes({"success": False, "message": f"Error saving data: {error}"})
+    await send({"type": "http.response.start", "status": 500,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if firstProj.PERSISTENCE_MODE == "batched":
+                await asyncio.get_running_loop().run_in_executor(_executor, firstProj.save_worker().flush)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI entry point serving every route of app.py."""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/events" and scope["method"] == "GET":
+        await _event_stream(scope, receive, send)
+        return
+
+    message = await receive()
+    if message["type"] == "http.disconnect":
+        return
+    loop = asyncio.get_running_loop()
+    body = message.get("body", b"")
+    if message.get("more_body"):
+        # The rest is read by the handler as it goes (POST /grades/bulk streams its upload)
+        body = _RequestBody(body, receive, loop)
+    status, headers, chunk, rest = await loop.run_in_executor(_executor, _start, _environ(scope, body))
+    if rest is None:
+        if scope["method"] in CHANGING_METHODS:
+            error = await _durable()
+            if error is not None:
+                await _send_save_error(send, error)
+                return
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": chunk})
+        return
+
+    # A long (usually streamed) body is read a chunk at a time on the handler threads
+    iterator, iterable = rest
+    try:
+        if scope["method"] in CHANGING_METHODS:
+            error = await _durable()
+            if error is not None:
+                await _send_save_error(send, error)
+                return
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        while chunk:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            chunk = await loop.run_in_executor(_executor, _read_chunk, iterator)
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        await loop.run_in_executor(_executor, _close, iterable)
+
+
+async def _event_stream(scope, receive, send):
+    """GET /events on the event loop: the same stream as app.change_feed, without a thread per client."""
+    loop = asyncio.get_running_loop()
+    waiting = asyncio.Queue()
+
+    def deliver(batch):
+        # Called on the publishing thread
+        loop.call_soon_threadsafe(waiting.put_nowait, batch)
+
+    last_id = None
+    for name, value in scope.get("headers", ()):
+        if name.lower() == b"last-event-id":
+            last_id = value.decode("latin-1")
+    missed = firstProj.feed.subscribe(deliver, last_id)
+    if missed is None:
+        missed = [firstProj.feed.reset_event()]
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    gone = asyncio.ensure_future(disconnected())
+    try:
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+        await send({"type": "http.response.body", "body": events.RETRY + events.encode(missed), "more_body": True})
+        idle = 0.0
+        while not gone.done():
+            batch = asyncio.ensure_future(waiting.get())
+            done, _ = await asyncio.wait({batch, gone}, timeout=EVENTS_POLL, return_when=asyncio.FIRST_COMPLETED)
+            if batch in done:
+                entries = list(batch.result())
+                while not waiting.empty():
+                    entries.extend(waiting.get_nowait())
+                if len(entries) > events.QUEUE_SIZE:
+                    entries = [firstProj.feed.reset_event()]
+                await send({"type": "http.response.body", "body": events.encode(entries), "more_body": True})
+                idle = 0.0
+                continue
+            batch.cancel()
+            if gone.done():
+                break
+            await loop.run_in_executor(_executor, firstProj.sync_changes)
+            idle += EVENTS_POLL
+            if idle >= EVENTS_KEEPALIVE:
+                await send({"type": "http.response.body", "body": events.KEEPALIVE, "more_body": True})
+                idle = 0.0
+    except OSError:
+        pass  # the client went away mid-send
+    finally:
+        firstProj.feed.unsubscribe(deliver)
+        gone.cancel()
+
+
+# Minimal HTTP/1.1 server, used when uvicorn is not installed
+
+
+async def _serve_connection(reader, writer):
+    server = writer.get_extra_info("sockname")[:2]
+    client = writer.get_extra_info("peername")[:2]
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            method, target, version = request_line.decode("latin-1").split()
+            headers = []
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers.append((name.strip().lower().encode("latin-1"), value.strip().encode("latin-1")))
+            fields = dict(headers)
+            if b"chunked" in fields.get(b"transfer-encoding", b""):
+                writer.write(b"HTTP/1.1 411 Length Required\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                break
+            remaining = int(fields.get(b"content-length", b"0"))
+            path, _, query = target.partition("?")
+            connection = fields.get(b"connection", b"").lower()
+            keep_alive = connection == b"keep-alive" if version == "HTTP/1.0" else connection != b"close"
+
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": version[5:],
+                "method": method, "scheme": "http", "path": unquote(path), "raw_path": path.encode("latin-1"),
+                "query_string": query.encode("latin-1"), "root_path": "", "headers": headers,
+                "server": server, "client": client,
+            }
+            sent = False
+            finished = asyncio.Event()
+
+            async def receive():
+                nonlocal sent, remaining
+                if sent and not remaining:
+                    # The client is not read again until the response is done
+                    await finished.wait()
+                    return {"type": "http.disconnect"}
+                sent = True
+                body = await reader.read(min(remaining, BODY_CHUNK)) if remaining else b""
+                if remaining and not body:
+                    raise ConnectionError("client closed the connection mid-body")
+                remaining -= len(body)
+                return {"type": "http.request", "body": body, "more_body": remaining > 0}
+
+            chunked = False
+
+            async def send(message):
+                nonlocal chunked
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}".encode("latin-1")]
+                    names = {name for name, _ in message["headers"]}
+                    lines += [name + b": " + value for name, value in message["headers"]]
+                    if b"content-length" not in names:
+                        chunked = True
+                        lines.append(b"transfer-encoding: chunked")
+                    lines.append(b"connection: " + (b"keep-alive" if keep_alive else b"close"))
+                    writer.write(b"\r\n".join(lines) + b"\r\n\r\n")
+                elif message["type"] == "http.response.body":
+                    data = message.get("body", b"")
+                    if chunked:
+                        if data:
+                            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+                        if not message.get("more_body"):
+                            writer.write(b"0\r\n\r\n")
+                    else:
+                        writer.write(data)
+                    await writer.drain()
+                    if not message.get("more_body"):
+                        finished.set()
+
+            await application(scope, receive, send)
+            if not keep_alive:
+                break
+            while remaining:
+                # Whatever of the body the handler did not read, before the next request
+                data = await reader.read(min(remaining, BODY_CHUNK))
+                if not data:
+                    raise ConnectionError("client closed the connection mid-body")
+                remaining -= len(data)
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host="127.0.0.1", port=5000, sock=None):
+    """Serve `application` with the built-in server until cancelled.
+
+    `sock` is an already listening socket to accept on instead (see workers.py).
+    """
+    if sock is not None:
+        server = await asyncio.start_server(_serve_connection, sock=sock, backlog=4096)
+        host, port = sock.getsockname()[:2]
+    else:
+        server = await asyncio.start_server(_serve_connection, host, port, backlog=4096)
+    print(f"Serving on http://{host}:{port} (built-in asyncio server)")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the grading API asynchronously.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        uvicorn = None
+    try:
+        if uvicorn is not None:
+            uvicorn.run(application, host=args.host, port=args.port, log_level="warning")
+        else:
+            asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import lazyload
+import serializer
+
+# Backup snapshots of the student data.
+# Every snapshot is a JSON object stored once under objects/<sha256>.json, named
+# by its content, and listed in catalog.json, oldest first:
+#   {"time": 1760000000.0, "taken": "2025-10-09T08:53:20", "kind": "delta",
+#    "object": "<sha256>", "state": "<digest of the whole roster>"}
+# A "full" object is the { name: { subject: [grades] } } data itself. A "delta"
+# object is {"set": { name: record }, "remove": [names]} against the previous
+# snapshot in the catalog, so restoring replays from the nearest full one.
+# Snapshots of unchanged data are skipped.
+#
+# A retention policy is a list of (bucket seconds, max age seconds) rules. For each
+# rule, the newest snapshot in every bucket younger than the max age is kept; bucket
+# 0 keeps every snapshot in that age range. The newest snapshot is always kept.
+# A dropped delta is folded into the next kept snapshot.
+
+DEFAULT_RETENTION = [(0, 3600), (3600, 86400), (86400, 30 * 86400)]
+
+
+def _digest(body):
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+def _join(pairs):
+    """Encode (name, record JSON bytes) pairs as one JSON object."""
+    return b"{" + b",".join(serializer.dumps_bytes(name) + b":" + body for name, body in pairs) + b"}"
+
+
+def _combine(first, second):
+    """Fold two consecutive (kind, object) snapshots into one covering both."""
+    kind, data = second
+    if kind == "full":
+        return second
+    first_kind, first_data = first
+    if first_kind == "full":
+        result = dict(first_data)
+        for name in data["remove"]:
+            result.pop(name, None)
+        result.update(data["set"])
+        return "full", result
+    changed = {name: record for name, record in first_data["set"].items() if name not in data["remove"]}
+    changed.update(data["set"])
+    removed = [name for name in first_data["remove"] if name not in data["set"]]
+    removed += [name for name in data["remove"] if name not in removed]
+    return "delta", {"set": changed, "remove": removed}
+
+
+def parse_time(value):
+    """Accept a timestamp, a datetime or an ISO 8601 string and return seconds since the epoch."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class BackupStore:
+    def __init__(self, folder, retention=None, interval=60, full_every=100):
+        self.folder = folder
+        self.retention = DEFAULT_RETENTION if retention is None else retention
+        self.interval = interval          # seconds between snapshots; saves in between are not backed up
+        self.full_every = full_every      # deltas after which the next snapshot is a full one
+        self._lock = threading.Lock()
+        self._catalog = None
+        # { name: (record, digest) } and state digest of the newest snapshot this process has seen
+        self._base = None
+        self._base_state = None
+
+    # Files
+
+    @property
+    def catalog_path(self):
+        return os.path.join(self.folder, "catalog.json")
+
+    def _object_path(self, digest):
+        return os.path.join(self.folder, "objects", f"{digest}.json")
+
+    def _write(self, path, payload):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _store(self, payload):
+        """Write an object unless the same content is already stored, and return its name."""
+        digest = hashlib.sha256(payload).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            self._write(path, payload)
+        return digest
+
+    def _load(self, entry):
+        with open(self._object_path(entry["object"]), "rb") as f:
+            return entry["kind"], json.load(f)
+
+    def entries(self):
+        """Return the catalog: one dict per retained snapshot, oldest first."""
+        if self._catalog is None:
+            try:
+                with open(self.catalog_path, "r") as f:
+                    self._catalog = json.load(f)
+            except FileNotFoundError:
+                self._catalog = []
+        return self._catalog
+
+    def _save_catalog(self):
+        self._write(self.catalog_path, json.dumps(self._catalog, indent=1).encode("utf-8"))
+
+    # Snapshots
+
+    def _digests(self, data):
+        """Return ({ name: (record, digest) }, encode) for `data`, encoding only changed records."""
+        base = self._base or {}
+        digests = {}
+        if isinstance(data, lazyload.LazyRoster):
+            # Unchanged records are hashed straight from the memory-mapped data file
+            for name, body in data.encoded_items():
+                digests[name] = (None, _digest(body))
+        else:
+            for name, record in data.items():
+                old = base.get(name)
+                if old is not None and old[0] is record:
+                    digests[name] = old
+                else:
+                    digests[name] = (record, _digest(serializer.dumps_bytes(record)))
+
+        def encode(name):
+            record = digests[name][0]
+            return serializer.dumps_bytes(record if record is not None else data[name])
+
+        return digests, encode
+
+    def snapshot(self, data, now=None, force=False):
+        """Back up `data` and return its catalog entry, or None when nothing was written.
+
+        Nothing is written within `interval` seconds of the previous snapshot (unless
+        `force` is set) or when the data is unchanged since it.
+        """
+        with self._lock:
+            now = time.time() if now is None else now
+            catalog = self.entries()
+            if catalog and not force and now - catalog[-1]["time"] < self.interval:
+                return None
+
+            digests, encode = self._digests(data)
+            state = hashlib.blake2b(digest_size=16)
+            for name, (_, digest) in digests.items():
+                state.update(serializer.dumps_bytes(name) + digest)
+            state = state.hexdigest()
+            if catalog and catalog[-1]["state"] == state:
+                self._base, self._base_state = digests, state
+                return None
+
+            since_full = 0
+            for entry in reversed(catalog):
+                if entry["kind"] == "full":
+                    break
+                since_full += 1
+            base = self._base
+            if not catalog or catalog[-1]["state"] != self._base_state or since_full >= self.full_every:
+                kind = "full"
+                if isinstance(data, lazyload.LazyRoster):
+                    payload = _join(data.encoded_items())
+                else:
+                    payload = _join((name, encode(name)) for name in digests)
+            else:
+                kind = "delta"
+                changed = [name for name, (_, digest) in digests.items()
+                           if name not in base or base[name][1] != digest]
+                removed = [name for name in base if name not in digests]
+                payload = (b'{"set":' + _join((name, encode(name)) for name in changed)
+                           + b',"remove":' + serializer.dumps_bytes(removed) + b"}")
+
+            entry = {
+                "time": now,
+                "taken": datetime.fromtimestamp(now).isoformat(timespec="seconds"),
+                "kind": kind,
+                "object": self._store(payload),
+                "size": len(payload),
+                "state": state,
+            }
+            catalog.append(entry)
+            self._base, self._base_state = digests, state
+            self._prune(now)
+            self._save_catalog()
+            return entry
+
+    # Retention
+
+    def prune(self, now=None):
+        """Apply the retention policy now and delete objects no snapshot uses."""
+        with self._lock:
+            self._prune(time.time() if now is None else now)
+            self._save_catalog()
+
+    def _prune(self, now):
+        catalog = self.entries()
+        keep = {len(catalog) - 1} if catalog else set()
+        for bucket, max_age in self.retention:
+            seen = set()
+            for i in range(len(catalog) - 1, -1, -1):
+                t = catalog[i]["time"]
+                if now - t > max_age:
+                    continue
+                key = i if bucket == 0 else int(t // bucket)
+                if key not in seen:
+                    seen.add(key)
+                    keep.add(i)
+
+        if len(keep) < len(catalog):
+            kept = []
+            carry = None  # dropped snapshots waiting to be folded into the next kept one
+            for i, entry in enumerate(catalog):
+                if i not in keep:
+                    snapshot = self._load(entry)
+                    carry = snapshot if carry is None else _combine(carry, snapshot)
+                    continue
+                if carry is not None:
+                    kind, data = _combine(carry, self._load(entry))
+                    entry = dict(entry, kind=kind, object=self._store(serializer.dumps_bytes(data)))
+                    carry = None
+                kept.append(entry)
+            catalog[:] = kept
+
+        used = {entry["object"] for entry in catalog}
+        objects = os.path.join(self.folder, "objects")
+        if os.path.isdir(objects):
+            for filename in os.listdir(objects):
+                if filename.endswith(".json") and filename[:-5] not in used:
+                    os.remove(os.path.join(objects, filename))
+
+    # Restore
+
+    def restore(self, when=None):
+        """Return the { name: { subject: [grades] } } data as of the newest snapshot taken at or before `when`."""
+        with self._lock:
+            catalog = self.entries()
+            until = float("inf") if when is None else parse_time(when)
+            last = None
+            for i, entry in enumerate(catalog):
+                if entry["time"] <= until:
+                    last = i
+            if last is None:
+                raise ValueError(f"No backup was taken at or before {when}.")
+            first = last
+            while catalog[first]["kind"] != "full":
+                first -= 1
+            snapshot = self._load(catalog[first])
+            for entry in catalog[first + 1:last + 1]:
+                snapshot = _combine(snapshot, self._load(entry))
+            return snapshot[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List student data backups or restore one to a file.")
+    parser.add_argument("--folder", default="backups", help="backup folder")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list retained snapshots")
+    restore = commands.add_parser("restore", help="write the data as of a point in time to a file")
+    restore.add_argument("when", help="ISO time (e.g. 2025-10-09T08:53) or Unix timestamp")
+    restore.add_argument("--output", default="students_restored.json", help="file to write")
+    args = parser.parse_args()
+
+    store = BackupStore(args.folder)
+    if args.command == "list":
+        for entry in store.entries():
+            size = os.path.getsize(store._object_path(entry["object"]))
+            print(f"{entry['taken']}  {entry['kind']:<5}  {size:>10} bytes  {entry['object'][:12]}")
+    else:
+        data = store.restore(args.when)
+        with open(args.output, "wb") as f:
+            f.write(serializer.dumps_bytes(data))
+        print(f"Restored {len(data)} students to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
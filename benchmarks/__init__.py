@@ -0,0 +1,2 @@
+# Benchmarks for the grading system.
+# Run one with `python -m benchmarks.<name>` from the project root.
@@ -0,0 +1,62 @@
+import argparse
+import contextlib
+import io
+import time
+
+import columnar
+import firstProj
+from benchmarks import roster as rosters
+
+
+# Compare the pure-Python class-wide computations with the columnar numpy backend.
+# GRADING_BACKEND=numpy uses the columns only at load time, so python_rebuild_s against
+# numpy_build_s is the comparison the app sees; the rest set full scans (scanRankings and
+# friends) against the same group-bys done on a columnar copy.
+
+
+def _roster(total_grades, subjects=8, per_subject=5):
+    return rosters.generate(max(1, total_grades // (subjects * per_subject)), subjects, per_subject)
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn()
+    return round(time.perf_counter() - start, 3), result
+
+
+def run(total_grades):
+    roster = _roster(total_grades)
+    subjects = sorted({s for record in roster.values() for s in record})
+    firstProj.GRADE_BACKEND = "python"
+    firstProj.reset_students(roster)
+
+    result = {"grades": total_grades, "students": len(roster)}
+    result["python_rebuild_s"], _ = _timed(firstProj.rebuild_aggregates)
+    result["python_rankings_s"], _ = _timed(firstProj.scanRankings)
+    result["python_subject_averages_s"], _ = _timed(
+        lambda: [firstProj.scanSubjectAverage(s) for s in subjects])
+    result["python_letters_s"], _ = _timed(
+        lambda: [firstProj.letter_grade(r["average"]) for r in firstProj.scanRankings()["rankings"]])
+
+    result["numpy_build_s"], columns = _timed(lambda: columnar.ColumnarGrades.from_students(roster))
+    result["numpy_rankings_s"], _ = _timed(columns.rankings)
+    result["numpy_subject_averages_s"], _ = _timed(columns.subject_averages)
+    result["numpy_letters_s"], _ = _timed(
+        lambda: columnar.letter_counts(list(columns.student_averages().values())))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the columnar grade backend against pure Python.")
+    parser.add_argument("--grades", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    args = parser.parse_args()
+    if not columnar.available():
+        print("numpy is not installed; nothing to compare.")
+        return
+    for total in args.grades:
+        print(run(total))
+
+
+if __name__ == "__main__":
+    main()
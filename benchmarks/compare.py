@@ -0,0 +1,82 @@
+import argparse
+import json
+import sys
+
+
+# Compare two result files from core.py or load.py, case by case:
+#   python -m benchmarks.compare baseline.json candidate.json --threshold 10
+# A case regresses when a latency percentile grows, or its throughput drops, by more
+# than `threshold` percent. Exits with status 1 when any case regressed, so it can gate a CI job.
+
+LATENCIES = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def _change(old, new):
+    """Percent change from old to new, or None when either side is missing or zero."""
+    if not old or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(baseline, candidate, threshold=10.0):
+    """Return one row per case found in both result documents."""
+    rows = []
+    old_results, new_results = baseline["results"], candidate["results"]
+    for case in old_results:
+        if case not in new_results:
+            continue
+        old, new = old_results[case], new_results[case]
+        changes = {key: _change(old.get(key), new.get(key)) for key in LATENCIES + ("ops_per_sec",)}
+        regressed = [key for key in LATENCIES if changes[key] is not None and changes[key] > threshold]
+        if changes["ops_per_sec"] is not None and changes["ops_per_sec"] < -threshold:
+            regressed.append("ops_per_sec")
+        rows.append({"case": case, "old": old, "new": new, "changes": changes, "regressed": regressed})
+    return rows
+
+
+def _format(rows):
+    def cell(row, key):
+        change = row["changes"][key]
+        value = row["new"].get(key)
+        if change is None:
+            return f"{value}"
+        return f"{value} ({change:+.0f}%)"
+
+    header = ["case", "p50_ms", "p95_ms", "p99_ms", "ops_per_sec", ""]
+    table = [header]
+    for row in rows:
+        table.append([row["case"]] + [cell(row, key) for key in header[1:5]]
+                     + ["REGRESSED " + ",".join(row["regressed"]) if row["regressed"] else ""])
+    widths = [max(len(line[i]) for line in table) for i in range(len(header))]
+    return "\n".join("  ".join(value.ljust(width) for value, width in zip(line, widths)).rstrip() for line in table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    with open(args.candidate, "r") as f:
+        candidate = json.load(f)
+    if baseline.get("suite") != candidate.get("suite"):
+        print(f"Suites differ: {baseline.get('suite')} and {candidate.get('suite')}", file=sys.stderr)
+    if baseline.get("params") != candidate.get("params"):
+        print("Parameters differ, so the numbers may not be comparable:", file=sys.stderr)
+        print(f"  baseline:  {baseline.get('params')}", file=sys.stderr)
+        print(f"  candidate: {candidate.get('params')}", file=sys.stderr)
+
+    rows = compare(baseline, candidate, args.threshold)
+    print(_format(rows))
+    regressed = [row["case"] for row in rows if row["regressed"]]
+    if regressed:
+        print(f"\n{len(regressed)} of {len(rows)} cases regressed by more than {args.threshold:g}%")
+        sys.exit(1)
+    print(f"\nNo case regressed by more than {args.threshold:g}%")
+
+
+if __name__ == "__main__":
+    main()
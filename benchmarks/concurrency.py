@@ -0,0 +1,87 @@
+import argparse
+import contextlib
+import io
+import threading
+import time
+
+import firstProj
+import serializer
+
+
+# Stress the store with concurrent writers and readers and check that no update is lost.
+# Writers add and remove grades; readers serialize whole-roster snapshots, page the
+# rankings and build reports the way the /students, /rankings and /students/<name> routes do.
+
+
+def run(writers=8, readers=4, ops=2000, roster=200):
+    firstProj.PERSISTENCE_MODE = "rewrite"
+    firstProj.reset_students({})
+    stop = threading.Event()
+    errors = []
+    reads = [0]
+
+    def writer(index):
+        # Each writer owns one subject, so its final grade count is known exactly
+        subject = f"Subject {index}"
+        for i in range(ops):
+            name = f"Student {i % roster}"
+            grade = i % 101
+            firstProj.setGrade(name, subject, [grade, 100 - grade])
+            if i % 2:
+                firstProj.removeGrade(name, subject, grade)
+                firstProj.removeGrade(name, subject, 100 - grade)
+
+    def reader(index):
+        i = index
+        while not stop.is_set():
+            try:
+                serializer.dumps(firstProj.snapshot_students())
+                firstProj.getRankings(limit=10)
+                # A report's averages must match the grades it lists
+                report = firstProj.getStudentReport(f"Student {i % roster}")
+                for info in report.get("subjects", {}).values():
+                    if abs(sum(info["grades"]) / len(info["grades"]) - info["average"]) > 1e-9:
+                        raise AssertionError("report mixes two versions of a record")
+                reads[0] += 1
+                i += 1
+            except Exception as e:
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in threads:
+            t.start()
+        for t in threads[:writers]:
+            t.join()
+        stop.set()
+        for t in threads[writers:]:
+            t.join()
+    elapsed = time.perf_counter() - start
+
+    expected = writers * 2 * ((ops + 1) // 2)
+    actual = sum(len(grades) for record in firstProj.students.values() for grades in record.values())
+    assert not errors, errors
+    assert actual == expected, f"lost updates: expected {expected} grades, found {actual}"
+    for name in firstProj.students:
+        assert firstProj.getStudentReport(name) == firstProj.scanStudentReport(name), name
+    assert firstProj.getRankings()["rankings"] == firstProj.scanRankings()["rankings"]
+
+    return {"writers": writers, "readers": readers, "grades": actual,
+            "reads": reads[0], "seconds": round(elapsed, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress the student store with concurrent threads.")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=2000, help="grade changes per writer")
+    parser.add_argument("--students", type=int, default=200)
+    args = parser.parse_args()
+    print(run(args.writers, args.readers, args.ops, args.students))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import os
+import random
+import tempfile
+
+import firstProj
+from benchmarks import harness
+from benchmarks import roster as rosters
+
+
+# Micro-benchmarks of the firstProj core functions on a synthetic roster.
+# Each case is timed call by call; arguments are picked before the clock starts.
+# Cases that touch the whole roster (reports, save/load, rebuilds) run `heavy` times,
+# the rest `repeat` times. Runs in a scratch directory, so save_data/load_data
+# never touch the real data file.
+
+
+def _cases(names, subjects, rng, import_rows):
+    students = firstProj.students
+
+    def existing_grade(i):
+        while True:
+            name = rng.choice(names)
+            record = students.get(name)
+            if record:
+                subject = rng.choice(list(record))
+                if len(record[subject]):
+                    return name, subject, record[subject][0]
+
+    def import_lines(i):
+        lines = ["name,subject,grade"]
+        lines += [f"{rng.choice(names)},{rng.choice(subjects)},{rng.randint(0, 100)}" for _ in range(import_rows)]
+        return (lines,)
+
+    # name: (function, prepare(i) -> args, heavy)
+    return {
+        "addStudent": (firstProj.addStudent, lambda i: (f"Added Student {i}",), False),
+        "setGrade": (firstProj.setGrade,
+                     lambda i: (rng.choice(names), rng.choice(subjects), rng.randint(0, 100)), False),
+        "setGrade_list": (firstProj.setGrade,
+                          lambda i: (rng.choice(names), rng.choice(subjects), [rng.randint(0, 100)] * 5), False),
+        "removeGrade": (firstProj.removeGrade, existing_grade, False),
+        "getStudentReport": (firstProj.getStudentReport, lambda i: (rng.choice(names),), False),
+        "searchStudent": (firstProj.searchStudent, lambda i: (rng.choice(names),), False),
+        "getSubjectAverage": (firstProj.getSubjectAverage, lambda i: (rng.choice(subjects),), False),
+        "getRankings_top10": (lambda: firstProj.getRankings(limit=10), lambda i: (), False),
+        "getRankings_page": (lambda offset: firstProj.getRankings(limit=50, offset=offset),
+                             lambda i: (rng.randrange(len(names)),), False),
+        "getRankings_around": (lambda name: firstProj.getRankings(limit=5, around=name),
+                               lambda i: (rng.choice(names),), False),
+        "getRankings_all": (firstProj.getRankings, lambda i: (), True),
+        "iterStudentReports": (lambda: sum(1 for _ in firstProj.iterStudentReports()), lambda i: (), True),
+        "iterStudentReports_subject": (lambda s: sum(1 for _ in firstProj.iterStudentReports(subject=s)),
+                                       lambda i: (rng.choice(subjects),), True),
+        "importGrades": (firstProj.importGrades, import_lines, True),
+        "removeStudents": (firstProj.removeStudents, lambda i: ([f"Added Student {i}"],), False),
+        "rebuild_aggregates": (firstProj.rebuild_aggregates, lambda i: (), True),
+        "save_data": (lambda: firstProj.save_data(firstProj.students, create_backup=False), lambda i: (), True),
+        "load_data": (firstProj.load_data, lambda i: (), True),
+        "scanRankings": (firstProj.scanRankings, lambda i: (), True),
+    }
+
+
+def run(students=10_000, subjects=6, per_subject=4, repeat=1000, heavy=10, only=None, import_rows=1000):
+    roster = rosters.generate(students, subjects, per_subject)
+    names = list(roster)
+    subject_list = rosters.subject_names(subjects)
+    rng = random.Random(1)
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            with harness.quiet():
+                firstProj.reset_students(roster)
+                firstProj.save_data(firstProj.students, create_backup=False)
+                for case, (fn, prepare, is_heavy) in _cases(names, subject_list, rng, import_rows).items():
+                    if only and case not in only:
+                        continue
+                    samples = harness.time_calls(fn, prepare, heavy if is_heavy else repeat)
+                    results[case] = harness.summarize(samples)
+                if firstProj._save_worker is not None:
+                    firstProj._save_worker.stop()
+                    firstProj._save_worker = None
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark the firstProj core functions.")
+    parser.add_argument("--students", type=int, default=10_000)
+    parser.add_argument("--subjects", type=int, default=6)
+    parser.add_argument("--grades", type=int, default=4, help="grades per subject")
+    parser.add_argument("--repeat", type=int, default=1000, help="calls per light case")
+    parser.add_argument("--heavy", type=int, default=10, help="calls per whole-roster case")
+    parser.add_argument("--only", nargs="+", help="run only these cases")
+    parser.add_argument("--output", default="-", help="result file (default: print)")
+    args = parser.parse_args()
+
+    params = {"students": args.students, "subjects": args.subjects, "grades_per_subject": args.grades,
+              "repeat": args.repeat, "heavy": args.heavy}
+    results = run(args.students, args.subjects, args.grades, args.repeat, args.heavy, args.only)
+    harness.write_results(args.output, "core", params, results)
+
+
+if __name__ == "__main__":
+    main()
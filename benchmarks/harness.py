@@ -0,0 +1,82 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from writer import latency_percentiles
+
+
+# Timing and result files shared by the benchmark suites (core.py, load.py).
+# A result file looks like:
+#   {"suite": "core", "taken": "...", "environment": {...}, "params": {...},
+#    "results": {"<case>": {"count": ..., "ops_per_sec": ..., "p50_ms": ..., "p95_ms": ..., "p99_ms": ...}}}
+# and two of them can be compared with `python -m benchmarks.compare`.
+
+
+@contextlib.contextmanager
+def quiet():
+    """Swallow the progress messages printed by firstProj."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def summarize(samples, elapsed=None):
+    """Return count, throughput and p50/p95/p99 for a list of durations in seconds."""
+    elapsed = sum(samples) if elapsed is None else elapsed
+    result = {
+        "count": len(samples),
+        "ops_per_sec": round(len(samples) / elapsed, 1) if elapsed else None,
+    }
+    result.update(latency_percentiles(samples))
+    return result
+
+
+def time_calls(fn, prepare, repeat):
+    """Call fn(*prepare(i)) `repeat` times and return the durations, not counting prepare."""
+    samples = []
+    for i in range(repeat):
+        args = prepare(i)
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def environment():
+    """Describe the interpreter, machine, settings and code revision a result came from."""
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                  text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        revision = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "revision": revision,
+        "settings": {key: value for key, value in sorted(os.environ.items()) if key.startswith("GRADING_")},
+    }
+
+
+def write_results(path, suite, params, results):
+    """Write a result file (or print it when `path` is "-") and return the document."""
+    document = {
+        "suite": suite,
+        "taken": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "params": params,
+        "results": results,
+    }
+    text = json.dumps(document, indent=2)
+    if path == "-":
+        print(text)
+    else:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {path}", file=sys.stderr)
+    return document
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+from benchmarks import harness
+from benchmarks import roster as rosters
+
+
+# In-process load driver: replays a mixed read/write workload against app.py
+# through Flask's test client, so it measures the routes without a network.
+# A workload is a JSON Lines file with one request per line:
+#   {"route": "GET /students/<name>", "method": "GET", "path": "/students/Student%2042"}
+#   {"route": "POST /grades", "method": "POST", "path": "/grades", "json": {...}}
+# `route` groups requests in the results. Workloads are generated from MIX, and can
+# be saved with --record and replayed with --replay so versions see the same requests.
+
+# route: share of the generated requests
+MIX = {
+    "GET /rankings": 0.25,
+    "GET /students/<name>": 0.25,
+    "GET /search/<name>": 0.05,
+    "GET /subjects/<subject>/average": 0.10,
+    "GET /rankings?around": 0.05,
+    "GET /reports?subject": 0.005,
+    "POST /grades": 0.20,
+    "DELETE /grades": 0.04,
+    "POST /students": 0.04,
+    "DELETE /students/<name>": 0.015,
+}
+
+
+def generate_workload(requests, students, subjects, seed=0, mix=None):
+    """Return a list of request dicts drawn from `mix` (MIX by default)."""
+    rng = random.Random(seed)
+    mix = MIX if mix is None else mix
+    routes, weights = list(mix), list(mix.values())
+    subject_list = rosters.subject_names(subjects)
+    added = []
+    workload = []
+
+    def student():
+        return quote(f"Student {rng.randrange(students)}")
+
+    for i in range(requests):
+        route = rng.choices(routes, weights)[0]
+        if route == "GET /rankings":
+            request = {"method": "GET", "path": "/rankings?limit=10"}
+        elif route == "GET /rankings?around":
+            request = {"method": "GET", "path": f"/rankings?limit=5&around={student()}"}
+        elif route == "GET /students/<name>":
+            request = {"method": "GET", "path": f"/students/{student()}"}
+        elif route == "GET /search/<name>":
+            request = {"method": "GET", "path": f"/search/{student()}"}
+        elif route == "GET /subjects/<subject>/average":
+            request = {"method": "GET", "path": f"/subjects/{quote(rng.choice(subject_list))}/average"}
+        elif route == "GET /reports?subject":
+            request = {"method": "GET", "path": f"/reports?subject={quote(rng.choice(subject_list))}&min_average=90"}
+        elif route == "POST /grades":
+            request = {"method": "POST", "path": "/grades",
+                       "json": {"name": f"Student {rng.randrange(students)}", "subject": rng.choice(subject_list),
+                                "grades": [rng.randint(0, 100)]}}
+        elif route == "DELETE /grades":
+            # May miss a grade that is not there; the route answers the same way either way
+            request = {"method": "DELETE", "path": "/grades",
+                       "json": {"name": f"Student {rng.randrange(students)}", "subject": rng.choice(subject_list),
+                                "grade": rng.randint(0, 100)}}
+        elif route == "POST /students":
+            name = f"Load Student {i}"
+            added.append(name)
+            request = {"method": "POST", "path": "/students", "json": {"name": name}}
+        elif route == "DELETE /students/<name>":
+            name = added.pop(rng.randrange(len(added))) if added else f"Student {rng.randrange(students)}"
+            request = {"method": "DELETE", "path": f"/students/{quote(name)}"}
+        else:
+            raise ValueError(f"Unknown route in mix: {route}")
+        request["route"] = route
+        workload.append(request)
+    return workload
+
+
+def read_workload(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_workload(path, workload):
+    with open(path, "w") as f:
+        for request in workload:
+            f.write(json.dumps(request) + "\n")
+
+
+def _drive(client, requests, samples, statuses, lock):
+    mine, codes = {}, {}
+    for request in requests:
+        route = request.get("route") or f"{request['method']} {request['path']}"
+        start = time.perf_counter()
+        response = client.open(request["path"], method=request["method"], json=request.get("json"))
+        response.get_data()
+        elapsed = time.perf_counter() - start
+        response.close()
+        mine.setdefault(route, []).append(elapsed)
+        codes[response.status_code] = codes.get(response.status_code, 0) + 1
+    with lock:
+        for route, durations in mine.items():
+            samples.setdefault(route, []).extend(durations)
+        for code, count in codes.items():
+            statuses[code] = statuses.get(code, 0) + count
+
+
+def run(workload, students=10_000, subjects=6, per_subject=4, threads=1):
+    """Serve `workload` from a fresh app on a synthetic roster; return the results by route."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            rosters.write_json("students_data.json", students, subjects, per_subject)
+            with harness.quiet():
+                import app  # loads the data file from the current directory
+                import firstProj
+                firstProj.reset_students(firstProj.load_data())
+                app.response_cache.clear()
+
+                samples, statuses, lock = {}, {}, threading.Lock()
+                workers = [
+                    threading.Thread(target=_drive,
+                                     args=(app.app.test_client(), workload[i::threads], samples, statuses, lock))
+                    for i in range(threads)
+                ]
+                start = time.perf_counter()
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                elapsed = time.perf_counter() - start
+                if firstProj._save_worker is not None:
+                    firstProj._save_worker.flush()
+        finally:
+            os.chdir(cwd)
+
+    results = {"all": harness.summarize([s for durations in samples.values() for s in durations], elapsed)}
+    for route in sorted(samples):
+        results[route] = harness.summarize(samples[route])
+    results["all"]["statuses"] = {str(code): count for code, count in sorted(statuses.items())}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a mixed workload against the Flask routes in-process.")
+    parser.add_argument("--students", type=int, default=10_000)
+    parser.add_argument("--subjects", type=int, default=6)
+    parser.add_argument("--grades", type=int, default=4, help="grades per subject")
+    parser.add_argument("--requests", type=int, default=5000, help="requests to generate")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", help="workload file to replay instead of generating one")
+    parser.add_argument("--record", help="also save the generated workload to this file")
+    parser.add_argument("--output", default="-", help="result file (default: print)")
+    args = parser.parse_args()
+
+    if args.replay:
+        workload = read_workload(args.replay)
+    else:
+        workload = generate_workload(args.requests, args.students, args.subjects, args.seed)
+        if args.record:
+            write_workload(args.record, workload)
+
+    params = {"students": args.students, "subjects": args.subjects, "grades_per_subject": args.grades,
+              "requests": len(workload), "threads": args.threads, "replay": args.replay, "seed": args.seed}
+    results = run(workload, args.students, args.subjects, args.grades, args.threads)
+    harness.write_results(args.output, "load", params, results)
+
+
+if __name__ == "__main__":
+    main()
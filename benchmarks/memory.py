@@ -0,0 +1,55 @@
+import argparse
+import gc
+import io
+import json
+import tracemalloc
+
+import records
+from benchmarks import roster as rosters
+
+
+# Compare the memory held by a roster loaded as plain dicts of lists with the same
+# roster loaded into StudentRecords (see records.py), using tracemalloc.
+
+
+def _roster_json(students, subjects, per_subject):
+    return json.dumps(rosters.generate(students, subjects, per_subject, decimals=True))
+
+
+def _measure(load, text):
+    gc.collect()
+    tracemalloc.start()
+    data = load(text)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return current, peak
+
+
+def run(students=100_000, subjects=6, per_subject=4):
+    text = _roster_json(students, subjects, per_subject)
+    dict_current, dict_peak = _measure(json.loads, text)
+    record_current, record_peak = _measure(lambda t: records.load_json(io.StringIO(t)), text)
+    mb = 1024 * 1024
+    return {
+        "students": students,
+        "grades": students * subjects * per_subject,
+        "dict_mb": round(dict_current / mb, 1),
+        "dict_peak_mb": round(dict_peak / mb, 1),
+        "record_mb": round(record_current / mb, 1),
+        "record_peak_mb": round(record_peak / mb, 1),
+        "reduction": round(dict_current / record_current, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure roster memory with and without StudentRecords.")
+    parser.add_argument("--students", type=int, default=100_000)
+    parser.add_argument("--subjects", type=int, default=6)
+    parser.add_argument("--grades", type=int, default=4, help="grades per subject")
+    args = parser.parse_args()
+    print(run(args.students, args.subjects, args.grades))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+
+import firstProj
+from writer import latency_percentiles
+
+
+# Compare save_data latency for "rewrite" and "batched" persistence under concurrent writers.
+
+
+def _run(mode, wait, threads, per_thread, roster):
+    firstProj.PERSISTENCE_MODE = mode
+    firstProj.SAVE_WAIT = wait
+    firstProj.reset_students({f"Student {i}": {"Math": [70]} for i in range(roster)})
+    firstProj._write_data_file(firstProj.students, create_backup=False)
+
+    samples = []
+    samples_lock = threading.Lock()
+
+    def writer(seed):
+        rng = random.Random(seed)
+        mine = []
+        for _ in range(per_thread):
+            name = f"Student {rng.randrange(roster)}"
+            start = time.perf_counter()
+            firstProj.setGrade(name, "Math", rng.randint(0, 100))
+            firstProj.save_data(firstProj.students, create_backup=False)
+            mine.append(time.perf_counter() - start)
+        with samples_lock:
+            samples.extend(mine)
+
+    workers = [threading.Thread(target=writer, args=(seed,)) for seed in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    result = {"mode": mode, "wait": wait, "requests": len(samples),
+              "requests_per_sec": round(len(samples) / elapsed, 1)}
+    result.update(latency_percentiles(samples))
+    if firstProj._save_worker is not None:
+        firstProj._save_worker.flush()
+        result["durability"] = firstProj._save_worker.stats()
+        firstProj._save_worker.stop()
+        firstProj._save_worker = None
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare save_data latency across persistence modes.")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50, help="requests per thread")
+    parser.add_argument("--students", type=int, default=5000)
+    args = parser.parse_args()
+
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for mode, wait in (("rewrite", True), ("batched", True), ("batched", False)):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = _run(mode, wait, args.threads, args.requests, args.students)
+                results.append(result)
+                print(result)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+if __name__ == "__main__":
+    main()
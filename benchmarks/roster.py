@@ -0,0 +1,46 @@
+import random
+
+import serializer
+
+
+# Synthetic rosters shared by the benchmarks: students "Student 0".."Student <n-1>",
+# each taking every one of subjects "Subject 0".."Subject <m-1>" with the same
+# number of grades. The same arguments always give the same roster.
+
+
+def subject_names(subjects):
+    return [f"Subject {j}" for j in range(subjects)]
+
+
+def iter_students(students, subjects=6, per_subject=4, seed=0, decimals=False):
+    """Yield (name, { subject: [grades] }) pairs.
+
+    Grades are whole numbers from 0 to 100; with `decimals`, about half of them
+    have one decimal place instead.
+    """
+    rng = random.Random(seed)
+    names = subject_names(subjects)
+    if decimals:
+        def grade():
+            return rng.choice((rng.randint(0, 100), round(rng.uniform(0, 100), 1)))
+    else:
+        def grade():
+            return rng.randint(0, 100)
+    for i in range(students):
+        yield f"Student {i}", {s: [grade() for _ in range(per_subject)] for s in names}
+
+
+def generate(students, subjects=6, per_subject=4, seed=0, decimals=False):
+    """Return a { name: { subject: [grades] } } roster; see iter_students."""
+    return dict(iter_students(students, subjects, per_subject, seed, decimals))
+
+
+def write_json(path, students, subjects=6, per_subject=4, seed=0, decimals=False):
+    """Write a roster as a data file without holding it all in memory."""
+    with open(path, "wb") as f:
+        f.write(b"{")
+        for i, (name, record) in enumerate(iter_students(students, subjects, per_subject, seed, decimals)):
+            if i:
+                f.write(b",")
+            f.write(serializer.dumps_bytes(name) + b":" + serializer.dumps_bytes(record))
+        f.write(b"}")
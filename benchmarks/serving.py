@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import roster as rosters
+from writer import latency_percentiles
+
+
+# Throughput of the sync server (app.py on the threaded Werkzeug server) and the
+# async serving mode (asgi.py) under many concurrent keep-alive clients polling
+# GET /rankings, like the dashboard in static/app.js, while a share of the
+# requests post grades. Each server runs in its own process in a scratch directory.
+#   sync          - app.py as it is, every change rewrites the data file
+#   sync_batched  - app.py with GRADING_PERSISTENCE=batched
+#   async         - asgi.py, batched writes with responses sent once written
+#   workers       - workers.py, `--workers` processes sharing the SQLite store (GRADING_SHARED=1)
+
+_SYNC_SERVER = """
+import logging, sys
+from werkzeug.serving import WSGIRequestHandler
+logging.getLogger("werkzeug").setLevel(logging.ERROR)
+WSGIRequestHandler.protocol_version = "HTTP/1.1"  # keep-alive, like the async server
+import app
+app.app.run(port=int(sys.argv[1]), threaded=True)
+"""
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(kind, workdir, port, workers=1):
+    root = os.getcwd()
+    env = dict(os.environ, GRADING_STORAGE="json", GRADING_LOAD="eager")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    if kind == "async":
+        command = [sys.executable, os.path.join(root, "asgi.py"), "--port", str(port)]
+    elif kind == "workers":
+        command = [sys.executable, os.path.join(root, "workers.py"), "--port", str(port), "--workers", str(workers)]
+    else:
+        env["GRADING_PERSISTENCE"] = "batched" if kind == "sync_batched" else "rewrite"
+        command = [sys.executable, "-c", _SYNC_SERVER, str(port)]
+    process = subprocess.Popen(command, cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            # A full response, not just a connection: workers.py listens before its workers are up
+            with socket.create_connection(("127.0.0.1", port), timeout=5) as probe:
+                probe.sendall(b"GET /rankings?limit=1 HTTP/1.0\r\n\r\n")
+                if not probe.recv(1):
+                    raise ConnectionError
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+async def _read_response(reader):
+    """Read one HTTP/1.1 response; return (status, keep_alive)."""
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip().lower()
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get("connection") != "close"
+
+
+async def _client(port, deadline, write_share, students, seed, latencies, statuses):
+    rng = random.Random(seed)
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        if rng.random() < write_share:
+            body = json.dumps({"name": f"Student {rng.randrange(students)}", "subject": "Subject 0",
+                               "grades": rng.randint(0, 100)}).encode()
+            request = (b"POST /grades HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                       b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+        else:
+            request = b"GET /rankings?limit=10 HTTP/1.1\r\nHost: bench\r\n\r\n"
+        start = time.perf_counter()
+        try:
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await _read_response(reader)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            statuses["error"] = statuses.get("error", 0) + 1
+            writer.close()
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _load(port, clients, seconds, write_share, students):
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(
+        _client(port, deadline, write_share, students, i, latencies, statuses) for i in range(clients)
+    ))
+    return latencies, statuses
+
+
+def run(kind, clients, seconds=10, write_share=0.05, students=10_000, workers=1):
+    with tempfile.TemporaryDirectory() as workdir:
+        rosters.write_json(os.path.join(workdir, "students_data.json"), students)
+        port = _free_port()
+        process = _start_server(kind, workdir, port, workers)
+        try:
+            latencies, statuses = asyncio.run(_load(port, clients, seconds, write_share, students))
+        finally:
+            process.terminate()
+            process.wait()
+    result = {
+        "server": kind if kind != "workers" else f"workers x{workers}",
+        "clients": clients,
+        "requests": len(latencies),
+        "requests_per_sec": round(len(latencies) / seconds, 1),
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+    result.update(latency_percentiles(latencies))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sync and async serving throughput.")
+    parser.add_argument("--servers", nargs="+", default=["sync", "sync_batched", "async"])
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-share", type=float, default=0.05)
+    parser.add_argument("--students", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes for the workers server")
+    args = parser.parse_args()
+
+    # Every client holds a socket, on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = max(args.clients) * 2 + 256
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+    for clients in args.clients:
+        for kind in args.servers:
+            print(run(kind, clients, args.seconds, args.write_share, args.students, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks import roster as rosters
+
+
+# Time from process start to the first answered GET /students/<name>, with the
+# data file loaded eagerly, lazily (see lazyload.py) and from a snapshot (see
+# snapshot.py). Each measurement runs in a fresh interpreter inside a scratch
+# directory holding only the data file.
+#   eager             - the whole file is parsed before the app starts
+#   lazy_index        - first lazy start: the file is read once and an index written
+#   lazy              - later lazy starts: only the index is read
+#   snapshot_convert  - first snapshot start: the file is read once and a snapshot written
+#   snapshot          - later snapshot starts: the snapshot is memory-mapped
+
+_FIRST_REQUEST = """
+import time
+start = time.perf_counter()
+import contextlib, io, json, resource, sys
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+    response = app.app.test_client().get("/students/" + sys.argv[1])
+elapsed = time.perf_counter() - start
+assert response.status_code == 200, response.status_code
+print(json.dumps({"seconds": round(elapsed, 3),
+                  "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}))
+"""
+
+
+def _first_request(workdir, load_mode, name):
+    env = dict(os.environ, GRADING_LOAD=load_mode, GRADING_PERSISTENCE="rewrite", GRADING_STORAGE="json")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+    output = subprocess.run([sys.executable, "-c", _FIRST_REQUEST, name], cwd=workdir, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(students):
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "students_data.json")
+        rosters.write_json(path, students)
+        name = f"Student {students // 2}"
+        result = {"students": students, "file_mb": round(os.path.getsize(path) / 2**20, 1)}
+        result["eager"] = _first_request(workdir, "eager", name)
+        result["lazy_index"] = _first_request(workdir, "lazy", name)
+        result["lazy"] = _first_request(workdir, "lazy", name)
+        result["snapshot_convert"] = _first_request(workdir, "snapshot", name)
+        result["snapshot"] = _first_request(workdir, "snapshot", name)
+        result["speedup"] = round(result["eager"]["seconds"] / result["lazy"]["seconds"], 1)
+        result["snapshot_speedup"] = round(result["eager"]["seconds"] / result["snapshot"]["seconds"], 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time-to-first-request for eager, lazy and snapshot loading.")
+    parser.add_argument("--students", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+    for students in args.students:
+        print(run(students))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import threading
+from collections import OrderedDict
+
+# Bounded LRU cache whose entries are tagged with a version stamp.
+# A lookup passes the current stamp for the key (see firstProj.data_version,
+# student_version and subject_version); an entry built under a different stamp
+# is treated as a miss and rebuilt, so changes invalidate only what they touch.
+
+
+class VersionedCache:
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> (stamp, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, stamp, compute):
+        """Return the cached value for key if it was built under `stamp`, else compute() it."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Computed outside the lock; the stamp was read first, so the value is never older than it
+        value = compute()
+        with self._lock:
+            self._entries[key] = (stamp, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,304 @@
+import json
+import os
+import re
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime
+
+import serializer
+
+# Class and term shards, kept apart from the main roster (see firstProj.CLASSES_FOLDER).
+# Each shard holds the students of one class in one term, and is loaded, changed and
+# written on its own, so work on one class never reads or rewrites another's grades.
+#   <folder>/index.json        { "classes": { id: { "class", "term", "frozen", "students" } },
+#                                "students": { name: [ids] } } - which shards hold a student
+#   <folder>/<id>.json         a live shard, { name: { subject: [grades] } } like FILENAME
+#   <folder>/<id>.frozen.json  a closed term: the records with every average and the
+#                              ranking computed once; frozen shards cannot change
+# Live shards are loaded on first use and keep running totals like firstProj's aggregates.
+# Shards belong to one process: GRADING_SHARED workers share only the main roster.
+
+# No dots, and not "index" in any case, so no id's files can be another's or the index
+CLASS_ID = re.compile(r"(?!(?i:index)\Z)[A-Za-z0-9][A-Za-z0-9_-]{0,63}")
+
+
+def _write_json(path, data):
+    payload = serializer.dumps_bytes(data)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(payload)
+
+
+def _ranked(averages):
+    """(-average, name) keys for every student with an average, best first."""
+    return sorted((-avg, name) for name, avg in averages.items())
+
+
+class Shard:
+    """The students of one live class, with running totals for its reads."""
+
+    frozen = False
+
+    def __init__(self, class_id, records=None):
+        self.id = class_id
+        self.lock = threading.RLock()
+        self.students = {}        # { name: { subject: [grades] } }
+        self.student_totals = {}  # { name: (sum, count) }
+        self.subject_totals = {}  # { subject: (sum, count) }
+        for name, record in (records or {}).items():
+            self.students[name] = {subject: list(grades) for subject, grades in record.items()}
+            for subject, grades in record.items():
+                self._track(name, subject, grades)
+        self.rank_index = _ranked({name: self.average(name) for name in self.student_totals})
+        self.rank_keys = {key[1]: key for key in self.rank_index}
+
+    def _track(self, name, subject, grades, sign=1):
+        grades = [g for g in grades if isinstance(g, (int, float))]
+        if not grades:
+            return
+        for table, key in ((self.student_totals, name), (self.subject_totals, subject)):
+            total, count = table.get(key, (0, 0))
+            total, count = total + sign * sum(grades), count + sign * len(grades)
+            if count <= 0:
+                table.pop(key, None)
+            else:
+                table[key] = (total, count)
+
+    def _update_rank(self, name):
+        old_key = self.rank_keys.pop(name, None)
+        if old_key is not None:
+            del self.rank_index[bisect_left(self.rank_index, old_key)]
+        avg = self.average(name)
+        if avg is not None:
+            key = (-avg, name)
+            insort(self.rank_index, key)
+            self.rank_keys[name] = key
+
+    # Changes; the caller holds `lock` and saves the shard afterwards
+
+    def add_student(self, name):
+        if name in self.students:
+            return False
+        self.students[name] = {}
+        return True
+
+    def add_grades(self, name, subject, grades):
+        record = self.students.setdefault(name, {})
+        record.setdefault(subject, []).extend(grades)
+        self._track(name, subject, grades)
+        self._update_rank(name)
+
+    def remove_grade(self, name, subject, grade):
+        """Remove one grade; returns why it could not be removed, or None."""
+        record = self.students.get(name)
+        if record is None:
+            return f"Student '{name}' not found."
+        if subject not in record:
+            return f"{name} is not taking the subject '{subject}'."
+        if grade not in record[subject]:
+            return f"The grade {grade} does not exist in {subject} for {name}."
+        record[subject].remove(grade)
+        self._track(name, subject, [grade], sign=-1)
+        self._update_rank(name)
+        return None
+
+    def remove_student(self, name):
+        record = self.students.pop(name, None)
+        if record is None:
+            return False
+        for subject, grades in record.items():
+            self._track(name, subject, grades, sign=-1)
+        self._update_rank(name)
+        return True
+
+    # Reads
+
+    def record(self, name):
+        return self.students.get(name)
+
+    def average(self, name):
+        entry = self.student_totals.get(name)
+        return entry[0] / entry[1] if entry else None
+
+    def totals(self, name):
+        return self.student_totals.get(name)
+
+    def subject_average(self, subject):
+        entry = self.subject_totals.get(subject)
+        return entry[0] / entry[1] if entry else None
+
+    def ranking(self, offset=0, limit=None):
+        """Return (total, [(name, average)] for the page, rank of the page's first student)."""
+        total = len(self.rank_index)
+        end = total if limit is None else min(total, offset + limit)
+        page = [(name, -neg_avg) for neg_avg, name in self.rank_index[offset:end]]
+        rank = bisect_left(self.rank_index, (-page[0][1],)) + 1 if page else None
+        return total, page, rank
+
+    def frozen_data(self, info):
+        """Everything a FrozenShard needs, computed once from the current contents."""
+        return {
+            "class": info.get("class"),
+            "term": info.get("term"),
+            "frozen_at": datetime.now().isoformat(timespec="seconds"),
+            "students": self.students,
+            "student_totals": self.student_totals,
+            "subject_averages": {subject: self.subject_average(subject) for subject in self.subject_totals},
+            "ranking": [[name, -neg_avg] for neg_avg, name in self.rank_index],
+        }
+
+
+class FrozenShard:
+    """A closed class, read from its precomputed .frozen.json file."""
+
+    frozen = True
+
+    def __init__(self, class_id, data):
+        self.id = class_id
+        self.lock = threading.RLock()
+        self.students = data["students"]
+        self.student_totals = {name: tuple(entry) for name, entry in data["student_totals"].items()}
+        self.subject_averages = data["subject_averages"]
+        self._ranking = [tuple(entry) for entry in data["ranking"]]   # [(name, average)], best first
+        self._neg_averages = [-avg for _, avg in self._ranking]
+
+    def record(self, name):
+        return self.students.get(name)
+
+    def average(self, name):
+        entry = self.student_totals.get(name)
+        return entry[0] / entry[1] if entry else None
+
+    def totals(self, name):
+        return self.student_totals.get(name)
+
+    def subject_average(self, subject):
+        return self.subject_averages.get(subject)
+
+    def ranking(self, offset=0, limit=None):
+        total = len(self._ranking)
+        end = total if limit is None else min(total, offset + limit)
+        page = self._ranking[offset:end]
+        rank = bisect_left(self._neg_averages, -page[0][1]) + 1 if page else None
+        return total, page, rank
+
+
+class ClassStore:
+    def __init__(self, folder):
+        self.folder = folder
+        self._lock = threading.RLock()
+        self._index = None
+        self._shards = {}   # id -> Shard or FrozenShard, once loaded
+
+    def _path(self, class_id, frozen=False):
+        return os.path.join(self.folder, f"{class_id}.frozen.json" if frozen else f"{class_id}.json")
+
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                path = os.path.join(self.folder, "index.json")
+                if os.path.exists(path):
+                    with open(path, "r") as f:
+                        self._index = json.load(f)
+                else:
+                    self._index = {"classes": {}, "students": {}}
+            return self._index
+
+    def _save_index(self):
+        os.makedirs(self.folder, exist_ok=True)
+        return _write_json(os.path.join(self.folder, "index.json"), self._index)
+
+    def classes(self):
+        with self._lock:
+            return {class_id: dict(info) for class_id, info in self.index()["classes"].items()}
+
+    def info(self, class_id):
+        with self._lock:
+            info = self.index()["classes"].get(class_id)
+            return dict(info) if info is not None else None
+
+    def classes_of(self, name):
+        """Ids of the shards holding `name`, read from the index without loading any shard."""
+        with self._lock:
+            return list(self.index()["students"].get(name, ()))
+
+    def create(self, class_id, class_name=None, term=None):
+        """Add an empty shard; returns False if `class_id` is taken."""
+        if not CLASS_ID.fullmatch(class_id):
+            raise ValueError(f"Invalid class id '{class_id}'")
+        with self._lock:
+            index = self.index()
+            if class_id in index["classes"]:
+                return False
+            index["classes"][class_id] = {"class": class_name, "term": term, "frozen": False, "students": 0}
+            self._shards[class_id] = Shard(class_id)
+            os.makedirs(self.folder, exist_ok=True)
+            _write_json(self._path(class_id), {})
+            self._save_index()
+            return True
+
+    def get(self, class_id):
+        """Return the shard, loading it on first use, or None if there is no such class."""
+        with self._lock:
+            shard = self._shards.get(class_id)
+            if shard is not None:
+                return shard
+            info = self.index()["classes"].get(class_id)
+            if info is None:
+                return None
+            with open(self._path(class_id, info["frozen"]), "r") as f:
+                data = json.load(f)
+            shard = FrozenShard(class_id, data) if info["frozen"] else Shard(class_id, data)
+            self._shards[class_id] = shard
+            return shard
+
+    def save(self, shard, joined=(), left=()):
+        """Write a changed live shard, and the index if students `joined` or `left` it.
+
+        Called with the shard's lock held. Returns the bytes written.
+        """
+        if shard.frozen or self._shards.get(shard.id) is not shard:
+            raise ValueError(f"Class '{shard.id}' is frozen; its live shard can no longer be saved")
+        written = _write_json(self._path(shard.id), shard.students)
+        if joined or left:
+            with self._lock:
+                index = self.index()
+                for name in joined:
+                    ids = index["students"].setdefault(name, [])
+                    if shard.id not in ids:
+                        ids.append(shard.id)
+                for name in left:
+                    ids = index["students"].get(name, [])
+                    if shard.id in ids:
+                        ids.remove(shard.id)
+                    if not ids:
+                        index["students"].pop(name, None)
+                index["classes"][shard.id]["students"] = len(shard.students)
+                written += self._save_index()
+        return written
+
+    def freeze(self, class_id):
+        """Close a live class: write its precomputed file and drop the live one.
+
+        Returns the FrozenShard, or None if there is no such class.
+        """
+        shard = self.get(class_id)
+        if shard is None or shard.frozen:
+            return shard
+        with shard.lock, self._lock:
+            if shard.frozen:
+                return self._shards[class_id]  # frozen while we waited for the lock
+            info = self.index()["classes"][class_id]
+            data = shard.frozen_data(info)
+            _write_json(self._path(class_id, frozen=True), data)
+            info["frozen"] = True
+            self._save_index()
+            os.remove(self._path(class_id))
+            frozen = self._shards[class_id] = FrozenShard(class_id, data)
+            # Changes that fetched the live shard before this and waited for its lock see this and give up
+            shard.frozen = True
+        return frozen
@@ -0,0 +1,149 @@
+import sys
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the pure-Python paths in firstProj still work without it
+    np = None
+
+# Columnar copy of the grade data for vectorized class-wide computations.
+# Every grade is one row across three parallel arrays:
+#   grade   float64  the grade itself
+#   student int32    code into `names`
+#   subject int32    code into `subjects`
+# A copy is built from a whole roster and not changed afterwards: firstProj builds one
+# at load time (GRADING_BACKEND=numpy) to compute its running totals, then drops it.
+
+# Lower bounds of the letter grades used by firstProj.letter_grade, lowest first
+LETTER_CUTOFFS = [50, 60, 65, 70, 75, 80, 85, 90]
+LETTERS = ["F", "D", "C", "C+", "B", "B+", "A-", "A", "A+"]
+
+
+def available():
+    """Return True when numpy is installed and the columnar store can be used."""
+    return np is not None
+
+
+def letter_counts(averages):
+    """Bucket a sequence of averages into { letter: count } using the letter_grade cutoffs."""
+    buckets = np.bincount(np.digitize(np.asarray(averages, dtype=np.float64), LETTER_CUTOFFS),
+                          minlength=len(LETTERS))
+    return dict(zip(LETTERS, buckets.tolist()))
+
+
+class ColumnarGrades:
+    def __init__(self):
+        if np is None:
+            raise ImportError("The columnar grade store needs numpy (pip install numpy).")
+        self.names = []           # student code -> name
+        self.name_codes = {}      # name -> student code
+        self.subjects = []        # subject code -> subject
+        self.subject_codes = {}   # subject -> subject code
+        self.grade = np.empty(0, dtype=np.float64)
+        self.student = np.empty(0, dtype=np.int32)
+        self.subject = np.empty(0, dtype=np.int32)
+
+    @classmethod
+    def from_students(cls, students_dict):
+        """Build a columnar store from a { name: { subject: [grades] } } dict."""
+        store = cls()
+        grade_parts, student_parts, subject_parts = [], [], []
+        for name, subjects in students_dict.items():
+            s = store._name_code(name)
+            for subject, grades in subjects.items():
+                grades = [g for g in grades if isinstance(g, (int, float))]
+                if not grades:
+                    continue
+                grade_parts.append(grades)
+                student_parts.append((s, len(grades)))
+                subject_parts.append(store._subject_code(subject))
+        if grade_parts:
+            lengths = np.fromiter((n for _, n in student_parts), dtype=np.int64, count=len(student_parts))
+            codes = np.fromiter((s for s, _ in student_parts), dtype=np.int32, count=len(student_parts))
+            n = int(lengths.sum())
+            store.grade = np.fromiter((g for part in grade_parts for g in part), dtype=np.float64, count=n)
+            store.student = np.repeat(codes, lengths)
+            store.subject = np.repeat(np.asarray(subject_parts, dtype=np.int32), lengths)
+        return store
+
+    # Interning
+
+    def _name_code(self, name):
+        code = self.name_codes.get(name)
+        if code is None:
+            code = self.name_codes[sys.intern(name)] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def _subject_code(self, subject):
+        code = self.subject_codes.get(subject)
+        if code is None:
+            code = self.subject_codes[sys.intern(subject)] = len(self.subjects)
+            self.subjects.append(subject)
+        return code
+
+    # Group-by reductions
+
+    def _rows(self):
+        return self.grade, self.student, self.subject
+
+    def student_sums(self):
+        """Return (sums, counts) arrays indexed by student code."""
+        grade, student, _ = self._rows()
+        size = len(self.names)
+        return (np.bincount(student, weights=grade, minlength=size),
+                np.bincount(student, minlength=size))
+
+    def subject_sums(self):
+        """Return (sums, counts) arrays indexed by subject code."""
+        grade, _, subject = self._rows()
+        size = len(self.subjects)
+        return (np.bincount(subject, weights=grade, minlength=size),
+                np.bincount(subject, minlength=size))
+
+    def pair_sums(self):
+        """Return { (name, subject): (sum, count) } for every pair with grades."""
+        grade, student, subject = self._rows()
+        width = max(len(self.subjects), 1)
+        keys = student.astype(np.int64) * width + subject
+        unique, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=grade)
+        counts = np.bincount(inverse)
+        names, subjects = self.names, self.subjects
+        return {
+            (names[key // width], subjects[key % width]): (total, count)
+            for key, total, count in zip(unique.tolist(), sums.tolist(), counts.tolist())
+        }
+
+    def student_averages(self):
+        """Return { name: average } for every student with grades."""
+        sums, counts = self.student_sums()
+        graded = np.flatnonzero(counts)
+        averages = sums[graded] / counts[graded]
+        return {self.names[i]: avg for i, avg in zip(graded.tolist(), averages.tolist())}
+
+    def subject_averages(self):
+        """Return { subject: (average, count) } for every subject with grades."""
+        sums, counts = self.subject_sums()
+        graded = np.flatnonzero(counts)
+        averages = sums[graded] / counts[graded]
+        return {self.subjects[j]: (avg, int(counts[j])) for j, avg in zip(graded.tolist(), averages.tolist())}
+
+    def rankings(self):
+        """Return [(name, average)] best first, ties broken by name."""
+        sums, counts = self.student_sums()
+        graded = np.flatnonzero(counts)
+        averages = sums[graded] / counts[graded]
+        names = np.asarray(self.names, dtype=object)[graded]
+        order = np.lexsort((names.astype(str), -averages))
+        return list(zip(names[order].tolist(), averages[order].tolist()))
+
+    # Views
+
+    def to_students(self):
+        """Return the data in the usual { name: { subject: [grades] } } shape."""
+        grade, student, subject = self._rows()
+        result = {}
+        names, subjects = self.names, self.subjects
+        for g, s, j in zip(grade.tolist(), student.tolist(), subject.tolist()):
+            result.setdefault(names[s], {}).setdefault(subjects[j], []).append(g)
+        return result
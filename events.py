@@ -0,0 +1,129 @@
+import itertools
+import os
+import queue
+import threading
+from collections import deque
+
+import serializer
+
+# Change feed behind GET /events (server-sent events).
+# firstProj publishes what each change did to the rankings and averages, not the data:
+#   rank     {"name", "average", "exact_average", "letter", "rank"}
+#                                                   a student's new average and place
+#   unranked {"name"}                               a student without grades, or removed
+#   subject  {"subject", "average", "letter"}       a subject's new average (None when empty)
+#   reset    {}                                     too much changed; fetch everything again
+# so a grade change costs each subscriber a message or two. Events carry absolute values,
+# so one applied twice does no harm. Every event has an id; a client reconnecting with
+# Last-Event-ID gets the ones it missed from the last REPLAY_SIZE, or a reset.
+# Ids are "<origin>-<number>", numbered per process: an id from another GRADING_WORKERS
+# process, or from before a restart, cannot be placed in this one's events, so it gets a reset.
+
+QUEUE_SIZE = 1000      # Events a subscriber may fall behind before it is sent a reset instead
+REPLAY_SIZE = 1000     # Recent events kept for reconnecting clients
+
+
+class Broadcaster:
+    def __init__(self, replay=REPLAY_SIZE):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._recent = deque(maxlen=replay)   # (number, (id, event, data))
+        self._numbers = itertools.count(1)
+        self.origin = f"{os.getpid()}.{os.urandom(4).hex()}"
+        self.last_id = 0                      # number of the latest event
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def publish(self, changes):
+        """Number (event, data) pairs and hand them to every subscriber as one batch."""
+        with self._lock:
+            batch = []
+            for event, data in changes:
+                self.last_id = next(self._numbers)
+                entry = (self._id(self.last_id), event, data)
+                batch.append(entry)
+                self._recent.append((self.last_id, entry))
+            # Delivery only queues, so it is done under the lock to keep batches in order
+            for deliver in self._subscribers:
+                deliver(batch)
+
+    def subscribe(self, deliver, last_id=None):
+        """Call deliver(batch) with every batch published from now on.
+
+        Returns the events published after `last_id`, a Last-Event-ID, or None when
+        some of them are no longer kept, or the id is not one of ours, and the
+        subscriber should start over.
+        """
+        with self._lock:
+            self._subscribers.add(deliver)
+            if last_id is None:
+                return []
+            origin, _, number = last_id.rpartition("-")
+            if origin != self.origin or not number.isdigit():
+                return None
+            number = int(number)
+            if number >= self.last_id:
+                return []
+            if not self._recent or self._recent[0][0] > number + 1:
+                return None
+            return [entry for n, entry in self._recent if n > number]
+
+    def unsubscribe(self, deliver):
+        with self._lock:
+            self._subscribers.discard(deliver)
+
+    def reset_event(self):
+        return self._id(self.last_id), "reset", {}
+
+    def _id(self, number):
+        return f"{self.origin}-{number}"
+
+
+class Subscription:
+    """A subscriber read from a thread: published events wait in a bounded queue."""
+
+    def __init__(self, broadcaster, last_id=None, maxsize=QUEUE_SIZE):
+        self._broadcaster = broadcaster
+        self._queue = queue.Queue(maxsize)
+        self._overflowed = False
+        missed = broadcaster.subscribe(self._deliver, last_id)
+        self.missed = [broadcaster.reset_event()] if missed is None else missed
+
+    def _deliver(self, batch):
+        for entry in batch:
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                self._overflowed = True
+                return
+
+    def get(self, timeout):
+        """Return the waiting events, waiting up to `timeout` seconds for one; [] if none came."""
+        try:
+            entries = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                entries.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if self._overflowed:
+            self._overflowed = False
+            return [self._broadcaster.reset_event()]
+        return entries
+
+    def close(self):
+        self._broadcaster.unsubscribe(self._deliver)
+
+
+def encode(entries):
+    """Encode (id, event, data) entries as server-sent events."""
+    return b"".join(b"id: %s\nevent: %s\ndata: %s\n\n" % (event_id.encode(), event.encode(), serializer.dumps_bytes(data))
+                    for event_id, event, data in entries)
+
+
+RETRY = b"retry: 2000\n\n"     # Milliseconds a browser waits before reconnecting
+KEEPALIVE = b": keepalive\n\n"
@@ -0,0 +1,298 @@
+import argparse
+import csv
+import io
+import os
+import re
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# Report-card export: one rendered card per student, collected in a zip archive.
+#   python export.py --format pdf --out report_cards.zip --workers 4
+# and POST /exports in app.py, which runs the same export as a background job.
+# Students are sent to a process pool CHUNK_SIZE at a time; the pool renders the
+# cards while this process writes the finished chunks into the archive, in order,
+# with at most two chunks per worker in flight. PDF cards come out of the workers
+# already compressed and are stored as they are, so the archive writer stays cheap.
+#   csv  - Subject, Grades, Average, Letter rows, then an Overall row
+#   html - templates/report_card.html, rendered with Jinja2
+#   pdf  - a plain PDF written here: one A4 page per 50 lines, built-in fonts, Latin-1 text
+
+FORMATS = ("csv", "html", "pdf")
+CHUNK_SIZE = 500          # Students rendered by one task in a worker process
+TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+_template = None
+
+
+def _html_template():
+    global _template
+    if _template is None:
+        from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+        env = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER), autoescape=select_autoescape(["html"]))
+        _template = env.get_template("report_card.html")
+    return _template
+
+
+def render_csv(report, title, issued):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["Subject", "Grades", "Average", "Letter"])
+    for subject, info in report["subjects"].items():
+        writer.writerow([subject, " ".join(str(g) for g in info["grades"]), f"{info['average']:.2f}", info["letter"]])
+    if report["overall_average"] is not None:
+        writer.writerow(["Overall", "", f"{report['overall_average']:.2f}", report["overall_letter"]])
+    return out.getvalue().encode("utf-8")
+
+
+def render_html(report, title, issued):
+    return _html_template().render(report=report, title=title, issued=issued).encode("utf-8")
+
+
+# PDF
+
+PDF_LINES_PER_PAGE = 50
+PDF_WIDTH = 90            # Characters per line in the 10-point Courier body
+
+
+def _pdf_text(text):
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _pdf_lines(report):
+    lines = [f"{'Subject':<30} {'Average':>8}  Letter", "-" * 48]
+    for subject, info in report["subjects"].items():
+        lines.append(f"{subject[:30]:<30} {info['average']:>8.2f}  {info['letter']}")
+        grades = "Grades: " + ", ".join(str(g) for g in info["grades"])
+        while grades:
+            lines.append("    " + grades[:PDF_WIDTH - 4])
+            grades = grades[PDF_WIDTH - 4:]
+    if report["overall_average"] is not None:
+        lines += ["-" * 48, f"{'Overall':<30} {report['overall_average']:>8.2f}  {report['overall_letter']}"]
+    return lines
+
+
+def render_pdf(report, title, issued):
+    lines = _pdf_lines(report)
+    pages = [lines[i:i + PDF_LINES_PER_PAGE] for i in range(0, len(lines), PDF_LINES_PER_PAGE)] or [[]]
+    # Objects: 1 catalog, 2 page tree, 3-4 fonts, then a page and its contents per page
+    kids = " ".join(f"{5 + 2 * i} 0 R" for i in range(len(pages)))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>",
+    ]
+    for number, page in enumerate(pages):
+        content = []
+        if number == 0:
+            content.append(f"BT /F1 16 Tf 50 790 Td (Report Card: {_pdf_text(report['name'])}) Tj ET")
+            content.append(f"BT /F2 10 Tf 50 772 Td ({_pdf_text(title)} - Issued {issued}) Tj ET")
+        content.append("BT /F2 10 Tf 12 TL 50 745 Td")
+        content.extend(f"({_pdf_text(line)}) Tj T*" for line in page)
+        content.append("ET")
+        stream = zlib.compress("\n".join(content).encode("latin-1"))
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {6 + 2 * number} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>".encode())
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+RENDERERS = {"csv": render_csv, "html": render_html, "pdf": render_pdf}
+
+
+def render_chunk(fmt, title, issued, reports):
+    """Render a list of reports; runs in the pool's worker processes."""
+    render = RENDERERS[fmt]
+    return [render(report, title, issued) for report in reports]
+
+
+def _chunks(reports, size):
+    chunk = []
+    for report in reports:
+        chunk.append(report)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _filename(name, fmt, used):
+    base = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_") or "student"
+    filename, n = f"{base}.{fmt}", 1
+    while filename in used:
+        n += 1
+        filename = f"{base}_{n}.{fmt}"
+    used.add(filename)
+    return filename
+
+
+def export_reports(reports, out, fmt="pdf", workers=None, title="Report Card", chunk_size=CHUNK_SIZE, progress=None):
+    """Render `reports` (getStudentReport results) into a zip archive written to `out`.
+
+    `out` is a path or a binary file. `workers` is the size of the process pool;
+    1 renders in this process. `progress(done)` is called after each chunk is
+    written. Returns the number of cards written.
+    """
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    workers = workers or os.cpu_count() or 1
+    issued = datetime.now().strftime("%Y-%m-%d")
+    # PDF content is compressed already
+    compression = zipfile.ZIP_STORED if fmt == "pdf" else zipfile.ZIP_DEFLATED
+    used = set()
+    done = 0
+
+    with zipfile.ZipFile(out, "w", compression) as archive:
+        def write(chunk, bodies):
+            nonlocal done
+            for report, body in zip(chunk, bodies):
+                archive.writestr(_filename(report["name"], fmt, used), body)
+            done += len(chunk)
+            if progress is not None:
+                progress(done)
+
+        if workers == 1:
+            for chunk in _chunks(reports, chunk_size):
+                write(chunk, render_chunk(fmt, title, issued, chunk))
+            return done
+
+        with ProcessPoolExecutor(workers) as pool:
+            pending = deque()
+            for chunk in _chunks(reports, chunk_size):
+                pending.append((chunk, pool.submit(render_chunk, fmt, title, issued, chunk)))
+                if len(pending) >= 2 * workers:
+                    chunk, future = pending.popleft()
+                    write(chunk, future.result())
+            while pending:
+                chunk, future = pending.popleft()
+                write(chunk, future.result())
+    return done
+
+
+# Background jobs (POST /exports)
+
+
+class ExportJob:
+    def __init__(self, fmt, path, total=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.format = fmt
+        self.path = path
+        self.total = total      # None when filters make the count unknown until the end
+        self.done = 0
+        self.status = "queued"  # then "running", and "finished" or "failed"
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "format": self.format,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "error": self.error,
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "finished": datetime.fromtimestamp(self.finished).isoformat(timespec="seconds") if self.finished else None,
+            "seconds": round((self.finished or time.time()) - self.started, 3),
+        }
+
+
+class ExportJobs:
+    """Export jobs run one at a time on a background thread; each writes <folder>/<id>.zip."""
+
+    def __init__(self, folder, workers=None):
+        self.folder = folder
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._queue = deque()
+        self._thread = None
+
+    def start(self, reports, fmt="pdf", total=None, title="Report Card"):
+        """Queue an export of `reports` (an iterable read on the job's thread) and return its job."""
+        if fmt not in RENDERERS:
+            raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+        os.makedirs(self.folder, exist_ok=True)
+        job = ExportJob(fmt, None, total)
+        job.path = os.path.join(self.folder, f"{job.id}.zip")
+        with self._lock:
+            self._jobs[job.id] = job
+            self._queue.append((job, reports, title))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="report-export", daemon=True)
+                self._thread.start()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._thread = None
+                    return
+                job, reports, title = self._queue.popleft()
+            job.status = "running"
+
+            def progress(done):
+                job.done = done
+
+            try:
+                job.done = export_reports(reports, job.path, job.format, self.workers, title, progress=progress)
+                job.total = job.done
+                job.status = "finished"
+            except Exception as e:
+                job.status, job.error = "failed", str(e)
+                print(f"Export {job.id} failed: {e}")
+            job.finished = time.time()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a report card per student into a zip archive.")
+    parser.add_argument("--format", choices=FORMATS, default="pdf")
+    parser.add_argument("--out", help="archive to write (default report_cards_<format>.zip)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--title", default="Report Card")
+    parser.add_argument("--subject", help="only students with grades in this subject")
+    parser.add_argument("--min-average", type=float)
+    parser.add_argument("--letter")
+    args = parser.parse_args()
+
+    import firstProj
+
+    firstProj.reset_students(firstProj.load_data())
+    reports = firstProj.iterStudentReports(subject=args.subject, min_average=args.min_average, letter=args.letter)
+    out = args.out or f"report_cards_{args.format}.zip"
+    start = time.perf_counter()
+    count = export_reports(reports, out, args.format, args.workers, args.title)
+    print(f"Wrote {count} report cards to {out} in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
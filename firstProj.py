@@ -1,13 +1,153 @@
+import atexit
+import contextlib
+import csv
 import json
+import math
 import os
-from datetime import datetime
+import threading
+import time
+from bisect import bisect_left, insort
+
+import backups
+import classes
+import columnar
+import events
+import journal
+import lazyload
+import metrics
+import records
+import search
+import serializer
+import snapshot
+import stats
+from records import EMPTY_RECORD, StudentRecord, plain_grades
+from sqlite_storage import SQLiteStorage
+from writer import PersistenceWorker
 
 FILENAME = "students_data.json"  # Main JSON file where all student data will be saved and loaded from
-BACKUP_FOLDER = "backups"        # Folder to store backup copies of the student data file
+BACKUP_FOLDER = "backups"        # Folder to store backup snapshots of the student data (see backups.py)
+BACKUP_INTERVAL = 60             # Seconds between backup snapshots; saves in between are not backed up
+BACKUP_FULL_EVERY = 100          # Delta snapshots taken before the next full one
+# (bucket seconds, max age seconds): keep every snapshot for an hour, hourly ones for a day, daily ones for 30 days
+BACKUP_RETENTION = [(0, 3600), (3600, 86400), (86400, 30 * 86400)]
+JOURNAL_FILENAME = "students_data.journal"  # Append-only log of changes made since FILENAME was last written
+COMPACT_EVERY = 1000             # Journal records to collect before folding them into FILENAME
+CLASSES_FOLDER = "classes"       # Folder of the class and term shards, one file each (see classes.py)
+
+# How changes reach the disk:
+#   "rewrite" - save_data rewrites the whole FILENAME (and takes a backup) after every change
+#   "journal" - every change is appended to JOURNAL_FILENAME and folded into FILENAME in the background
+#   "batched" - a background worker rewrites FILENAME once per batch of save_data calls
+PERSISTENCE_MODE = os.environ.get("GRADING_PERSISTENCE", "rewrite")
+SAVE_WINDOW = 0.05               # Seconds a "batched" write waits for more changes to join it
+SAVE_BATCH = 100                 # Changes that close a "batched" write early
+SAVE_WAIT = os.environ.get("GRADING_SAVE_WAIT", "1") != "0"  # Whether save_data waits for the batch to reach the disk
+
+# "python" computes the aggregates at load time by walking `students`; "numpy" builds a
+# columnar copy of the grades (see columnar.py) for that, computes them with vectorized
+# group-bys and drops the copy. Either way changes then keep them in step. Needs numpy installed.
+GRADE_BACKEND = os.environ.get("GRADING_BACKEND", "python")
+
+# Where student data is kept:
+#   "json"   - FILENAME (and JOURNAL_FILENAME), written according to PERSISTENCE_MODE
+#   "sqlite" - SQLITE_FILENAME, an indexed SQLite database (see sqlite_storage.py) committed
+#              once per save_data call; PERSISTENCE_MODE does not apply.
+#              Existing JSON data is imported with `python sqlite_storage.py`.
+STORAGE_BACKEND = os.environ.get("GRADING_STORAGE", "json")
+SQLITE_FILENAME = "students_data.db"
+
+# "1" lets several processes serve the same data (see workers.py). SQLITE_FILENAME is
+# then the one authoritative store: every process keeps its own copy of `students`,
+# publishes its changes through the database and applies the other processes'
+# changes (see sync_changes) before it serves a request or makes a change.
+SHARED_STORE = os.environ.get("GRADING_SHARED", "0") != "0"
+if SHARED_STORE:
+    STORAGE_BACKEND = "sqlite"
+
+# "eager" reads the whole data file at startup; "lazy" reads only its index (see
+# lazyload.py) and parses a student the first time they are used, keeping at most
+# RESIDENT_STUDENTS unchanged records in memory. "snapshot" is "lazy" over a binary
+# copy of the data file (SNAPSHOT_FILENAME, see snapshot.py) that is memory-mapped
+# instead of parsed; it is rewritten with every full write of FILENAME, which stays
+# the file the journal, compaction and backups work from.
+# Applies to the "json" storage backend.
+LOAD_MODE = os.environ.get("GRADING_LOAD", "eager")
+LAZY_LOAD = LOAD_MODE in ("lazy", "snapshot") and STORAGE_BACKEND == "json"
+SNAPSHOT_LOAD = LAZY_LOAD and LOAD_MODE == "snapshot"
+SNAPSHOT_FILENAME = "students_data.snap"
+RESIDENT_STUDENTS = 10000
+
+# Opt-in instrumentation (see metrics.py): "1" records request latencies, time spent
+# in the core functions, grades scanned and bytes written, served on GET /metrics.
+METRICS = os.environ.get("GRADING_METRICS", "0") != "0"
+metrics.enable(METRICS)
+
+_storage = None
+_backup_store = None
+_class_store = None
+_save_lock = threading.Lock()
+_save_worker = None
+_journal_lock = threading.Lock()
+_compaction_lock = threading.Lock()
+_journal_records = 0
 
 # Dictionary to store all students and their subjects/grades
-# Structure: { "Student Name": { "Subject": [list of grades] } }
-students = {}
+# Structure: { "Student Name": StudentRecord }, where a StudentRecord (see records.py)
+# reads like { "Subject": [list of grades] } but stores grades in compact buffers.
+# Records are copy-on-write: a change replaces students[name] with a new record,
+# so a reader holding an old record never sees it change.
+# With LAZY_LOAD this is a lazyload.LazyRoster, which reads records from the data file on demand.
+students = lazyload.LazyRoster(resident_max=RESIDENT_STUDENTS) if LAZY_LOAD else {}
+
+# Held by every change to `students` and the structures derived from it.
+# Readers of a single entry don't need it; see snapshot_students() for whole-roster reads.
+store_lock = threading.RLock()
+
+# Bumped on every change to `students`, so cached encodings of the data can tell when they are stale.
+# Per-student and per-subject counters are bumped only by changes that touch them, and
+# _epoch by reset_students, which touches everything.
+_version = 0
+_epoch = 0
+_student_versions = {}
+_subject_versions = {}
+
+# Change feed behind GET /events (see events.py). _bump_version notes the students and
+# subjects a change touched while anyone is subscribed, and _publish_changes sends their
+# new averages and ranks once the change is complete.
+feed = events.Broadcaster()
+FEED_BATCH_MAX = 500   # Students touched by one change beyond which subscribers are sent a reset
+_feed_names = set()
+_feed_subjects = set()
+
+# Running aggregates kept in step with `students` by the core functions below.
+# Every entry is a (sum, count) tuple over the numeric grades it covers; entries
+# are replaced rather than updated, so one lookup always gives a matching pair.
+# Structure: { ("Student Name", "Subject"): (sum, count) }
+# Not kept with LAZY_LOAD, where most records are not in memory; see _pair_average.
+pair_totals = {}
+# Structure: { "Student Name": (sum, count) }
+student_totals = {}
+# Structure: { "Subject": (sum, count) }
+subject_totals = {}
+
+# Grade distributions behind the /stats endpoints (see stats.py), kept in step by _track_grades.
+# Structure: { "Subject": GradeDistribution }, plus one over every grade.
+# When the aggregates were rebuilt without reading every grade (numpy backend, SQLite
+# totals, lazy loading) they are built on first use instead; see _ensure_stats.
+subject_stats = {}
+class_stats = stats.GradeDistribution()
+_stats_ready = False
+
+# Index of the student names behind GET /search (see search.py), built on the first
+# search and then kept in step with `students` by _index_names and _drop_student.
+# It has its own lock: searches, and most of the build, do not hold store_lock.
+name_index = search.NameIndex()
+_search_build_lock = threading.Lock()
+
+# Students with at least one grade, kept sorted best first.
+# Structure: [ (-average, "Student Name") ], plus { "Student Name": key in rank_index }
+rank_index = []
+rank_keys = {}
 
 
 # Helper functions
@@ -43,27 +183,325 @@ def letter_grade(avg):
         return "F"
 
 
+def numeric_grades(grades):
+    """Return only the int/float values from a list of grades."""
+    return [g for g in grades if isinstance(g, (int, float))]
+
+
+# Aggregates
+
+
+def _bump(table, key, total, count):
+    old_total, old_count = table.get(key, (0, 0))
+    if old_count + count <= 0:
+        table.pop(key, None)
+    else:
+        table[key] = (old_total + total, old_count + count)
+
+def _track_grades(name, subject, grades, sign=1):
+    grades = numeric_grades(grades)
+    if not grades:
+        return
+    total = sign * sum(grades)
+    count = sign * len(grades)
+    if not LAZY_LOAD:
+        _bump(pair_totals, (name, subject), total, count)
+    _bump(student_totals, name, total, count)
+    _bump(subject_totals, subject, total, count)
+    if _stats_ready:
+        _track_stats(subject, grades, sign)
+
+def _track_stats(subject, grades, sign=1):
+    distribution = subject_stats.get(subject)
+    if distribution is None:
+        distribution = subject_stats[subject] = stats.GradeDistribution()
+    update, update_class = ((distribution.add, class_stats.add) if sign > 0
+                            else (distribution.remove, class_stats.remove))
+    for grade in grades:
+        update(grade)
+        update_class(grade)
+    if not distribution.count:
+        del subject_stats[subject]
+
+def _index_names(names):
+    """Add students new to `students` to name_index, once it is built; called with store_lock held."""
+    name_index.update(names)
+
+def _untrack_student(name):
+    for subject, grades in students[name].items():
+        _track_grades(name, subject, grades, sign=-1)
+
+def _update_rank(name):
+    """Move a student to their current place in `rank_index`."""
+    old_key = rank_keys.pop(name, None)
+    if old_key is not None:
+        del rank_index[bisect_left(rank_index, old_key)]
+    avg = _average(student_totals, name)
+    if avg is not None:
+        key = (-avg, name)
+        insort(rank_index, key)
+        rank_keys[name] = key
+
+def _average(table, key):
+    entry = table.get(key)
+    if entry is None:
+        return None
+    return entry[0] / entry[1]
+
+def _pair_average(name, subject, record):
+    """Average of one student's grades in a subject, or None if there are none."""
+    if LAZY_LOAD:
+        grades = numeric_grades(record[subject])
+        return sum(grades) / len(grades) if grades else None
+    return _average(pair_totals, (name, subject))
+
+def rebuild_aggregates():
+    """Recompute every running aggregate from the `students` dict."""
+    with store_lock:
+        _rebuild_aggregates()
+
+def _rebuild_aggregates(totals=None):
+    # `totals` is a (pair, student, subject) triple the storage backend already computed
+    global _stats_ready
+    pair_totals.clear()
+    student_totals.clear()
+    subject_totals.clear()
+    subject_stats.clear()
+    class_stats.__init__()
+    _stats_ready = False
+    if GRADE_BACKEND == "numpy" and columnar.available():
+        # Get every total from vectorized group-bys over a columnar copy, dropped afterwards:
+        # from here on the totals are kept in step by the core functions as usual
+        columns = columnar.ColumnarGrades.from_students(students)
+        pair_totals.update(columns.pair_sums())
+        sums, counts = columns.student_sums()
+        for code in counts.nonzero()[0].tolist():
+            student_totals[columns.names[code]] = (float(sums[code]), int(counts[code]))
+        sums, counts = columns.subject_sums()
+        for code in counts.nonzero()[0].tolist():
+            subject_totals[columns.subjects[code]] = (float(sums[code]), int(counts[code]))
+    else:
+        if GRADE_BACKEND == "numpy":
+            print("Warning: numpy is not installed; using the pure-Python grade backend.")
+        columns = None
+    if columns is None and totals is not None:
+        pair_totals.update(totals[0])
+        student_totals.update(totals[1])
+        subject_totals.update(totals[2])
+    elif columns is None:
+        _stats_ready = True  # every grade passes through _track_grades below
+        scanned = 0
+        for name, subjects in students.items():
+            for subject, grades in subjects.items():
+                _track_grades(name, subject, grades)
+                scanned += len(grades)
+        metrics.add("grades_scanned_total", scanned, function="rebuild_aggregates")
+
+    rank_keys.clear()
+    for name, (total, count) in student_totals.items():
+        rank_keys[name] = (-(total / count), name)
+    rank_index[:] = sorted(rank_keys.values())
+
+@metrics.timed("reset_students")
+def reset_students(data):
+    """Replace the contents of `students` in place and rebuild the aggregates.
+
+    `data` may hold StudentRecords or plain { "Subject": [grades] } dicts.
+    """
+    global _epoch
+    with store_lock:
+        if isinstance(students, lazyload.LazyRoster) and isinstance(data, lazyload.LazyRoster):
+            students.adopt(data)  # records stay on disk until they are used
+        else:
+            students.clear()
+            students.update((name, StudentRecord.from_dict(record)) for name, record in data.items())
+        _rebuild_aggregates(get_storage().totals_for(data))
+        name_index.clear()
+        _epoch += 1
+        _student_versions.clear()
+        _subject_versions.clear()
+        _bump_version()
+        _feed_names.clear()
+        _feed_subjects.clear()
+        if feed.subscribers:
+            feed.publish([("reset", {})])
+
+def _bump_version(names=(), subjects=()):
+    global _version
+    _version += 1
+    for name in names:
+        _student_versions[name] = _student_versions.get(name, 0) + 1
+    for subject in subjects:
+        _subject_versions[subject] = _subject_versions.get(subject, 0) + 1
+    if feed.subscribers:
+        _feed_names.update(names)
+        _feed_subjects.update(subjects)
+
+def _publish_changes():
+    """Send the new averages and ranks of what changed since the last call; called with store_lock held."""
+    if not _feed_names and not _feed_subjects:
+        return
+    names, subjects = list(_feed_names), list(_feed_subjects)
+    _feed_names.clear()
+    _feed_subjects.clear()
+    if len(names) > FEED_BATCH_MAX:
+        feed.publish([("reset", {})])
+        return
+    changes = []
+    for name in names:
+        key = rank_keys.get(name)
+        if key is None:
+            changes.append(("unranked", {"name": name}))
+        else:
+            avg = -key[0]
+            changes.append(("rank", {"name": name, "average": round(avg, 2), "exact_average": avg,
+                                     "letter": letter_grade(avg), "rank": bisect_left(rank_index, (key[0],)) + 1}))
+    for subject in subjects:
+        avg = _average(subject_totals, subject)
+        changes.append(("subject", {"subject": subject, "average": None if avg is None else round(avg, 2),
+                                    "letter": None if avg is None else letter_grade(avg)}))
+    feed.publish(changes)
+
+def data_version():
+    """Return a number that changes whenever `students` changes."""
+    return _version
+
+def student_version(name):
+    """Return a stamp that changes whenever the given (normalized) student changes."""
+    return _epoch, _student_versions.get(name, 0)
+
+def subject_version(subject):
+    """Return a stamp that changes whenever grades in the given (normalized) subject change."""
+    return _epoch, _subject_versions.get(subject, 0)
+
+def versioned_snapshot():
+    """Return (data_version(), snapshot_students()) taken at the same moment."""
+    with store_lock:
+        return _version, students.copy()
+
+def snapshot_students():
+    """Return a consistent copy of `students` without blocking writers.
+
+    The copy is shallow; that is enough because records are never changed in place.
+    """
+    return students.copy()
+
+
+# Changes from other processes (SHARED_STORE)
+
+
+@contextlib.contextmanager
+def _changing():
+    """Hold store_lock for a change to `students`.
+
+    With SHARED_STORE this also takes the store's write lock (released when
+    save_data commits) and first applies every change other processes made,
+    so the change is made against current data.
+    """
+    with store_lock:
+        if SHARED_STORE:
+            storage = get_storage()
+            storage.begin()
+            if storage.changed():
+                _catch_up(storage)
+        try:
+            yield
+        finally:
+            _publish_changes()
+
+
+def sync_changes():
+    """Apply the changes other processes made to the shared store since the last call."""
+    if not SHARED_STORE:
+        return
+    storage = get_storage()
+    if storage.changed():
+        with store_lock:
+            _catch_up(storage)
+            _publish_changes()
+
+
+def _catch_up(storage):
+    changes = storage.poll()
+    if changes is None:
+        reset_students(storage.load())
+        return
+    for change in changes:
+        _apply_change(change)
+
+
+def _apply_change(change):
+    """Apply a journal-style change made by another process; called with store_lock held."""
+    op, name = change["op"], change["name"]
+    if op == "add_student":
+        if name not in students:
+            students[name] = EMPTY_RECORD
+            _bump_version(names=[name])
+            _index_names([name])
+    elif op in ("set_grade", "remove_grade"):
+        subject, grades = change["subject"], change["grades"]
+        record = students.get(name, EMPTY_RECORD)
+        _retrack_pair(record, name, subject, grades)
+        students[name] = record.with_subject(subject, grades)
+        _bump_version(names=[name], subjects=[subject])
+        _update_rank(name)
+        _index_names([name])
+    elif op == "remove_student":
+        if name in students:
+            _drop_student(name)
+    else:
+        print(f"Warning: unknown change {op!r} from another process ignored.")
+
+
 # Core functions
 
 
 def addStudent(name):
     name = normalize_name(name)
-    if name not in students:
-        students[name] = {}
+    with _changing():
+        added = name not in students
+        if added:
+            students[name] = EMPTY_RECORD
+            _bump_version(names=[name])
+            _index_names([name])
+            _record("add_student", name)
+    if added:
         print(f"Student '{name}' added successfully.")
     else:
         print(f"The student '{name}' is already in the record!")
 
 
 
+def _apply_grades(batch):
+    """Add already-validated grades, given as { (name, subject): [grades] }, in one step.
+
+    Each touched student gets one new record, and all of them are published together,
+    so readers see either none or all of the batch.
+    """
+    by_student = {}
+    for (name, subject), grades in batch.items():
+        by_student.setdefault(name, {})[subject] = grades
+
+    with _changing():
+        changed = {}
+        for name, additions in by_student.items():
+            # Auto-create student if missing
+            changed[name] = students.get(name, EMPTY_RECORD).with_grades(additions)
+            for subject, grades in additions.items():
+                _track_grades(name, subject, grades)
+        students.update(changed)
+        _index_names(changed)
+        _bump_version(names=changed, subjects={subject for _, subject in batch})
+        for name in changed:
+            _update_rank(name)
+        for name, subject in batch:
+            _record("set_grade", name, subject)
+
+
 def setGrade(name, subject, grade):
     name = normalize_name(name)
     subject = normalize_subject(subject)
 
-    # Auto-create student if missing
-    if name not in students:
-        students[name] = {}
-
     if not isinstance(grade, list):
         grade = [grade]
 
@@ -74,10 +512,7 @@ def setGrade(name, subject, grade):
                 "message": "Grades must be numbers"
             }
 
-    if subject in students[name]:
-        students[name][subject].extend(grade)
-    else:
-        students[name][subject] = grade
+    _apply_grades({(name, subject): grade})
 
     return {
         "success": True,
@@ -93,23 +528,32 @@ def removeGrade(name, subject, grade):
         print(f"Invalid grade input: {grade}. Must be a number.")
         return
 
-    if name not in students:
-        print("This person is not in the record.")
-        return
-    if subject not in students[name]:
-        print(f"{name} is not taking the subject '{subject}'.")
-        return
-    if grade in students[name][subject]:
-        students[name][subject].remove(grade)
-        print(f"Grade {grade} removed from {subject} for {name}.")
-        if not students[name][subject]:
-            print(f"{name} now has no grades for {subject}.")
-    else:
-        print(f"The grade {grade} does not exist in {subject} for {name}.")
+    with _changing():
+        if name not in students:
+            print("This person is not in the record.")
+            return
+        if subject not in students[name]:
+            print(f"{name} is not taking the subject '{subject}'.")
+            return
+        if grade not in students[name][subject]:
+            print(f"The grade {grade} does not exist in {subject} for {name}.")
+            return
+
+        record = students[name].without_grade(subject, grade)
+        students[name] = record
+        _bump_version(names=[name], subjects=[subject])
+        _track_grades(name, subject, [grade], sign=-1)
+        _update_rank(name)
+        _record("remove_grade", name, subject)
+
+    print(f"Grade {grade} removed from {subject} for {name}.")
+    if not record[subject]:
+        print(f"{name} now has no grades for {subject}.")
 
 def displayReport(name):
     name = normalize_name(name)
-    if name not in students:
+    student_data = students.get(name)
+    if student_data is None:
         print("This student is not in our record.")
         return
 
@@ -117,7 +561,6 @@ def displayReport(name):
     print(f"REPORT FOR {name}")
     print("="*50)
     
-    student_data = students[name]
     allGrades = []
 
     if not student_data:
@@ -126,7 +569,7 @@ def displayReport(name):
 
     for subject in sorted(student_data):
         # Filter numeric grades
-        grades = [g for g in student_data[subject] if isinstance(g, (int, float))]
+        grades = plain_grades(numeric_grades(student_data[subject]))
 
         if not grades:
             print(f"{subject:<15}: No grades available")
@@ -145,12 +588,17 @@ def displayReport(name):
 
 
 
+@metrics.timed("getStudentReport")
 def getStudentReport(name):
     name = normalize_name(name)
-    if name not in students:
-        return {"success": False, "message": f"Student '{name}' not found."}
+    # Read the record and its totals together so they agree with each other
+    with store_lock:
+        student_data = students.get(name)
+        if student_data is None:
+            return {"success": False, "message": f"Student '{name}' not found."}
+        subject_avgs = {subject: _pair_average(name, subject, student_data) for subject in student_data}
+        overall_avg = _average(student_totals, name)
 
-    student_data = students[name]
     report = {
         "name": name,
         "subjects": {},
@@ -158,23 +606,20 @@ def getStudentReport(name):
         "overall_letter": None
     }
 
-    all_grades = []
-
+    scanned = 0
     for subject, grades_list in student_data.items():
-        # Filter numeric grades
-        grades = [g for g in grades_list if isinstance(g, (int, float))]
-        if not grades:
+        subject_avg = subject_avgs[subject]
+        if subject_avg is None:
             continue
-        subject_avg = sum(grades) / len(grades)
-        all_grades.extend(grades)
+        scanned += len(grades_list)
         report["subjects"][subject] = {
-            "grades": grades,
+            "grades": plain_grades(numeric_grades(grades_list)),
             "average": subject_avg,
             "letter": letter_grade(subject_avg)
         }
+    metrics.add("grades_scanned_total", scanned, function="getStudentReport")
 
-    if all_grades:
-        overall_avg = sum(all_grades) / len(all_grades)
+    if overall_avg is not None:
         report["overall_average"] = overall_avg
         report["overall_letter"] = letter_grade(overall_avg)
 
@@ -184,11 +629,64 @@ def getStudentReport(name):
 
 
 
+def iterStudentReports(subject=None, min_average=None, letter=None):
+    """Yield getStudentReport results one student at a time, optionally filtered.
+
+    subject keeps students with grades in that subject, min_average and letter
+    test the overall average. Totals are checked before a report is built, so
+    students that are filtered out cost a dict lookup.
+    """
+    if subject is not None:
+        subject = normalize_subject(subject)
+    if letter is not None:
+        letter = letter.strip().upper()
+
+    snapshot = snapshot_students()
+    for name in snapshot:
+        if subject is not None and (subject not in snapshot[name]
+                                    or _pair_average(name, subject, snapshot[name]) is None):
+            continue
+        if min_average is not None or letter is not None:
+            avg = _average(student_totals, name)
+            if avg is None:
+                continue
+            if min_average is not None and avg < min_average:
+                continue
+            if letter is not None and letter_grade(avg) != letter:
+                continue
+        report = getStudentReport(name)
+        if report.get("success"):
+            yield report
+
+
+
+
+def _retrack_pair(record, name, subject, grades):
+    """Move the aggregates of one pair from its grades in `record` to `grades`; called with store_lock held."""
+    if subject in record:
+        old = record[subject]
+        _track_grades(name, subject, old, sign=-1)
+    _track_grades(name, subject, grades)
+
+
+def _drop_student(name):
+    """Remove a student from `students` and the aggregates; called with store_lock held."""
+    _untrack_student(name)
+    record = students.pop(name)
+    _bump_version(names=[name], subjects=record)
+    _update_rank(name)
+    name_index.remove(name)
+
+
 def removeStudents(names):
     for name in names:
         name = normalize_name(name)
-        if name in students:
-            students.pop(name)
+        with _changing():
+            removed = name in students
+            if removed:
+                _drop_student(name)
+                _record("remove_student", name)
+        if removed:
             print(f"{name} has been removed.")
         else:
             print(f"{name} was not found in the record.")
@@ -196,7 +694,7 @@ def removeStudents(names):
 
 
 def displayAllStudent():
-    for name in students:
+    for name in snapshot_students():
         displayReport(name)
 
 
@@ -205,81 +703,757 @@ def searchStudent(name):
     name = normalize_name(name)
     if name in students:
         displayReport(name)
-    else:
-        print(f"Student '{name}' not found in the record.")
+        return
+    print(f"Student '{name}' not found in the record.")
+    matches = searchStudents(name, limit=5)["results"]
+    if matches:
+        print("Did you mean: " + ", ".join(match["name"] for match in matches) + "?")
+
+
+def _build_name_index():
+    """Build name_index, holding store_lock only while the names are read."""
+    with _search_build_lock:
+        if name_index.ready:
+            return
+        with store_lock:
+            names = list(students)
+            # Changes after this point are queued by the index and applied once it is built
+            token = name_index.start_build()
+        name_index.build(names, token)
+
+
+@metrics.timed("searchStudents")
+def searchStudents(query, limit=10, fuzzy=True):
+    """Students whose name matches `query`, best first; see search.NameIndex.search."""
+    while not name_index.ready:
+        _build_name_index()
+    results = name_index.search(query, limit, fuzzy)
+    return {"success": True, "query": query, "results": results}
 
 
 
 def subjectAverage(subject):
     subject = normalize_subject(subject)
-    allGrades = []
-
-    for student in students:
-        grades = [g for g in students[student].get(subject, []) if isinstance(g, (int, float))]
-        allGrades.extend(grades)
+    avg = _average(subject_totals, subject)
 
-    if not allGrades:
+    if avg is None:
         print(f"No grades found for the subject '{subject}'.")
         return
 
-    avg = sum(allGrades)/len(allGrades)
     print(f"The average grade for {subject} is {avg:.2f} | Letter: {letter_grade(avg)}")
 
 
 
 
+@metrics.timed("getSubjectAverage")
 def getSubjectAverage(subject):
     subject = normalize_subject(subject)
-    all_grades = []
+    avg = _average(subject_totals, subject)
 
-    for student in students:
-        grades = [g for g in students[student].get(subject, []) if isinstance(g, (int, float))]
-        all_grades.extend(grades)
-
-    if not all_grades:
+    if avg is None:
         return {"success": False, "message": f"No grades found for {subject}"}
 
-    avg = sum(all_grades) / len(all_grades)
     return {"success": True, "subject": subject, "average": round(avg, 2), "letter": letter_grade(avg)}
 
 
 
 
-def rank_students():
-    student_averages = {}
-    for student, subjects in students.items():
-        all_grades = []
-        for grades in subjects.values():
-            all_grades.extend([g for g in grades if isinstance(g, (int, float))])
-        if all_grades:
-            student_averages[student] = sum(all_grades)/len(all_grades)
+def _ensure_stats():
+    """Build the grade distributions from every grade if they are not being kept; called with store_lock held."""
+    global _stats_ready
+    if _stats_ready:
+        return
+    scanned = 0
+    for subjects in students.values():
+        for subject, grades in subjects.items():
+            grades = numeric_grades(grades)
+            if grades:
+                _track_stats(subject, grades)
+                scanned += len(grades)
+    metrics.add("grades_scanned_total", scanned, function="stats")
+    _stats_ready = True
+
+
+@metrics.timed("getSubjectStats")
+def getSubjectStats(subject, percentiles=stats.DEFAULT_PERCENTILES):
+    """Count, mean, spread, percentiles, histogram and letter counts of one subject's grades."""
+    subject = normalize_subject(subject)
+    with store_lock:
+        _ensure_stats()
+        distribution = subject_stats.get(subject)
+        if distribution is None:
+            return {"success": False, "message": f"No grades found for {subject}"}
+        summary = distribution.summary(percentiles)
+    return {"success": True, "subject": subject, **summary}
+
+
+@metrics.timed("getClassStats")
+def getClassStats(percentiles=stats.DEFAULT_PERCENTILES):
+    """The getSubjectStats figures over every grade, a short summary per subject,
+    and the spread of the students' overall averages."""
+    with store_lock:
+        _ensure_stats()
+        if not class_stats.count:
+            return {"success": False, "message": "No grades recorded."}
+        grades = class_stats.summary(percentiles)
+        subjects = {
+            subject: {"count": d.count, "mean": round(d.mean, 2), "stdev": round(math.sqrt(d.variance()), 2),
+                      "median": round(d.percentile(50), 2)}
+            for subject, d in sorted(subject_stats.items())
+        }
+        # rank_index holds every graded student's average, best first, so these are exact
+        graded = len(rank_index)
+        median = round(_ranked_percentile(50), 2)
+        averages = {f"p{p:g}": round(_ranked_percentile(p), 2) for p in percentiles}
+        letters = {}
+        upper = 0
+        for letter, cutoff in zip(reversed(stats.LETTERS), list(reversed(stats.LETTER_CUTOFFS)) + [None]):
+            # (next key value,) sorts after every (-cutoff, name), i.e. after each average >= cutoff
+            lower = graded if cutoff is None else bisect_left(rank_index, (math.nextafter(-cutoff, math.inf),))
+            letters[letter] = lower - upper
+            upper = lower
+    return {
+        "success": True,
+        "grades": grades,
+        "subjects": subjects,
+        "students": {
+            "graded": graded,
+            "median_average": median,
+            "percentiles": averages,
+            "letters": dict(reversed(list(letters.items()))),
+        },
+    }
 
-    if not student_averages:
+
+def _ranked_percentile(p):
+    """p-th percentile of the students' averages, read from rank_index; called with store_lock held."""
+    last = len(rank_index) - 1
+    position = (100 - p) / 100 * last  # rank_index is best first
+    below = math.floor(position)
+    low = -rank_index[below][0]
+    high = -rank_index[min(below + 1, last)][0]
+    return low + (high - low) * (position - below)
+
+
+def rank_students():
+    result = getRankings()
+    if not result["success"]:
         print("No students with grades to rank.")
         return
 
-    sorted_students = sorted(student_averages.items(), key=lambda x: x[1], reverse=True)
-
     print("\nSTUDENT RANKINGS")
     print("="*50)
-    rank = 1
-    prev_avg = None
-    for i, (student, avg) in enumerate(sorted_students):
+    for row in result["rankings"]:
+        print(f"{row['rank']}. {row['name']:<20} — {row['average']:.2f} | {row['letter']}")
+    print("="*50 + "\n")
+
+
+
+
+
+def _format_rankings(sorted_students, start=0, rank=1, prev_avg=None):
+    rankings = []
+
+    for i, (student, avg) in enumerate(sorted_students, start):
         if prev_avg is not None and avg == prev_avg:
-            print(f"{rank}. {student:<20} — {avg:.2f} | {letter_grade(avg)}")
+            pass  # same rank
         else:
             rank = i + 1
-            print(f"{rank}. {student:<20} — {avg:.2f} | {letter_grade(avg)}")
+        rankings.append({
+            "rank": rank,
+            "name": student,
+            "average": round(avg, 2),
+            "exact_average": avg,  # what the order and ties go by; clients should too
+            "letter": letter_grade(avg)
+        })
         prev_avg = avg
-    print("="*50 + "\n")
+
+    return rankings
+
+
+@metrics.timed("getRankings")
+def getRankings(limit=None, offset=0, around=None):
+    if around is not None:
+        around = normalize_name(around)
+
+    with store_lock:
+        if not rank_index:
+            return {"success": False, "message": "No students with grades to rank."}
+
+        total = len(rank_index)
+        if around is not None:
+            # Centre the page on the given student
+            if around not in rank_keys:
+                return {"success": False, "message": f"Student '{around}' has no grades to rank."}
+            if limit is None:
+                limit = 10
+            position = bisect_left(rank_index, rank_keys[around])
+            offset = max(0, min(position - limit // 2, total - limit))
+        offset = max(0, offset)
+        end = total if limit is None else min(total, offset + limit)
+
+        page = [(name, -neg_avg) for neg_avg, name in rank_index[offset:end]]
+        if page:
+            # Competition ranking: one more than the number of strictly better averages
+            rank = bisect_left(rank_index, (-page[0][1],)) + 1
+
+    rankings = []
+    if page:
+        rankings = _format_rankings(page, start=offset, rank=rank, prev_avg=page[0][1])
+
+    return {"success": True, "total": total, "offset": offset, "rankings": rankings}
+
+
+# Bulk import
+
+
+BULK_CHUNK_SIZE = 10000   # Rows parsed before they are applied to `students`
+BULK_MAX_ERRORS = 100     # Row errors listed in an import result; the rest are only counted
+
+
+def _parse_grade(value):
+    if isinstance(value, str):
+        value = value.strip()
+        try:
+            value = int(value)
+        except ValueError:
+            value = float(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("grade must be a number")
+    if not math.isfinite(value):
+        raise ValueError("grade must be a finite number")
+    return value
+
+
+def _bulk_rows(lines, fmt):
+    """Yield (row number, row dict or None, error message or None) from CSV or JSONL lines."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        if reader.fieldnames is None or not {"name", "subject", "grade"} <= set(reader.fieldnames):
+            raise ValueError("CSV header must include the columns name, subject and grade.")
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, None, f"invalid JSON: {e.msg}"
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, "row must be a JSON object"
+                continue
+            yield line_no, row, None
+    else:
+        raise ValueError(f"Unsupported import format '{fmt}'. Use 'csv' or 'jsonl'.")
+
+
+def _commit_chunk():
+    """With SHARED_STORE, commit the import chunk just applied, releasing the store's write lock."""
+    if SHARED_STORE:
+        get_storage().save(students, create_backup=False)
+
+
+@metrics.timed("importGrades")
+def importGrades(lines, fmt="csv", chunk_size=None):
+    """Stream (name, subject, grade) rows from CSV or JSONL lines into `students`.
+
+    Rows are validated one by one; bad rows are reported and skipped. Good rows are
+    applied a chunk at a time. Saving is left to the caller, once for the whole import,
+    except with SHARED_STORE: there each chunk is committed as it is applied, so the
+    store's write lock is not held while the rest of the upload is read.
+    """
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    start = time.perf_counter()
+    rows = imported = error_count = 0
+    errors = []
+    batch = {}
+    pending = 0
+
+    try:
+        for line_no, row, error in _bulk_rows(lines, fmt):
+            rows += 1
+            if error is None:
+                name = row.get("name")
+                subject = row.get("subject")
+                if not isinstance(name, str) or not name.strip():
+                    error = "name is required"
+                elif not isinstance(subject, str) or not subject.strip():
+                    error = "subject is required"
+                else:
+                    try:
+                        grade = _parse_grade(row.get("grade"))
+                    except (TypeError, ValueError):
+                        error = f"invalid grade {row.get('grade')!r}"
+            if error is not None:
+                error_count += 1
+                if len(errors) < BULK_MAX_ERRORS:
+                    errors.append({"row": line_no, "message": error})
+                continue
+
+            batch.setdefault((normalize_name(name), normalize_subject(subject)), []).append(grade)
+            pending += 1
+            if pending >= chunk_size:
+                _apply_grades(batch)
+                _commit_chunk()
+                imported += pending
+                batch = {}
+                pending = 0
+    except (ValueError, csv.Error) as e:
+        # Rows applied before the failure are kept, like a partial run of POST /grades calls
+        return {"success": False, "message": str(e), "rows": rows, "imported": imported}
+
+    if batch:
+        _apply_grades(batch)
+        imported += pending
+
+    seconds = time.perf_counter() - start
+    return {
+        "success": True,
+        "rows": rows,
+        "imported": imported,
+        "error_count": error_count,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None
+    }
+
+
+# Batch grade operations
+
+
+BATCH_MAX_OPERATIONS = 10000   # Operations accepted by one applyGradeOperations call
+
+
+def _batch_number(value, field):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{field} must be a finite number")
+    return value
+
+
+def _parse_operation(operation):
+    """Check one batch operation's shape and return it as (kind, name, subject, values, new).
+
+    kind is "add", "remove", "replace" (one grade, `values[0]`, becomes `new`)
+    or "set" (a "replace" given the subject's whole grade list).
+    """
+    if not isinstance(operation, dict):
+        raise ValueError("operation must be an object")
+    kind = operation.get("op")
+    if kind not in ("add", "remove", "replace"):
+        raise ValueError("op must be 'add', 'remove' or 'replace'")
+    name, subject = operation.get("name"), operation.get("subject")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("name is required")
+    if not isinstance(subject, str) or not subject.strip():
+        raise ValueError("subject is required")
+    name, subject = normalize_name(name), normalize_subject(subject)
+
+    if kind == "replace" and "grades" in operation:
+        kind = "set"
+    elif kind == "replace":
+        if "grade" not in operation or "new" not in operation:
+            raise ValueError("replace needs 'grade' and 'new', or the whole 'grades' list")
+        return kind, name, subject, [_batch_number(operation["grade"], "grade")], _batch_number(operation["new"], "new")
+
+    values = operation.get("grades", operation.get("grade"))
+    if values is None:
+        raise ValueError(f"{kind} needs 'grades' or 'grade'")
+    if not isinstance(values, list):
+        values = [values]
+    if kind != "set" and not values:
+        raise ValueError("grades must not be empty")
+    return kind, name, subject, [_batch_number(value, "grade") for value in values], None
+
+
+def _apply_operation(work, kind, name, subject, values, new):
+    """Apply one parsed operation to `work`, { (name, subject): [grades] }, reading missing pairs from `students`."""
+    key = (name, subject)
+    if key not in work:
+        record = students.get(name)
+        if record is None and kind in ("remove", "replace"):
+            raise ValueError(f"Student '{name}' not found.")
+        work[key] = list(record[subject]) if record is not None and subject in record else None
+    grades = work[key]
+    if grades is None and kind in ("remove", "replace"):
+        raise ValueError(f"{name} is not taking the subject '{subject}'.")
+
+    if kind == "set":
+        grades = list(values)
+    elif kind == "add":
+        grades = (grades or []) + values
+    else:
+        grades = list(grades)
+        for value in values:
+            if value not in grades:
+                raise ValueError(f"The grade {value} does not exist in {subject} for {name}.")
+            if kind == "remove":
+                grades.remove(value)
+            else:
+                grades[grades.index(value)] = new
+    work[key] = grades
+    return grades
+
+
+@metrics.timed("applyGradeOperations")
+def applyGradeOperations(operations):
+    """Apply a list of add/remove/replace operations all together, or none of them.
+
+    Every operation is checked first; then they are applied in order to working
+    copies of the pairs they touch, so later operations see earlier ones. If any
+    fails, nothing changes. Otherwise the touched students are published together
+    and the storage backend records the batch as one change. Saving is left to
+    the caller, once for the whole batch.
+    """
+    if not isinstance(operations, list) or not operations:
+        return {"success": False, "message": "operations must be a non-empty list", "applied": 0, "results": []}
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return {"success": False, "message": f"At most {BATCH_MAX_OPERATIONS} operations per batch",
+                "applied": 0, "results": []}
+
+    parsed, results = [], []
+    for index, operation in enumerate(operations):
+        try:
+            parsed.append(_parse_operation(operation))
+            results.append({"index": index, "success": True})
+        except ValueError as e:
+            parsed.append(None)
+            results.append({"index": index, "success": False, "message": str(e)})
+
+    work = {}
+    if all(operation is not None for operation in parsed):
+        with _changing():
+            for index, operation in enumerate(parsed):
+                kind, name, subject = operation[:3]
+                results[index].update(op=kind if kind != "set" else "replace", name=name, subject=subject)
+                try:
+                    results[index]["grades"] = plain_grades(_apply_operation(work, *operation))
+                except ValueError as e:
+                    results[index].update(success=False, message=str(e))
+
+            if all(result["success"] for result in results):
+                by_student = {}
+                for (name, subject), grades in work.items():
+                    by_student.setdefault(name, {})[subject] = grades
+                changed = {}
+                for name, subjects in by_student.items():
+                    record = students.get(name, EMPTY_RECORD)
+                    for subject, grades in subjects.items():
+                        _retrack_pair(record, name, subject, grades)
+                    changed[name] = record.with_subjects(subjects)
+                students.update(changed)
+                _index_names(changed)
+                _bump_version(names=changed, subjects={subject for _, subject in work})
+                for name in changed:
+                    _update_rank(name)
+                get_storage().record_changes([("set_grade", name, subject, plain_grades(grades))
+                                              for (name, subject), grades in work.items()])
+                return {"success": True, "applied": len(parsed), "results": results}
+            if SHARED_STORE:
+                get_storage().save()  # nothing was recorded; let the other processes write again
+
+    failed = sum(1 for result in results if not result["success"])
+    for result in results:
+        if result["success"]:
+            result.pop("grades", None)
+            result.update(success=False, message="Not applied: another operation in the batch failed.")
+    return {"success": False, "message": f"{failed} of {len(parsed)} operations failed; nothing was changed.",
+            "applied": 0, "results": results}
+
+
+# Class and term shards
+
+
+def class_store():
+    """Return the store of class shards, opening it on first use."""
+    global _class_store
+    if _class_store is None:
+        _class_store = classes.ClassStore(CLASSES_FOLDER)
+    return _class_store
+
+
+def _class_error(error, message):
+    """A failed class result; `error` is "invalid", "not_found", "exists" or "frozen"."""
+    return {"success": False, "error": error, "message": message}
+
+
+def listClasses():
+    return {"success": True, "classes": class_store().classes()}
+
+
+def createClass(class_id, class_name=None, term=None):
+    if not isinstance(class_id, str) or not classes.CLASS_ID.fullmatch(class_id):
+        return _class_error("invalid", "Class id must be 1-64 letters, digits, '_' or '-', and not 'index'")
+    if not class_store().create(class_id, class_name, term):
+        return _class_error("exists", f"Class '{class_id}' already exists.")
+    return {"success": True, "message": f"Class '{class_id}' created.", "class_id": class_id}
+
+
+def _class_shard(class_id, change=False):
+    """Return (shard, None), or (None, error result) for a missing class or a change to a frozen one."""
+    shard = class_store().get(class_id)
+    if shard is None:
+        return None, _class_error("not_found", f"Class '{class_id}' not found.")
+    if change and shard.frozen:
+        return None, _class_error("frozen", f"Class '{class_id}' is frozen.")
+    return shard, None
+
+
+def _frozen_since(shard):
+    """The error result for a change to a shard frozen after _class_shard returned it, or None.
+
+    Called with the shard's lock held.
+    """
+    if shard.frozen:
+        return _class_error("frozen", f"Class '{shard.id}' is frozen.")
+    return None
+
+
+def _save_shard(shard, joined=(), left=()):
+    written = class_store().save(shard, joined, left)
+    metrics.add("bytes_written_total", written, target="class_shard")
+
+
+def addClassStudent(class_id, name):
+    name = normalize_name(name)
+    shard, error = _class_shard(class_id, change=True)
+    if error:
+        return error
+    with shard.lock:
+        error = _frozen_since(shard)
+        if error:
+            return error
+        if not shard.add_student(name):
+            return _class_error("exists", f"The student '{name}' is already in {class_id}.")
+        _save_shard(shard, joined=[name])
+    return {"success": True, "message": f"Student '{name}' added to {class_id}."}
+
+
+def setClassGrade(class_id, name, subject, grade):
+    name = normalize_name(name)
+    subject = normalize_subject(subject)
+    grades = grade if isinstance(grade, list) else [grade]
+    if not all(isinstance(g, (int, float)) for g in grades):
+        return _class_error("invalid", "Grades must be numbers")
+    shard, error = _class_shard(class_id, change=True)
+    if error:
+        return error
+    with shard.lock:
+        error = _frozen_since(shard)
+        if error:
+            return error
+        joined = [name] if shard.record(name) is None else []
+        shard.add_grades(name, subject, grades)
+        _save_shard(shard, joined=joined)
+    return {"success": True, "message": f"Grades added for {name} in {subject} ({class_id})"}
+
+
+def removeClassGrade(class_id, name, subject, grade):
+    name = normalize_name(name)
+    subject = normalize_subject(subject)
+    if not isinstance(grade, (int, float)):
+        return _class_error("invalid", "Grade must be a number")
+    shard, error = _class_shard(class_id, change=True)
+    if error:
+        return error
+    with shard.lock:
+        error = _frozen_since(shard)
+        if error:
+            return error
+        problem = shard.remove_grade(name, subject, grade)
+        if problem:
+            return _class_error("not_found", problem)
+        _save_shard(shard)
+    return {"success": True, "message": f"Grade {grade} removed for {name} in {subject} ({class_id})"}
+
+
+def removeClassStudent(class_id, name):
+    name = normalize_name(name)
+    shard, error = _class_shard(class_id, change=True)
+    if error:
+        return error
+    with shard.lock:
+        error = _frozen_since(shard)
+        if error:
+            return error
+        if not shard.remove_student(name):
+            return _class_error("not_found", f"Student '{name}' not found in {class_id}.")
+        _save_shard(shard, left=[name])
+    return {"success": True, "message": f"{name} has been removed from {class_id}."}
+
+
+def _shard_report(shard, name):
+    """getStudentReport's report of one student in a shard, or None; called with the shard's lock held."""
+    record = shard.record(name)
+    if record is None:
+        return None
+    report = {"name": name, "subjects": {}, "overall_average": None, "overall_letter": None}
+    for subject, grades in record.items():
+        grades = numeric_grades(grades)
+        if grades:
+            avg = sum(grades) / len(grades)
+            report["subjects"][subject] = {"grades": list(grades), "average": avg, "letter": letter_grade(avg)}
+    overall_avg = shard.average(name)
+    if overall_avg is not None:
+        report["overall_average"] = overall_avg
+        report["overall_letter"] = letter_grade(overall_avg)
+    return report
 
 
+def getClassStudentReport(class_id, name):
+    name = normalize_name(name)
+    shard, error = _class_shard(class_id)
+    if error:
+        return error
+    with shard.lock:
+        report = _shard_report(shard, name)
+    if report is None:
+        return _class_error("not_found", f"Student '{name}' not found in {class_id}.")
+    return {"success": True, "class_id": class_id, **report}
+
+
+@metrics.timed("getClassRankings")
+def getClassRankings(class_id, limit=None, offset=0):
+    shard, error = _class_shard(class_id)
+    if error:
+        return error
+    with shard.lock:
+        total, page, rank = shard.ranking(max(0, offset), limit)
+    if not total:
+        return _class_error("not_found", f"No students with grades to rank in {class_id}.")
+    rankings = _format_rankings(page, start=offset, rank=rank, prev_avg=page[0][1]) if page else []
+    return {"success": True, "class_id": class_id, "total": total, "offset": offset, "rankings": rankings}
+
+
+def getClassSubjectAverage(class_id, subject):
+    subject = normalize_subject(subject)
+    shard, error = _class_shard(class_id)
+    if error:
+        return error
+    with shard.lock:
+        avg = shard.subject_average(subject)
+    if avg is None:
+        return _class_error("not_found", f"No grades found for {subject} in {class_id}")
+    return {"success": True, "class_id": class_id, "subject": subject, "average": round(avg, 2),
+            "letter": letter_grade(avg)}
+
+
+def freezeClass(class_id):
+    """Close a class: its averages and ranking are computed once and it takes no more changes."""
+    shard, error = _class_shard(class_id)
+    if error:
+        return error
+    if shard.frozen:
+        return _class_error("frozen", f"Class '{class_id}' is already frozen.")
+    class_store().freeze(class_id)
+    return {"success": True, "message": f"Class '{class_id}' is frozen."}
+
+
+@metrics.timed("getTranscript")
+def getTranscript(name):
+    """A student's reports from the main roster and every class holding them.
+
+    The classes come from the shard index, so only the shards the student is in are read.
+    """
+    name = normalize_name(name)
+    entries = []
+    total, count = 0, 0
+    with store_lock:
+        report = getStudentReport(name)
+        entry = student_totals.get(name)
+    if report["success"]:
+        del report["success"], report["name"]
+        entries.append({"class_id": None, **report})
+        if entry:
+            total, count = total + entry[0], count + entry[1]
+    store = class_store()
+    for class_id in store.classes_of(name):
+        shard = store.get(class_id)
+        info = store.info(class_id)
+        with shard.lock:
+            report = _shard_report(shard, name)
+            entry = shard.totals(name)
+        if report is None:
+            continue
+        del report["name"]
+        entries.append({"class_id": class_id, "class": info["class"], "term": info["term"],
+                        "frozen": shard.frozen, **report})
+        if entry:
+            total, count = total + entry[0], count + entry[1]
+    if not entries:
+        return _class_error("not_found", f"Student '{name}' not found.")
+    overall_avg = total / count if count else None
+    return {
+        "success": True,
+        "name": name,
+        "classes": entries,
+        "overall_average": overall_avg,
+        "overall_letter": letter_grade(overall_avg) if overall_avg is not None else None,
+    }
+
+
+# Scan-based reference implementations
+# These recompute everything from the raw grade lists. They are slow on large
+# rosters but make a handy oracle when checking the running aggregates.
+
+
+def scanStudentReport(name):
+    name = normalize_name(name)
+    student_data = students.get(name)
+    if student_data is None:
+        return {"success": False, "message": f"Student '{name}' not found."}
+
+    report = {
+        "name": name,
+        "subjects": {},
+        "overall_average": None,
+        "overall_letter": None
+    }
+
+    all_grades = []
+
+    for subject, grades_list in student_data.items():
+        # Filter numeric grades
+        grades = [g for g in grades_list if isinstance(g, (int, float))]
+        if not grades:
+            continue
+        subject_avg = sum(grades) / len(grades)
+        all_grades.extend(grades)
+        report["subjects"][subject] = {
+            "grades": plain_grades(grades),
+            "average": subject_avg,
+            "letter": letter_grade(subject_avg)
+        }
+
+    if all_grades:
+        overall_avg = sum(all_grades) / len(all_grades)
+        report["overall_average"] = overall_avg
+        report["overall_letter"] = letter_grade(overall_avg)
+
+    report["success"] = True
+    return report
+
+
+def scanSubjectAverage(subject):
+    subject = normalize_subject(subject)
+    all_grades = []
+
+    for record in snapshot_students().values():
+        grades = [g for g in record.get(subject, []) if isinstance(g, (int, float))]
+        all_grades.extend(grades)
+
+    if not all_grades:
+        return {"success": False, "message": f"No grades found for {subject}"}
 
+    avg = sum(all_grades) / len(all_grades)
+    return {"success": True, "subject": subject, "average": round(avg, 2), "letter": letter_grade(avg)}
 
 
-def getRankings():
+def scanRankings():
     student_averages = {}
-    for student, subjects in students.items():
+    for student, subjects in snapshot_students().items():
         all_grades = []
         for grades in subjects.values():
             all_grades.extend([g for g in grades if isinstance(g, (int, float))])
@@ -290,61 +1464,282 @@ def getRankings():
         return {"success": False, "message": "No students with grades to rank."}
 
     # Sort students by average descending
-    sorted_students = sorted(student_averages.items(), key=lambda x: x[1], reverse=True)
+    sorted_students = sorted(student_averages.items(), key=lambda x: (-x[1], x[0]))
 
-    rankings = []
-    rank = 1
-    prev_avg = None
+    return {"success": True, "rankings": _format_rankings(sorted_students)}
 
-    for i, (student, avg) in enumerate(sorted_students):
-        if prev_avg is not None and avg == prev_avg:
-            pass  # same rank
+
+# Save & Load
+
+
+class JSONFileStorage:
+    """Keeps students in FILENAME, written according to PERSISTENCE_MODE.
+
+    Every storage backend has the same methods: load() returns the students dict,
+    record_change() is told about each change as it is made (with the full grade
+    list of the pair it touched), record_changes() about several that must be kept
+    or lost together, save() makes the changes durable, and totals_for() may
+    return precomputed aggregates for the dict load() returned.
+    """
+
+    def load(self):
+        return _load_json_data()
+
+    def record_change(self, op, name, subject=None, grades=None):
+        _journal_change(op, name, subject, grades)
+
+    def record_changes(self, changes):
+        _journal_changes(changes)
+
+    def save(self, students_dict, create_backup=True):
+        _save_json_data(students_dict, create_backup)
+
+    def totals_for(self, data):
+        if isinstance(data, lazyload.LazyRoster):
+            return ({},) + data.totals()
+        return None
+
+
+def get_storage():
+    """Return the storage backend picked by STORAGE_BACKEND, opening it on first use."""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "sqlite":
+            _storage = SQLiteStorage(SQLITE_FILENAME, shared=SHARED_STORE)
+            atexit.register(_storage.close)
         else:
-            rank = i + 1
-        rankings.append({
-            "rank": rank,
-            "name": student,
-            "average": round(avg, 2),
-            "letter": letter_grade(avg)
-        })
-        prev_avg = avg
+            _storage = JSONFileStorage()
+    return _storage
 
-    return {"success": True, "rankings": rankings}
 
+def _record(op, name, subject=None):
+    """Pass a change to the storage backend; called with store_lock held."""
+    grades = None if subject is None else plain_grades(students[name][subject])
+    get_storage().record_change(op, name, subject, grades)
 
-# Save & Load
 
+def _journal_record(op, name, subject=None, grades=None):
+    record = {"op": op, "name": name}
+    if subject is not None:
+        record["subject"] = subject
+        record["grades"] = grades
+    return record
 
-def save_data(students_dict, create_backup=True):
-    if create_backup and not os.path.exists(BACKUP_FOLDER):
-        os.makedirs(BACKUP_FOLDER)
-    if create_backup and os.path.exists(FILENAME):
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = os.path.join(BACKUP_FOLDER, f"students_backup_{timestamp}.json")
+
+def _journal_change(op, name, subject=None, grades=None):
+    """Append a change to the journal when running in journal mode."""
+    _journal_append(_journal_record(op, name, subject, grades))
+
+
+def _journal_changes(changes):
+    """Append (op, name, subject, grades) changes as one "batch" record, so they replay all or none."""
+    _journal_append({"op": "batch", "changes": [_journal_record(*change) for change in changes]}, len(changes))
+
+
+def _journal_append(record, count=1):
+    global _journal_records
+    if PERSISTENCE_MODE != "journal":
+        return
+    with _journal_lock:
+        written = journal.append_record(JOURNAL_FILENAME, record)
+        _journal_records += count
+    metrics.add("bytes_written_total", written, target="journal")
+
+
+def backup_store():
+    """Return the backup snapshot store, opening it on first use."""
+    global _backup_store
+    if _backup_store is None:
+        _backup_store = backups.BackupStore(
+            BACKUP_FOLDER,
+            retention=BACKUP_RETENTION,
+            interval=BACKUP_INTERVAL,
+            full_every=BACKUP_FULL_EVERY,
+        )
+    return _backup_store
+
+
+def _backup_data(students_dict):
+    try:
+        entry = backup_store().snapshot(students_dict)
+        if entry is not None:
+            metrics.add("bytes_written_total", entry["size"], target="backup")
+            print(f"Backup created: {entry['taken']} ({entry['kind']} snapshot)")
+    except Exception as e:
+        print(f"Warning: Backup could not be created. {e}")
+
+
+def restore_backup(when=None):
+    """Replace the current data with the newest backup taken at or before `when`.
+
+    `when` is a datetime, a Unix timestamp or an ISO 8601 string; None means the newest backup.
+    """
+    data = backup_store().restore(when)
+    storage = get_storage()
+    if isinstance(storage, SQLiteStorage):
+        storage.import_students(data)
+    reset_students(data)
+    if isinstance(storage, SQLiteStorage):
+        save_data(students)
+    else:
+        # Written in full whatever PERSISTENCE_MODE says: the old data file and
+        # journal would otherwise bring back the data from before the restore
+        _write_data_file(students)
+    print(f"Restored {len(data)} students from the backup taken at or before {when or 'the newest backup'}.")
+
+
+@metrics.timed("write_data_file")
+def _write_data_file(students_dict, create_backup=True):
+    # One writer at a time; the temp file and rename keep FILENAME whole if we crash mid-write
+    with _save_lock:
+        if students_dict is students:
+            students_dict = snapshot_students()
         try:
-            with open(FILENAME, "r") as f:
-                data = f.read()
-            with open(backup_file, "w") as f:
-                f.write(data)
-            print(f"Backup created: {backup_file}")
+            if LAZY_LOAD:
+                # Unchanged students are copied from the old file as bytes, and the index is rewritten
+                source = _write_lazy_data(students_dict)
+                if isinstance(students_dict, lazyload.LazyRoster):
+                    students.rebase(students_dict, source)
+                written = os.path.getsize(FILENAME)
+            else:
+                payload = serializer.dumps_bytes(students_dict)
+                tmp_path = FILENAME + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, FILENAME)
+                written = len(payload)
+            metrics.add("bytes_written_total", written, target="data_file")
+            if SNAPSHOT_LOAD:
+                metrics.add("bytes_written_total", os.path.getsize(SNAPSHOT_FILENAME), target="snapshot")
+            print(f"Student data saved successfully to {FILENAME}.")
         except Exception as e:
-            print(f"Warning: Backup could not be created. {e}")
+            print(f"Error saving data: {e}")
+            raise
+        # The full file now holds everything a leftover journal would replay
+        for path in (JOURNAL_FILENAME + ".compacting", JOURNAL_FILENAME):
+            if os.path.exists(path):
+                os.remove(path)
+        if create_backup:
+            _backup_data(students_dict)
+
+
+def save_worker():
+    """Return the "batched" mode persistence worker, starting it on first use."""
+    global _save_worker
+    with _save_lock:
+        if _save_worker is None:
+            _save_worker = PersistenceWorker(
+                lambda: _write_data_file(students),
+                window=SAVE_WINDOW,
+                max_batch=SAVE_BATCH,
+            )
+            atexit.register(_save_worker.stop)
+    return _save_worker
+
+
+@metrics.timed("save_data")
+def save_data(students_dict, create_backup=True):
+    get_storage().save(students_dict, create_backup)
+
+
+def _save_json_data(students_dict, create_backup=True):
+    if PERSISTENCE_MODE == "journal":
+        # Every change is already on disk in the journal
+        if _journal_records >= COMPACT_EVERY:
+            compact_in_background()
+        return
+    if PERSISTENCE_MODE == "batched" and students_dict is students:
+        save_worker().notify(wait=SAVE_WAIT)
+        return
+
+    _write_data_file(students_dict, create_backup)
+
+
+@metrics.timed("compact_journal")
+def compact_journal():
+    """Fold the journal into FILENAME and start a fresh journal."""
+    global _journal_records
+    if not _compaction_lock.acquire(blocking=False):
+        return  # another compaction is already running
     try:
-        with open(FILENAME, "w") as f:
-            json.dump(students_dict, f, indent=4)
-        print(f"Student data saved successfully to {FILENAME}.")
+        folding = JOURNAL_FILENAME + ".compacting"
+        # Changes append to the journal while holding store_lock, so with it held the
+        # rename below is a clean cut between the journal being folded and the next
+        with store_lock, _journal_lock:
+            # A leftover file from an interrupted compaction is folded first
+            if not os.path.exists(folding):
+                if not os.path.exists(JOURNAL_FILENAME):
+                    return
+                os.replace(JOURNAL_FILENAME, folding)
+                _journal_records = 0
+            # With LAZY_LOAD, `students` is FILENAME plus every journal record up to the cut
+            written = snapshot_students() if LAZY_LOAD else None
+
+        if LAZY_LOAD:
+            # Written like _write_data_file does, so `students` moves onto the new file
+            # and index, dropping the changed records it held in memory and the old mapping
+            count = sum(1 for _ in journal.read_records(folding))
+            with _save_lock:
+                source = _write_lazy_data(written)
+                students.rebase(written, source)
+            data = written
+        else:
+            # Read FILENAME strictly: folding into an unreadable file would lose data
+            data = {}
+            if os.path.exists(FILENAME):
+                with open(FILENAME, "r") as f:
+                    data = records.load_json(f)
+            count = journal.replay(data, folding)
+            journal.write_snapshot(FILENAME, data)
+        os.remove(folding)
+        metrics.add("bytes_written_total", os.path.getsize(FILENAME), target="data_file")
+        _backup_data(data)
+        print(f"Folded {count} journal records into {FILENAME}.")
     except Exception as e:
-        print(f"Error saving data: {e}")
+        print(f"Error compacting journal: {e}")
+    finally:
+        _compaction_lock.release()
 
 
+def compact_in_background():
+    """Run compact_journal on a daemon thread and return the thread."""
+    thread = threading.Thread(target=compact_journal, daemon=True)
+    thread.start()
+    return thread
 
-def load_data():
-    if not os.path.exists(FILENAME):
+
+
+def _open_lazy_data(resident_max):
+    """Open FILENAME as a LazyRoster, through its snapshot with SNAPSHOT_LOAD."""
+    if SNAPSHOT_LOAD:
+        return snapshot.open_roster(FILENAME, SNAPSHOT_FILENAME, resident_max=resident_max)
+    return lazyload.open_roster(FILENAME, resident_max=resident_max)
+
+
+def _write_lazy_data(data):
+    """Write FILENAME and its index (and snapshot, with SNAPSHOT_LOAD); return the new source for `data`."""
+    source = lazyload.write_data_file(FILENAME, data)
+    if SNAPSHOT_LOAD:
+        try:
+            # Unchanged students come out of the old snapshot without any JSON parsing
+            return snapshot.write_snapshot(SNAPSHOT_FILENAME, data.items(), FILENAME)
+        except ValueError as e:
+            print(f"Snapshot not written: {e}")
+    return source
+
+
+def _read_data_file():
+    if not os.path.exists(FILENAME) and not (SNAPSHOT_LOAD and os.path.exists(SNAPSHOT_FILENAME)):
         print(f"No saved data found. Starting with empty record.")
         return {}
     try:
-        with open(FILENAME, "r") as f:
-            data = json.load(f)
+        if LAZY_LOAD:
+            data = _open_lazy_data(resident_max=RESIDENT_STUDENTS)
+        else:
+            with open(FILENAME, "r") as f:
+                data = records.load_json(f)
         print(f"Student data loaded successfully from {FILENAME}.")
         return data
     except json.JSONDecodeError:
@@ -355,12 +1750,30 @@ def load_data():
         return {}
 
 
+@metrics.timed("load_data")
+def load_data():
+    return get_storage().load()
+
+
+def _load_json_data():
+    global _journal_records
+    data = _read_data_file()
+    # Replay changes that were journaled after FILENAME was last written
+    count = 0
+    for path in (JOURNAL_FILENAME + ".compacting", JOURNAL_FILENAME):
+        count += journal.replay(data, path)
+    with _journal_lock:
+        _journal_records = count  # they count towards the next compaction like new ones
+    if count:
+        print(f"Replayed {count} journal records.")
+    return data
+
+
 # Menu-driven interface
 # -------------------------------
 
 def main_menu():
-    global students
-    students = load_data()
+    reset_students(load_data())
 
     while True:
         print("\n" + "="*50)
@@ -435,10 +1848,17 @@ def main_menu():
         elif choice == 9:
             rank_students()
         elif choice == 10:
-            save_data(students)
+            try:
+                save_data(students)
+            except Exception:
+                pass  # the error has been printed; the data is still in memory
         elif choice == 11:
             print("Saving data before exiting...")
-            save_data(students)
+            try:
+                save_data(students)
+            except Exception:
+                print("The data could not be saved, so the program keeps running.")
+                continue
             print("Goodbye!")
             break
 
@@ -0,0 +1,81 @@
+import json
+import os
+
+import serializer
+from records import EMPTY_RECORD
+
+# Append-only journal of student data mutations.
+# One compact JSON record per line, for example:
+#   {"op":"set_grade","name":"Ann Lee","subject":"Math","grades":[90,85]}
+# Grade records carry the full grade list for the (student, subject) pair after
+# the change, so replaying a record twice leaves the data unchanged.
+# A "batch" record holds several such records under "changes"; it is one line,
+# so a crash keeps either all of them or none.
+
+
+def append_record(path, record):
+    """Append one record to the journal, fsync it to disk and return the bytes written."""
+    line = (serializer.dumps(record) + "\n").encode("utf-8")
+    with open(path, "a+b") as f:
+        # After a crash mid-append the last line is torn; start a new line rather
+        # than join this record onto it, where both would be skipped on replay
+        end = f.seek(0, os.SEEK_END)
+        if end:
+            f.seek(end - 1)
+            if f.read(1) != b"\n":
+                line = b"\n" + line
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    return len(line)
+
+
+def read_records(path):
+    """Yield the records stored in a journal file, skipping a torn final line."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Warning: skipping unreadable journal record {line_no} in {path}.")
+
+
+def apply_record(data, record):
+    """Apply one journal record to a { name: StudentRecord } dict."""
+    op = record.get("op")
+    name = record.get("name")
+    if op == "batch":
+        for change in record["changes"]:
+            apply_record(data, change)
+    elif op == "add_student":
+        data.setdefault(name, EMPTY_RECORD)
+    elif op in ("set_grade", "remove_grade"):
+        data[name] = data.get(name, EMPTY_RECORD).with_subject(record["subject"], record["grades"])
+    elif op == "remove_student":
+        data.pop(name, None)
+    else:
+        print(f"Warning: unknown journal operation {op!r} ignored.")
+
+
+def replay(data, path):
+    """Apply every record in a journal file to `data` and return the record count."""
+    count = 0
+    for record in read_records(path):
+        apply_record(data, record)
+        count += 1
+    return count
+
+
+def write_snapshot(path, data):
+    """Write `data` as JSON to `path` atomically (temp file, fsync, rename)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(serializer.dumps_bytes(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,308 @@
+import json
+import mmap
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+import records
+import serializer
+from records import StudentRecord
+
+# Lazy loading of the JSON data file (GRADING_LOAD=lazy).
+# The data file is written as compact JSON, one student after another, and next to
+# it goes an index file (<data file>.idx) holding each student's byte span in the
+# data file and their grade totals. At startup only the index is read; a student's
+# record is parsed from the memory-mapped data file the first time it is used.
+#
+# Index layout:
+#   line 1  JSON header: format, data file size and mtime, student count, subject totals
+#   line 2  JSON list of student names, in data file order
+#   then    offsets and lengths (array "q"), grade sums (array "d") and grade counts
+#           (array "q"), `count` items each, in native byte order
+# An index whose header does not match the data file is ignored and rebuilt.
+
+INDEX_FORMAT = 1
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+def _grade_totals(record):
+    """Return { subject: (sum, count) } over a record's numeric grades."""
+    totals = {}
+    for subject, grades in record.items():
+        if grades:
+            totals[subject] = (sum(grades), len(grades))
+    return totals
+
+
+def _bump(table, key, total, count):
+    old_total, old_count = table.get(key, (0, 0))
+    if old_count + count <= 0:
+        table.pop(key, None)
+    else:
+        table[key] = (old_total + total, old_count + count)
+
+
+class DataFile:
+    """A memory-mapped data file and its index."""
+
+    def __init__(self, path, names, offsets, lengths, sums, counts, subject_totals):
+        self.path = path
+        self.names = names
+        self.offsets = offsets
+        self.lengths = lengths
+        self.sums = sums
+        self.counts = counts
+        self.subject_totals = subject_totals
+        with open(path, "rb") as f:
+            # The mapping outlives the file object, and keeps the old contents
+            # readable after the file is replaced by a newer save
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def raw(self, i):
+        """Return student i's record as it appears in the data file."""
+        offset = self.offsets[i]
+        return self.map[offset:offset + self.lengths[i]]
+
+    def record(self, i):
+        return StudentRecord.from_dict(json.loads(self.raw(i)))
+
+
+def open_data_file(path):
+    """Open an indexed data file, or return None when its index is missing or stale."""
+    try:
+        stat = os.stat(path)
+        with open(index_path(path), "rb") as f:
+            header = json.loads(f.readline())
+            if (header.get("format") != INDEX_FORMAT
+                    or header["data_size"] != stat.st_size
+                    or header["data_mtime_ns"] != stat.st_mtime_ns):
+                return None
+            names = json.loads(f.readline())
+            count = header["count"]
+            columns = [array("q"), array("q"), array("d"), array("q")]
+            for column in columns:
+                column.fromfile(f, count)
+    except (OSError, ValueError, KeyError, EOFError):
+        return None
+    subject_totals = {subject: tuple(total) for subject, total in header["subjects"].items()}
+    return DataFile(path, names, *columns, subject_totals)
+
+
+def write_data_file(path, data, totals=None):
+    """Write `data` to `path` and its index, each atomically, and return the opened DataFile.
+
+    `data` is a { name: record } dict or a LazyRoster; records unchanged since the
+    roster's file was read are copied across as bytes. `totals` is the
+    (student_totals, subject_totals) pair for `data` when the caller already has it.
+    """
+    if totals is None:
+        totals = data.totals() if isinstance(data, LazyRoster) else roster_totals(data)
+    student_totals, subject_totals = totals
+    if isinstance(data, LazyRoster):
+        items = data.encoded_items()
+    else:
+        items = ((name, serializer.dumps_bytes(record)) for name, record in data.items())
+
+    names = []
+    offsets, lengths, sums, counts = array("q"), array("q"), array("d"), array("q")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"{")
+        position = 1
+        for name, body in items:
+            key = serializer.dumps_bytes(name) + b":"
+            if names:
+                key = b"," + key
+            f.write(key)
+            f.write(body)
+            names.append(name)
+            offsets.append(position + len(key))
+            lengths.append(len(body))
+            total, count = student_totals.get(name, (0.0, 0))
+            sums.append(total)
+            counts.append(count)
+            position += len(key) + len(body)
+        f.write(b"}")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    stat = os.stat(path)
+    header = {
+        "format": INDEX_FORMAT,
+        "data_size": stat.st_size,
+        "data_mtime_ns": stat.st_mtime_ns,
+        "count": len(names),
+        "subjects": subject_totals,
+    }
+    tmp_path = index_path(path) + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(json.dumps(header).encode("utf-8") + b"\n")
+        f.write(json.dumps(names).encode("utf-8") + b"\n")
+        for column in (offsets, lengths, sums, counts):
+            column.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, index_path(path))
+    return DataFile(path, names, offsets, lengths, sums, counts, subject_totals)
+
+
+def index_data_file(path):
+    """Read a data file the slow way once, and rewrite it with an index."""
+    with open(path, "r") as f:
+        data = records.load_json(f)
+    return write_data_file(path, data)
+
+
+def roster_totals(data):
+    """Return (student_totals, subject_totals) for a { name: record } dict."""
+    student_totals, subject_totals = {}, {}
+    for name, record in data.items():
+        for subject, (total, count) in _grade_totals(record).items():
+            _bump(student_totals, name, total, count)
+            _bump(subject_totals, subject, total, count)
+    return student_totals, subject_totals
+
+
+class LazyRoster(MutableMapping):
+    """A { name: StudentRecord } mapping backed by an indexed data file.
+
+    Students read from the file are cached in a bounded LRU of `resident_max`
+    records; students changed since the file was written are held in memory
+    until the next write_data_file and rebase.
+    """
+
+    def __init__(self, source=None, lock=None, resident_max=10000):
+        self._source = source
+        self._lock = lock if lock is not None else threading.RLock()
+        self.resident_max = resident_max
+        # name -> position in _source (unchanged) or StudentRecord (changed or new)
+        self._names = {} if source is None else dict(zip(source.names, range(len(source.names))))
+        self._resident = OrderedDict()
+        self.loads = 0
+
+    def __getitem__(self, name):
+        with self._lock:
+            value = self._names[name]
+            if not isinstance(value, int):
+                return value
+            record = self._resident.get(name)
+            if record is not None:
+                self._resident.move_to_end(name)
+                return record
+            record = self._source.record(value)
+            self.loads += 1
+            if self.resident_max:
+                self._resident[name] = record
+                while len(self._resident) > self.resident_max:
+                    self._resident.popitem(last=False)
+            return record
+
+    def __setitem__(self, name, record):
+        with self._lock:
+            self._names[name] = record
+            self._resident.pop(name, None)
+
+    def __delitem__(self, name):
+        with self._lock:
+            del self._names[name]
+            self._resident.pop(name, None)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+            self._resident.clear()
+            self._source = None
+
+    def copy(self):
+        """Return a snapshot that shares the data file but not the resident set."""
+        with self._lock:
+            snapshot = LazyRoster(lock=threading.RLock(), resident_max=0)
+            snapshot._source = self._source
+            snapshot._names = self._names.copy()
+        return snapshot
+
+    def encoded_items(self):
+        """Yield (name, record as JSON bytes); unchanged records come straight from the data file."""
+        for name, value in self._names.items():
+            if isinstance(value, int):
+                yield name, self._source.raw(value)
+            else:
+                yield name, serializer.dumps_bytes(value)
+
+    def adopt(self, other):
+        """Take over another roster's file and contents (used when reloading)."""
+        with self._lock:
+            self._source = other._source
+            self._names = other._names
+            self._resident.clear()
+
+    def rebase(self, written, source):
+        """Point students unchanged since `written` was copied at `source`, its newly written file."""
+        with self._lock:
+            if written._source is not self._source:
+                return
+            positions = dict(zip(source.names, range(len(source.names))))
+            for name, value in self._names.items():
+                old = written._names.get(name)
+                if old is None or not (value is old or (type(value) is int and value == old)):
+                    continue  # changed again since the snapshot
+                if not isinstance(value, int):
+                    self._resident[name] = value
+                self._names[name] = positions[name]
+            while len(self._resident) > self.resident_max:
+                self._resident.popitem(last=False)
+            self._source = source
+
+    def totals(self):
+        """Return (student_totals, subject_totals) for the current contents.
+
+        Comes from the index, parsing only students changed or removed since the file was written.
+        """
+        source = self._source
+        student_totals = {}
+        subject_totals = dict(source.subject_totals) if source is not None else {}
+        present = set()
+        changed = []
+        for name, value in self._names.items():
+            if isinstance(value, int):
+                present.add(value)
+                if source.counts[value]:
+                    student_totals[name] = (source.sums[value], source.counts[value])
+            else:
+                changed.append((name, value))
+        if source is not None and len(present) < len(source.names):
+            for i in range(len(source.names)):
+                if i not in present:
+                    for subject, (total, count) in _grade_totals(source.record(i)).items():
+                        _bump(subject_totals, subject, -total, -count)
+        for name, record in changed:
+            for subject, (total, count) in _grade_totals(record).items():
+                _bump(student_totals, name, total, count)
+                _bump(subject_totals, subject, total, count)
+        return student_totals, subject_totals
+
+
+def open_roster(path, lock=None, resident_max=10000):
+    """Return a LazyRoster over the data file at `path`, indexing it first if needed."""
+    if not os.path.exists(path):
+        return LazyRoster(lock=lock, resident_max=resident_max)
+    source = open_data_file(path)
+    if source is None:
+        print(f"Indexing {path} for lazy loading...")
+        source = index_data_file(path)
+    return LazyRoster(source, lock=lock, resident_max=resident_max)
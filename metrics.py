@@ -0,0 +1,266 @@
+import functools
+import heapq
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+# Opt-in instrumentation, served by app.py on GET /metrics in the Prometheus text format.
+# Nothing is recorded until enable() is called (firstProj does it when GRADING_METRICS=1);
+# while disabled, timed() functions cost one attribute check per call.
+#   histograms - request latency by route, time spent in the core functions
+#   counters   - grades scanned by the core functions, bytes written by target
+# SamplingProfiler samples the stacks of running requests and keeps the profiles of
+# the slowest ones, in the "folded" format read by flamegraph.pl and speedscope.
+
+PREFIX = "grading_"
+# Upper bounds in seconds; the last bucket (+Inf) takes everything slower
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "request_duration_seconds": "Time to serve a request, by route and status.",
+    "function_duration_seconds": "Time spent in a core function call.",
+    "grades_scanned_total": "Grades read by a core function.",
+    "bytes_written_total": "Bytes written to disk, by target.",
+}
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._histograms = {}   # (metric, labels) -> Histogram
+        self._counters = {}     # (metric, labels) -> value
+
+    def observe(self, metric, seconds, **labels):
+        """Add a duration to the histogram of `metric` with the given labels."""
+        if not self.enabled:
+            return
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def add(self, metric, value, **labels):
+        """Add `value` to the counter `metric` with the given labels."""
+        if not self.enabled or not value:
+            return
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self, gauges=()):
+        """Return everything recorded, plus `gauges` as (metric, help, value) triples, as Prometheus text."""
+        with self._lock:
+            histograms = [(key, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()]
+            counters = list(self._counters.items())
+
+        lines = []
+        seen = set()
+
+        def header(metric, kind, help_text=None):
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# HELP {PREFIX}{metric} {help_text or HELP.get(metric, metric)}")
+                lines.append(f"# TYPE {PREFIX}{metric} {kind}")
+
+        for (metric, labels), counts, total, count in sorted(histograms):
+            header(metric, "histogram")
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{PREFIX}{metric}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{PREFIX}{metric}_sum{_labels(labels)} {total!r}")
+            lines.append(f"{PREFIX}{metric}_count{_labels(labels)} {count}")
+        for (metric, labels), value in sorted(counters):
+            header(metric, "counter")
+            lines.append(f"{PREFIX}{metric}{_labels(labels)} {value}")
+        for metric, help_text, value in gauges:
+            if value is None:
+                continue
+            header(metric, "gauge", help_text)
+            lines.append(f"{PREFIX}{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+               for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+# The process-wide registry used by firstProj and app.py
+registry = Metrics()
+
+
+def enable(on=True):
+    registry.enabled = on
+
+
+def enabled():
+    return registry.enabled
+
+
+def observe(metric, seconds, **labels):
+    registry.observe(metric, seconds, **labels)
+
+
+def add(metric, value, **labels):
+    registry.add(metric, value, **labels)
+
+
+def timed(name):
+    """Decorator recording each call's duration as function_duration_seconds{function=name}."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                registry.observe("function_duration_seconds", time.perf_counter() - start, function=name)
+        return wrapper
+    return decorate
+
+
+# Sampling profiler
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads serving requests and keeps the `keep` slowest profiles.
+
+    Request handlers call start() and finish(); a background thread looks at every
+    running request's stack each `interval` seconds. A finished request that ranks
+    among the slowest so far has its profile written to `folder` as
+    "<ms>ms-<route>-<time>.folded", one "outer;...;inner count" line per stack,
+    and the profile it pushed out is deleted.
+    """
+
+    def __init__(self, folder, interval=0.005, keep=20):
+        self.folder = folder
+        self.interval = interval
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._active = {}     # thread id -> { stack: samples }
+        self._slowest = []    # heap of (seconds, path), fastest kept profile first
+        self._thread = None
+        self._stopping = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def enable(self):
+        with self._lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+
+    def disable(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._active.clear()
+        if thread is not None:
+            self._stopping.set()
+            thread.join()
+
+    def start(self):
+        """Begin sampling the calling thread; returns a token for finish(), or None when disabled."""
+        if self._thread is None:
+            return None
+        ident, samples = threading.get_ident(), {}
+        with self._lock:
+            self._active[ident] = samples
+        return ident, samples
+
+    def finish(self, token, label, seconds):
+        """Stop sampling a request and keep its profile if it is among the slowest."""
+        if token is None:
+            return None
+        ident, samples = token
+        with self._lock:
+            # The thread may have moved on to another request, whose samples are not ours
+            if self._active.get(ident) is samples:
+                del self._active[ident]
+            if not samples or (len(self._slowest) >= self.keep and seconds <= self._slowest[0][0]):
+                return None
+            path = os.path.join(self.folder, "{:.0f}ms-{}-{}.folded".format(
+                seconds * 1000, re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_"),
+                datetime.now().strftime("%Y%m%dT%H%M%S%f")))
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, (seconds, path))
+                dropped = None
+            else:
+                dropped = heapq.heapreplace(self._slowest, (seconds, path))
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(path, "w") as f:
+                for stack, count in sorted(samples.items(), key=lambda item: -item[1]):
+                    f.write(f"{stack} {count}\n")
+            if dropped is not None and os.path.exists(dropped[1]):
+                os.remove(dropped[1])
+        except OSError as e:
+            print(f"Warning: profile could not be written. {e}")
+            return None
+        return path
+
+    def profiles(self):
+        """Return the kept profiles, slowest first, as { "ms", "file" } dicts."""
+        with self._lock:
+            kept = sorted(self._slowest, reverse=True)
+        return [{"ms": round(seconds * 1000, 1), "file": path} for seconds, path in kept]
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stopping.wait(self.interval):
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            stacks = []
+            for ident, samples in active:
+                frame = frames.get(ident)
+                if frame is None or ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks.append((ident, samples, ";".join(reversed(stack))))
+            del frames
+            with self._lock:
+                # A request that finished meanwhile no longer owns its dict
+                for ident, samples, key in stacks:
+                    if self._active.get(ident) is samples:
+                        samples[key] = samples.get(key, 0) + 1
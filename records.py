@@ -0,0 +1,159 @@
+import json
+import sys
+from array import array
+from collections.abc import Mapping
+
+# Compact in-memory form of one student's grades.
+# A record behaves like the { "Subject": [grades] } dict it replaces, but keeps
+# all of a student's grades in one array('d') buffer (8 bytes per grade instead
+# of a boxed number in a list), cut into subjects by a tuple of offsets. The
+# subject-name tuple is shared between records taking the same subjects, and
+# subject names are interned. Offsets are not shared: they change with every
+# grade, so a table of them would only grow.
+
+_shared = {}
+
+
+def _share(values):
+    return _shared.setdefault(values, values)
+
+
+def plain_grades(grades):
+    """Return grades as a list, with whole numbers given back as ints."""
+    return [int(g) if isinstance(g, float) and g.is_integer() else g for g in grades]
+
+
+def _numeric(grades):
+    return [g for g in grades if isinstance(g, (int, float))]
+
+
+class StudentRecord(Mapping):
+    """One student's subjects and grades.
+
+    Records are never changed in place; with_grades, with_subject and
+    without_grade return a new record.
+    """
+
+    __slots__ = ("_subjects", "_offsets", "_grades")
+
+    def __init__(self, subjects=(), grades=()):
+        buffer = array("d")
+        offsets = [0]
+        for values in grades:
+            buffer.extend(values)
+            offsets.append(len(buffer))
+        self._subjects = _share(tuple(map(sys.intern, subjects)))
+        self._offsets = tuple(offsets)
+        self._grades = buffer
+
+    @classmethod
+    def from_dict(cls, subjects):
+        """Build a record from a { "Subject": [grades] } dict, dropping non-numeric grades."""
+        if isinstance(subjects, cls):
+            return subjects
+        return cls(subjects, [_numeric(g) for g in subjects.values()])
+
+    @classmethod
+    def from_buffer(cls, subjects, offsets, grades):
+        """Build a record around an array("d") holding every grade, subject i's at offsets[i]:offsets[i + 1]."""
+        record = cls.__new__(cls)
+        record._subjects = _share(tuple(map(sys.intern, subjects)))
+        record._offsets = tuple(offsets)
+        record._grades = grades
+        return record
+
+    def __getitem__(self, subject):
+        try:
+            i = self._subjects.index(subject)
+        except ValueError:
+            raise KeyError(subject) from None
+        return self._grades[self._offsets[i]:self._offsets[i + 1]]
+
+    def __iter__(self):
+        return iter(self._subjects)
+
+    def __len__(self):
+        return len(self._subjects)
+
+    def __contains__(self, subject):
+        return subject in self._subjects
+
+    def __eq__(self, other):
+        if isinstance(other, Mapping):
+            return self.to_dict() == {s: plain_grades(g) for s, g in other.items()}
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"StudentRecord({self.to_dict()!r})"
+
+    def to_dict(self):
+        """Return the record as a plain { "Subject": [grades] } dict."""
+        return {s: plain_grades(g) for s, g in self.items()}
+
+    def _replace(self, changes):
+        subjects = list(self._subjects)
+        offsets, buffer = self._offsets, self._grades
+        grades = [buffer[offsets[i]:offsets[i + 1]] for i in range(len(subjects))]
+        for subject, values in changes.items():
+            if subject in self._subjects:
+                grades[subjects.index(subject)] = values
+            else:
+                subjects.append(subject)
+                grades.append(values)
+        return StudentRecord(subjects, grades)
+
+    def with_subject(self, subject, grades):
+        """Return a copy where `subject` has exactly the given grades."""
+        return self._replace({subject: _numeric(grades)})
+
+    def with_subjects(self, changes):
+        """Return a copy where each subject in `changes`, a { "Subject": [grades] } dict, has exactly those grades."""
+        return self._replace({subject: _numeric(grades) for subject, grades in changes.items()})
+
+    def with_grades(self, additions):
+        """Return a copy with grades appended, given as { "Subject": [grades] }."""
+        changes = {}
+        for subject, grades in additions.items():
+            values = self[subject] if subject in self._subjects else array("d")
+            values.extend(_numeric(grades))
+            changes[subject] = values
+        return self._replace(changes)
+
+    def without_grade(self, subject, grade):
+        """Return a copy with the first matching grade removed from `subject`."""
+        values = self[subject]
+        values.remove(grade)
+        return self._replace({subject: values})
+
+
+EMPTY_RECORD = StudentRecord()
+
+
+# JSON
+
+
+def to_json(obj):
+    """`default` hook for json.dump(s) that turns records (and other mappings) into plain dicts."""
+    if isinstance(obj, StudentRecord):
+        return obj.to_dict()
+    if isinstance(obj, Mapping):
+        return dict(obj)  # e.g. a lazyload.LazyRoster
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _object_pairs(pairs):
+    # json calls this innermost first: subject dicts become records, and the
+    # outer dict (whose values are all records by then) stays a dict
+    if pairs and all(isinstance(value, StudentRecord) for _, value in pairs):
+        return {sys.intern(name): record for name, record in pairs}
+    return StudentRecord([s for s, _ in pairs], [_numeric(g) for _, g in pairs])
+
+
+def load_json(f):
+    """Read a { name: { subject: [grades] } } JSON file straight into records."""
+    data = json.load(f, object_pairs_hook=_object_pairs)
+    if isinstance(data, StudentRecord):
+        return {}  # an empty file-level object
+    return data
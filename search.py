@@ -0,0 +1,221 @@
+import heapq
+import math
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+# Name index behind GET /search: finds students from part of a name, a surname or a misspelling.
+#   prefix - sorted lists of (key, name); a query matches the keys it starts, found with
+#            bisect, so the cost follows the matches returned rather than the roster size.
+#            Full names are one list; the names from each later word on ("smith" and
+#            "ann smith" for "Mary Ann Smith") are the other, for surnames and middle names.
+#   fuzzy  - an inverted index from trigrams (of each word, padded: "  s", " sm", "smi", ...)
+#            to the names containing them. A name matches when it has at least
+#            FUZZY_MIN_SHARED of the query's trigrams.
+# Sorted lists rather than a trie: they give the same prefix walks with a fraction of the
+# memory, the way rank_index does for the rankings.
+# Keys are case-folded with runs of spaces collapsed; results hold the names as stored.
+
+FUZZY_MIN_SHARED = 0.5
+FUZZY_MAX_CANDIDATES = 10000   # Names a fuzzy search counts trigrams for, at most (roughly)
+
+
+def normalize(text):
+    return " ".join(text.casefold().split())
+
+
+def trigrams(text):
+    """The trigrams of every word of normalized `text`."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NameIndex:
+    """The index, with its own lock so searches never wait on the store's.
+
+    build() runs without the lock for most of its time: add() and remove() calls
+    made while it runs are queued and applied when it is done.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.ready = False   # built and kept in step since
+        self._names = set()
+        self._full = []      # [ (key, name) ], sorted
+        self._words = []     # [ (key from a later word, name) ], sorted
+        self._grams = {}     # { trigram: {names} }
+        self._gram_counts = {}   # { name: trigrams in the name }
+        self._building = None    # [ (add or remove, name) ] queued while build() runs
+        self._generation = 0     # bumped by clear(), so an interrupted build is thrown away
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def clear(self):
+        with self.lock:
+            self.ready = False
+            self._building = None
+            self._generation += 1
+            self._names, self._full, self._words, self._grams, self._gram_counts = set(), [], [], {}, {}
+
+    def start_build(self):
+        """Begin a build: from now on add() and remove() are queued for it. Returns the build's token.
+
+        Called with whatever lock orders changes to the names, right where the names are read.
+        """
+        with self.lock:
+            self.clear()
+            self._building = []
+            return self._generation
+
+    def build(self, names, token):
+        """Index `names`, read when start_build returned `token`, in one go."""
+        index = NameIndex()
+        for name in names:
+            index._add(name, sort=False)
+        index._full.sort()
+        index._words.sort()
+        with self.lock:
+            if token != self._generation:
+                return  # cleared while we were building
+            self._names, self._full, self._words = index._names, index._full, index._words
+            self._grams, self._gram_counts = index._grams, index._gram_counts
+            for change, name in self._building:
+                change(name)
+            self._building = None
+            self.ready = True
+
+    def add(self, name):
+        self.update([name])
+
+    def update(self, names):
+        """add() each of `names`."""
+        with self.lock:
+            if self._building is not None:
+                self._building.extend((self._add, name) for name in names)
+            elif self.ready:
+                for name in names:
+                    self._add(name)
+
+    def remove(self, name):
+        with self.lock:
+            if self._building is not None:
+                self._building.append((self._remove, name))
+            elif self.ready:
+                self._remove(name)
+
+    def _add(self, name, sort=True):
+        if name in self._names:
+            return
+        key = normalize(name)
+        self._names.add(name)
+        place = insort if sort else list.append
+        place(self._full, (key, name))
+        for tail in _tails(key):
+            place(self._words, (tail, name))
+        grams = trigrams(key)
+        self._gram_counts[name] = len(grams)
+        for gram in grams:
+            self._grams.setdefault(gram, set()).add(name)
+
+    def _remove(self, name):
+        if name not in self._names:
+            return
+        key = normalize(name)
+        self._names.discard(name)
+        del self._gram_counts[name]
+        _discard(self._full, (key, name))
+        for tail in _tails(key):
+            _discard(self._words, (tail, name))
+        for gram in trigrams(key):
+            names = self._grams[gram]
+            names.discard(name)
+            if not names:
+                del self._grams[gram]
+
+    def search(self, query, limit=10, fuzzy=True):
+        """Return up to `limit` { "name", "match" } results, best first.
+
+        Exact matches come first, then names starting with the query, then names
+        with a later word starting with it, then (with `fuzzy`) names sharing most
+        of the query's trigrams, most similar first. Within each group, names are
+        in alphabetical order.
+        """
+        query = normalize(query)
+        if not query or limit <= 0:
+            return []
+        with self.lock:
+            return self._search(query, limit, fuzzy)
+
+    def _search(self, query, limit, fuzzy):
+        results, seen = [], set()
+
+        def take(name, match):
+            if name not in seen:
+                seen.add(name)
+                results.append({"name": name, "match": match})
+
+        for key, name in _starting(self._full, query, limit):
+            take(name, "exact" if key == query else "prefix")
+        if len(results) < limit:
+            for _, name in _starting(self._words, query, limit + len(results)):
+                take(name, "word")
+                if len(results) >= limit:
+                    break
+        if fuzzy and len(results) < limit:
+            for name in self._similar(query, limit - len(results), seen):
+                take(name, "fuzzy")
+        return results[:limit]
+
+    def _similar(self, query, limit, exclude):
+        grams = trigrams(query)
+        if not grams:
+            return []
+        needed = max(1, math.ceil(len(grams) * FUZZY_MIN_SHARED))
+        postings = sorted((self._grams.get(gram, ()) for gram in grams), key=len)
+        # A name sharing `needed` of the grams is in at least one of the rarest len - needed + 1,
+        # so candidates are counted from those; the common trigrams only add to their counts.
+        # Past FUZZY_MAX_CANDIDATES the rest of those lists is skipped: names reachable only
+        # through trigrams that common say little about the query anyway.
+        rarest = len(postings) - needed + 1
+        counts = Counter()
+        for posting in postings[:rarest]:
+            if counts and len(counts) + len(posting) > FUZZY_MAX_CANDIDATES:
+                break
+            counts.update(posting)
+        for posting in postings[rarest:]:
+            counts.update(counts.keys() & posting)
+        scored = []
+        for name, shared in counts.items():
+            if shared >= needed and name not in exclude:
+                # More of the query found first; then the name with the fewest other trigrams
+                scored.append((-shared, self._gram_counts[name] - shared, name))
+        return [name for _, _, name in heapq.nsmallest(limit, scored)]
+
+
+def _tails(key):
+    """The key from each word after the first: "mary ann smith" -> "ann smith", "smith"."""
+    words = key.split(" ")
+    return [" ".join(words[i:]) for i in range(1, len(words))]
+
+
+def _starting(keys, prefix, limit):
+    """Up to `limit` (key, name) entries of sorted `keys` whose key starts with `prefix`."""
+    found = []
+    for i in range(bisect_left(keys, (prefix,)), len(keys)):
+        if len(found) >= limit or not keys[i][0].startswith(prefix):
+            break
+        found.append(keys[i])
+    return found
+
+
+def _discard(keys, entry):
+    i = bisect_left(keys, entry)
+    if i < len(keys) and keys[i] == entry:
+        del keys[i]
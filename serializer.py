@@ -0,0 +1,36 @@
+import json
+import os
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is used without it
+    orjson = None
+
+from records import to_json
+
+# JSON encoding used for the data file, the journal and API responses.
+#   "auto"   - orjson when it is installed, otherwise the stdlib json module
+#   "stdlib" - always the stdlib json module
+ENCODER = os.environ.get("GRADING_SERIALIZER", "auto")
+
+
+def fast_encoder():
+    """Return True when orjson will be used for encoding."""
+    return orjson is not None and ENCODER != "stdlib"
+
+
+def dumps_bytes(data, pretty=False):
+    """Encode `data` (which may hold StudentRecords) as UTF-8 JSON bytes.
+
+    Output is compact unless `pretty` is set.
+    """
+    if fast_encoder():
+        return orjson.dumps(data, default=to_json, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(data, default=to_json, indent=4).encode("utf-8")
+    return json.dumps(data, default=to_json, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(data, pretty=False):
+    """Encode `data` as a JSON string; see dumps_bytes."""
+    return dumps_bytes(data, pretty).decode("utf-8")
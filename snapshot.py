@@ -0,0 +1,242 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import lazyload
+import records
+import serializer
+from records import StudentRecord
+
+# Binary snapshots of the student data (GRADING_LOAD=snapshot).
+# A snapshot is written next to the data file on every full write, and at startup it is
+# memory-mapped instead of parsing JSON: the names are decoded, the per-student totals
+# are used where they lie, and a student's grades are copied out of the mapping, with
+# no parsing, the first time the student is used (through lazyload.LazyRoster).
+#
+# Layout: a header, then these sections, each starting on an 8-byte boundary, in the
+# byte order recorded in the header:
+#   student_pairs   Q  n_students + 1   first pair of each student
+#   student_sums    d  n_students       grade sum and count of each student
+#   student_counts  q  n_students
+#   subject_sums    d  n_subjects       grade sum and count of each subject
+#   subject_counts  q  n_subjects
+#   pair_subjects   I  n_pairs          subject of each (student, subject) pair
+#   pair_grades     Q  n_pairs + 1      first grade of each pair
+#   grades          d  n_grades         every grade, student after student
+#   names                               student names, UTF-8, NUL after each
+#   subjects                            subject names, each stored once, the same way
+# The header also holds the size and mtime of the data file the snapshot was written
+# with; a snapshot that no longer matches its data file is ignored and rewritten.
+
+MAGIC = b"GRADSNAP"
+FORMAT = 1
+HEADER = struct.Struct("<8sIIqqQQQQQQ")
+BIG_ENDIAN = 1   # header flag: the sections are big-endian
+
+
+def _sections(n_students, n_subjects, n_pairs, n_grades, names_bytes, subjects_bytes):
+    """Return { section: (typecode or None for bytes, start, item count) } for the given sizes."""
+    sizes = [
+        ("student_pairs", "Q", n_students + 1),
+        ("student_sums", "d", n_students),
+        ("student_counts", "q", n_students),
+        ("subject_sums", "d", n_subjects),
+        ("subject_counts", "q", n_subjects),
+        ("pair_subjects", "I", n_pairs),
+        ("pair_grades", "Q", n_pairs + 1),
+        ("grades", "d", n_grades),
+        ("names", None, names_bytes),
+        ("subjects", None, subjects_bytes),
+    ]
+    layout, position = {}, HEADER.size
+    for section, typecode, count in sizes:
+        position = -(-position // 8) * 8
+        layout[section] = (typecode, position, count)
+        position += count * (array(typecode).itemsize if typecode else 1)
+    return layout
+
+
+def _join(strings):
+    if any("\0" in s for s in strings):
+        raise ValueError("names and subjects must not contain NUL characters")
+    return "".join(s + "\0" for s in strings).encode("utf-8")
+
+
+class Snapshot:
+    """A memory-mapped snapshot, usable as a LazyRoster source like lazyload.DataFile."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            # As in lazyload.DataFile, the mapping keeps the contents after the file is replaced
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, flags, size, mtime_ns, *counts = HEADER.unpack_from(self.map)
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError(f"{path} is not a format {FORMAT} grade snapshot")
+        if bool(flags & BIG_ENDIAN) != (sys.byteorder == "big"):
+            raise ValueError(f"{path} was written on a machine with the other byte order")
+        self.data_size, self.data_mtime_ns = size, mtime_ns
+
+        view = memoryview(self.map)
+        # Views straight into the mapping; nothing is copied until a record is read
+        for section, (typecode, start, count) in _sections(*counts).items():
+            length = count * (array(typecode).itemsize if typecode else 1)
+            part = view[start:start + length]
+            setattr(self, section, part.cast(typecode) if typecode else part)
+        self.sums, self.counts = self.student_sums, self.student_counts
+        self._grade_bytes = self.grades.cast("B")
+        self.names = bytes(self.names).decode("utf-8").split("\0")[:-1]
+        self.subject_names = [sys.intern(s) for s in bytes(self.subjects).decode("utf-8").split("\0")[:-1]]
+        self.subject_totals = {subject: (self.subject_sums[i], self.subject_counts[i])
+                               for i, subject in enumerate(self.subject_names) if self.subject_counts[i]}
+
+    def fresh_for(self, data_path):
+        """Whether the snapshot was written with the data file as it is now."""
+        try:
+            stat = os.stat(data_path)
+        except OSError:
+            return False
+        return stat.st_size == self.data_size and stat.st_mtime_ns == self.data_mtime_ns
+
+    def record(self, i):
+        first, last = self.student_pairs[i], self.student_pairs[i + 1]
+        base = self.pair_grades[first]
+        grades = array("d")
+        grades.frombytes(self._grade_bytes[base * 8:self.pair_grades[last] * 8])
+        subjects = [self.subject_names[self.pair_subjects[p]] for p in range(first, last)]
+        offsets = [self.pair_grades[p] - base for p in range(first, last + 1)]
+        return StudentRecord.from_buffer(subjects, offsets, grades)
+
+    def raw(self, i):
+        return serializer.dumps_bytes(self.record(i))
+
+
+def write_snapshot(path, items, data_path=None):
+    """Write (name, record) pairs to a snapshot at `path`, atomically, and return it opened.
+
+    `data_path` is the data file the snapshot mirrors; its size and mtime are recorded.
+    """
+    names = []
+    subject_ids = {}
+    student_pairs, student_sums, student_counts = array("Q", [0]), array("d"), array("q")
+    pair_subjects, pair_grades, grades = array("I"), array("Q", [0]), array("d")
+    subject_sums, subject_counts = array("d"), array("q")
+    for name, record in items:
+        record = StudentRecord.from_dict(record)
+        names.append(name)
+        total, count = 0.0, 0
+        for subject, values in record.items():
+            i = subject_ids.get(subject)
+            if i is None:
+                i = subject_ids[subject] = len(subject_ids)
+                subject_sums.append(0.0)
+                subject_counts.append(0)
+            pair_subjects.append(i)
+            grades.extend(values)
+            pair_grades.append(len(grades))
+            pair_sum = sum(values)
+            subject_sums[i] += pair_sum
+            subject_counts[i] += len(values)
+            total += pair_sum
+            count += len(values)
+        student_pairs.append(len(pair_subjects))
+        student_sums.append(total)
+        student_counts.append(count)
+
+    names_blob, subjects_blob = _join(names), _join(list(subject_ids))
+    counts = (len(names), len(subject_ids), len(pair_subjects), len(grades), len(names_blob), len(subjects_blob))
+    stat = os.stat(data_path) if data_path and os.path.exists(data_path) else None
+    header = HEADER.pack(MAGIC, FORMAT, BIG_ENDIAN if sys.byteorder == "big" else 0,
+                         stat.st_size if stat else 0, stat.st_mtime_ns if stat else 0, *counts)
+    parts = {"student_pairs": student_pairs, "student_sums": student_sums, "student_counts": student_counts,
+             "subject_sums": subject_sums, "subject_counts": subject_counts, "pair_subjects": pair_subjects,
+             "pair_grades": pair_grades, "grades": grades, "names": names_blob, "subjects": subjects_blob}
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for section, (_, start, _) in _sections(*counts).items():
+            f.write(b"\0" * (start - f.tell()))
+            part = parts[section]
+            part.tofile(f) if isinstance(part, array) else f.write(part)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return Snapshot(path)
+
+
+def open_snapshot(path, data_path=None):
+    """Open the snapshot at `path`, or return None if it is missing, unreadable or stale.
+
+    With `data_path`, the snapshot must have been written with that data file as it is now;
+    a snapshot written on its own is used only when there is no data file.
+    """
+    try:
+        snapshot = Snapshot(path)
+    except (OSError, ValueError, struct.error):
+        return None
+    if data_path is not None and os.path.exists(data_path) and not snapshot.fresh_for(data_path):
+        return None
+    return snapshot
+
+
+def open_roster(data_path, path, lock=None, resident_max=10000):
+    """Return a LazyRoster over the snapshot at `path`, writing it from the data file first if needed."""
+    source = open_snapshot(path, data_path)
+    if source is None:
+        if not os.path.exists(data_path):
+            return lazyload.LazyRoster(lock=lock, resident_max=resident_max)
+        print(f"Writing a snapshot of {data_path} to {path}...")
+        with open(data_path, "r") as f:
+            data = records.load_json(f)
+        try:
+            source = write_snapshot(path, data.items(), data_path)
+        except ValueError as e:
+            print(f"No snapshot written ({e}); loading {data_path} through its index instead.")
+            return lazyload.open_roster(data_path, lock=lock, resident_max=resident_max)
+    return lazyload.LazyRoster(source, lock=lock, resident_max=resident_max)
+
+
+# JSON <-> snapshot converter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between JSON data files and binary snapshots.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    to_snapshot = commands.add_parser("to-snapshot", help="write a snapshot of a JSON data file")
+    to_snapshot.add_argument("json")
+    to_snapshot.add_argument("snapshot")
+    to_json = commands.add_parser("to-json", help="write a snapshot back out as a JSON data file")
+    to_json.add_argument("snapshot")
+    to_json.add_argument("json")
+    info = commands.add_parser("info", help="describe a snapshot")
+    info.add_argument("snapshot")
+    args = parser.parse_args()
+
+    if args.command == "to-snapshot":
+        with open(args.json, "r") as f:
+            data = records.load_json(f)
+        # The data file stays where it is, so the snapshot is tied to it
+        snapshot = write_snapshot(args.snapshot, data.items(), args.json)
+        print(f"Wrote {len(snapshot.names)} students to {args.snapshot} ({os.path.getsize(args.snapshot)} bytes).")
+    elif args.command == "to-json":
+        snapshot = Snapshot(args.snapshot)
+        with open(args.json + ".tmp", "wb") as f:
+            f.write(b"{")
+            for i, name in enumerate(snapshot.names):
+                f.write((b"," if i else b"") + serializer.dumps_bytes(name) + b":" + snapshot.raw(i))
+            f.write(b"}")
+        os.replace(args.json + ".tmp", args.json)
+        print(f"Wrote {len(snapshot.names)} students to {args.json}.")
+    else:
+        snapshot = Snapshot(args.snapshot)
+        print(f"{args.snapshot}: format {FORMAT}, {len(snapshot.names)} students, "
+              f"{len(snapshot.subject_names)} subjects, {len(snapshot.pair_subjects)} student subjects, "
+              f"{len(snapshot.grades)} grades")
+
+
+if __name__ == "__main__":
+    main()
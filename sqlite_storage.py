@@ -0,0 +1,318 @@
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import backups
+from records import StudentRecord, plain_grades
+
+# SQLite storage backend (GRADING_STORAGE=sqlite).
+# Students, subjects and grades live in indexed tables; every change reported by
+# firstProj is written inside the open transaction and committed by save(), so a
+# route's changes (or a whole bulk import) land in one transaction.
+# With `shared` set, several processes serve the same database: each change is
+# also written to the `changes` table, which the other processes read through
+# poll() to bring their in-memory copy up to date.
+
+CHANGE_LOG_KEEP = 10000   # Changes kept for other processes; one further behind reloads everything
+CHANGE_LOG_PRUNE = 1000   # Changes published between prunes of the change log
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    id   INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS subjects (
+    id   INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+-- A student can take a subject with no grades left in it, so enrolment is kept apart from grades
+CREATE TABLE IF NOT EXISTS enrollments (
+    id         INTEGER PRIMARY KEY,
+    student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+    subject_id INTEGER NOT NULL REFERENCES subjects(id),
+    UNIQUE (student_id, subject_id)
+);
+CREATE TABLE IF NOT EXISTS grades (
+    id         INTEGER PRIMARY KEY,
+    student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+    subject_id INTEGER NOT NULL REFERENCES subjects(id),
+    grade      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS grades_by_student ON grades (student_id, subject_id);
+CREATE INDEX IF NOT EXISTS grades_by_subject ON grades (subject_id);
+-- Changes published for the other processes sharing the database, oldest first
+CREATE TABLE IF NOT EXISTS changes (
+    seq     INTEGER PRIMARY KEY,
+    origin  TEXT NOT NULL,
+    op      TEXT NOT NULL,
+    name    TEXT,
+    subject TEXT,
+    grades  TEXT
+);
+"""
+
+
+class SQLiteStorage:
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self.origin = f"{os.getpid()}-{os.urandom(4).hex()}"  # tells our published changes from others'
+        self._lock = threading.RLock()
+        # Other processes may hold the write lock for the length of a request
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level="DEFERRED", timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._student_ids = {}
+        self._subject_ids = {}
+        self._loaded = None
+        self._seen = 0              # last change in the log read by this process
+        self._data_version = None   # PRAGMA data_version when the change log was last read
+        self._published = 0
+
+    # Ids
+
+    def _id(self, table, cache, name, create=True):
+        key = cache.get(name)
+        if key is None:
+            row = self._conn.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                if not create:
+                    return None
+                row = (self._conn.execute(f"INSERT INTO {table} (name) VALUES (?)", (name,)).lastrowid,)
+            key = cache[name] = row[0]
+        return key
+
+    def _student_id(self, name, create=True):
+        return self._id("students", self._student_ids, name, create)
+
+    def _subject_id(self, subject, create=True):
+        return self._id("subjects", self._subject_ids, subject, create)
+
+    # Storage interface used by firstProj
+
+    def load(self):
+        """Read every student into a { name: StudentRecord } dict."""
+        with self._lock:
+            # One read transaction, so the data and the change log position agree
+            own_transaction = not self._conn.in_transaction
+            if own_transaction:
+                self._conn.execute("BEGIN")
+            data = {}
+            for (name,) in self._conn.execute("SELECT name FROM students ORDER BY id"):
+                data[name] = {}
+            rows = self._conn.execute("""
+                SELECT st.name, su.name FROM enrollments e
+                JOIN students st ON st.id = e.student_id
+                JOIN subjects su ON su.id = e.subject_id
+                ORDER BY e.id""")
+            for name, subject in rows:
+                data[name][subject] = []
+            rows = self._conn.execute("""
+                SELECT st.name, su.name, g.grade FROM grades g
+                JOIN students st ON st.id = g.student_id
+                JOIN subjects su ON su.id = g.subject_id
+                ORDER BY g.id""")
+            for name, subject, grade in rows:
+                data[name][subject].append(grade)
+            data = {name: StudentRecord.from_dict(subjects) for name, subjects in data.items()}
+            self._seen = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if own_transaction:
+                self._conn.commit()
+            self._loaded = data
+            print(f"Student data loaded successfully from {self.path}.")
+            return data
+
+    def record_change(self, op, name, subject=None, grades=None):
+        """Write one change (same ops as the journal) into the open transaction."""
+        with self._lock:
+            if self.shared:
+                self._publish(op, name, subject, grades)
+            if op == "remove_student":
+                self._conn.execute("DELETE FROM students WHERE name = ?", (name,))
+                self._student_ids.pop(name, None)
+                return
+            student_id = self._student_id(name)
+            if op in ("set_grade", "remove_grade"):
+                subject_id = self._subject_id(subject)
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO enrollments (student_id, subject_id) VALUES (?, ?)",
+                    (student_id, subject_id))
+                # The change carries the pair's full grade list, so replace the pair's rows
+                self._conn.execute(
+                    "DELETE FROM grades WHERE student_id = ? AND subject_id = ?", (student_id, subject_id))
+                self._conn.executemany(
+                    "INSERT INTO grades (student_id, subject_id, grade) VALUES (?, ?, ?)",
+                    [(student_id, subject_id, g) for g in grades])
+
+    def record_changes(self, changes):
+        """Write several (op, name, subject, grades) changes; they are committed together by save()."""
+        with self._lock:
+            for op, name, subject, grades in changes:
+                self.record_change(op, name, subject, grades)
+
+    def save(self, students_dict=None, create_backup=True):
+        """Commit the changes recorded since the last save."""
+        with self._lock:
+            if self._published >= CHANGE_LOG_PRUNE:
+                self._conn.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?",
+                                   (CHANGE_LOG_KEEP,))
+                self._published = 0
+            self._conn.commit()
+
+    def totals_for(self, data):
+        """Return (pair, student, subject) totals computed in SQL, if `data` is what load() returned."""
+        if data is not self._loaded:
+            return None
+        with self._lock:
+            students = dict(self._conn.execute("SELECT id, name FROM students"))
+            subjects = dict(self._conn.execute("SELECT id, name FROM subjects"))
+            pair_totals, student_totals, subject_totals = {}, {}, {}
+            rows = self._conn.execute("""
+                SELECT student_id, subject_id, SUM(grade), COUNT(*) FROM grades
+                GROUP BY student_id, subject_id""")
+            for student_id, subject_id, total, count in rows:
+                name, subject = students[student_id], subjects[subject_id]
+                pair_totals[(name, subject)] = (total, count)
+                old_total, old_count = student_totals.get(name, (0, 0))
+                student_totals[name] = (old_total + total, old_count + count)
+                old_total, old_count = subject_totals.get(subject, (0, 0))
+                subject_totals[subject] = (old_total + total, old_count + count)
+        self._loaded = None
+        return pair_totals, student_totals, subject_totals
+
+    # Change log (shared mode)
+
+    def _publish(self, op, name, subject=None, grades=None):
+        seq = self._conn.execute(
+            "INSERT INTO changes (origin, op, name, subject, grades) VALUES (?, ?, ?, ?, ?)",
+            (self.origin, op, name, subject, None if grades is None else json.dumps(grades))).lastrowid
+        if seq == self._seen + 1:
+            self._seen = seq  # nothing unread before it, so poll() need not read it back
+        self._published += 1
+
+    def begin(self):
+        """Take the database write lock ahead of a change, unless this process already holds it.
+
+        Other processes wait until save() commits, so a change is made against
+        data that already includes every change before it.
+        """
+        with self._lock:
+            if not self._conn.in_transaction:
+                self._conn.execute("BEGIN IMMEDIATE")
+
+    def changed(self):
+        """Whether another process has committed anything since the change log was last read."""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version
+
+    def poll(self):
+        """Return the changes other processes published since the last call, oldest first.
+
+        Each change is a journal-style record ({"op", "name", "subject", "grades"}).
+        Returns None when the change log no longer goes back far enough, or another
+        process replaced every student; the caller should load() everything again.
+        """
+        with self._lock:
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT seq, origin, op, name, subject, grades FROM changes WHERE seq > ? ORDER BY seq",
+                (self._seen,)).fetchall()
+            if not rows:
+                return []
+            if rows[0][0] != self._seen + 1:
+                return None  # pruned before we read it
+            self._seen = rows[-1][0]
+        changes = []
+        for seq, origin, op, name, subject, grades in rows:
+            if origin == self.origin:
+                continue
+            if op == "reload":
+                return None
+            change = {"op": op, "name": name}
+            if subject is not None:
+                change["subject"] = subject
+                change["grades"] = json.loads(grades)
+            changes.append(change)
+        return changes
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    # Migration
+
+    def import_students(self, data):
+        """Replace the stored students with a { name: { subject: [grades] } } dict, in one transaction."""
+        with self._lock:
+            self._conn.execute("DELETE FROM grades")
+            self._conn.execute("DELETE FROM enrollments")
+            self._conn.execute("DELETE FROM students")
+            self._student_ids.clear()
+            shared, self.shared = self.shared, False
+            try:
+                for name, subjects in data.items():
+                    self.record_change("add_student", name)
+                    for subject, grades in subjects.items():
+                        self.record_change("set_grade", name, subject, plain_grades(grades))
+            finally:
+                self.shared = shared
+            if shared:
+                self._publish("reload", None)
+            self._conn.commit()
+
+
+def migrate(json_path, db_path, backup_folder):
+    """One-shot import of the JSON data file into a SQLite database, and of old backup copies into the backup store."""
+    storage = SQLiteStorage(db_path)
+    if os.path.exists(json_path):
+        with open(json_path, "r") as f:
+            data = json.load(f)
+        storage.import_students(data)
+        print(f"Imported {len(data)} students from {json_path}.")
+    else:
+        print(f"No data file found at {json_path}; students table left as is.")
+
+    # Backups saved before backups.py are taken into its store, so restore_backup can
+    # reach them; the catalog is oldest first, so only ones newer than it can be added
+    store = backups.BackupStore(backup_folder)
+    imported = skipped = 0
+    for path in sorted(glob.glob(os.path.join(backup_folder, "students_backup_*.json"))):
+        stamp = os.path.basename(path)[len("students_backup_"):-len(".json")]
+        try:
+            taken = datetime.strptime(stamp, "%Y%m%d_%H%M%S").timestamp()
+            catalog = store.entries()
+            if catalog and taken <= catalog[-1]["time"]:
+                skipped += 1
+                continue
+            with open(path, "r") as f:
+                data = json.load(f)
+            if store.snapshot(data, now=taken, force=True):
+                imported += 1
+            else:
+                skipped += 1  # same data as the backup before it
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not import backup {path}. {e}")
+    print(f"Imported {imported} backups into {store.catalog_path} ({skipped} already present or unchanged).")
+    storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import students_data.json into SQLite and old backups/ copies into the backup store.")
+    parser.add_argument("--json", default="students_data.json", help="JSON data file to import")
+    parser.add_argument("--db", default="students_data.db", help="SQLite database to create or update")
+    parser.add_argument("--backups", default="backups", help="backup folder holding students_backup_*.json copies")
+    args = parser.parse_args()
+    migrate(args.json, args.db, args.backups)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,7 @@ document.getElementById("add-student-btn").addEventListener("click", async () =>
         const data = await res.json();
         showMessage(msgEl, data.message, data.success ? "green" : "red");
         document.getElementById("student-name").value = "";
-        refreshRankings();
+        rankingsChanged();
     } catch { showMessage(msgEl, "Error connecting to server.", "red"); }
 });
 
@@ -33,7 +33,7 @@ document.getElementById("delete-student-btn").addEventListener("click", async ()
         const data = await res.json();
         showMessage(msgEl, data.message, data.success ? "green" : "red");
         document.getElementById("student-name").value = "";
-        refreshRankings();
+        rankingsChanged();
     } catch { showMessage(msgEl, "Error connecting to server.", "red"); }
 });
 
@@ -60,7 +60,7 @@ document.getElementById("add-grade-btn").addEventListener("click", async () => {
         document.getElementById("grade-student-name").value = "";
         document.getElementById("grade-subject").value = "";
         document.getElementById("grade-values").value = "";
-        refreshRankings();
+        rankingsChanged();
     } catch { showMessage(msgEl, "Error connecting to server.", "red"); }
 });
 
@@ -89,7 +89,7 @@ document.getElementById("delete-grade-btn").addEventListener("click", async () =
         document.getElementById("grade-student-name").value = "";
         document.getElementById("grade-subject").value = "";
         document.getElementById("grade-values").value = "";
-        refreshRankings();
+        rankingsChanged();
     } catch { showMessage(msgEl, "Error connecting to server.", "red"); }
 });
 
@@ -192,36 +192,150 @@ document.getElementById("view-report-btn").addEventListener("click", async () =>
     } catch { container.innerHTML = "<p style='color:red'>Error connecting to server.</p>"; }
 });
 
+// --- Name suggestions while typing ---
+// Every student-name box offers matches from GET /search, asked for once typing pauses
+const suggestionList = document.getElementById("student-suggestions");
+let suggestionTimer = null;
+let suggestionQuery = "";
+for (const id of ["student-name", "grade-student-name", "report-student-name"]) {
+    document.getElementById(id).addEventListener("input", (event) => {
+        clearTimeout(suggestionTimer);
+        const query = event.target.value.trim();
+        suggestionTimer = setTimeout(() => suggestNames(query), 150);
+    });
+}
+async function suggestNames(query) {
+    suggestionQuery = query;
+    if (!query) return suggestionList.innerHTML = "";
+    try {
+        const res = await fetch(`${API_BASE}/search?q=${encodeURIComponent(query)}&limit=8`);
+        const data = await res.json();
+        // A slower reply to an earlier query must not replace the current suggestions
+        if (!data.success || query !== suggestionQuery) return;
+        suggestionList.innerHTML = "";
+        for (const result of data.results) {
+            const option = document.createElement("option");
+            option.value = result.name;
+            suggestionList.appendChild(option);
+        }
+    } catch { suggestionList.innerHTML = ""; }
+}
+
 // --- View Rankings ---
+// The table is fetched once; while the change feed (GET /events) is connected it is then
+// updated from the rank changes it pushes, and fetched again only when told to reset.
+let rankingRows = [];          // {name, average, exact_average, letter}, best first
+let rankingsLoading = false;
+let queuedChanges = [];        // changes that arrived while the table was being fetched
+let liveUpdates = false;
+
 document.getElementById("view-rankings-btn").addEventListener("click", refreshRankings);
 async function refreshRankings() {
     const container = document.getElementById("rankings-container");
-    container.innerHTML = "";
+    rankingsLoading = true;
     try {
         const res = await fetch(`${API_BASE}/rankings`);
         const data = await res.json();
-        if (!data.success) return container.innerHTML = `<p style="color:red">${data.message}</p>`;
-
-        let html = "<table><tr><th>Rank</th><th>Name</th><th>Average</th><th>Letter</th></tr>";
-        for (const student of data.rankings) {
-            html += `<tr>
-                <td>${student.rank}</td>
-                <td>${student.name}</td>
-                <td>${student.average}</td>
-                <td>${student.letter}</td>
-            </tr>`;
+        if (!data.success) {
+            rankingRows = [];
+            container.innerHTML = `<p style="color:red">${data.message}</p>`;
+        } else {
+            rankingRows = data.rankings.map(({name, average, exact_average, letter}) => ({name, average, exact_average, letter}));
         }
-        html += "</table>";
-        container.innerHTML = html;
+    } catch {
+        container.innerHTML = "<p style='color:red'>Error connecting to server.</p>";
+        rankingsLoading = false;
+        return;
+    }
+    rankingsLoading = false;
+    // Changes carry absolute values, so replaying one the fetch already included is harmless
+    for (const [type, change] of queuedChanges) applyRankChange(type, change);
+    queuedChanges = [];
+    if (rankingRows.length) renderRankings();
+}
 
-    } catch { container.innerHTML = "<p style='color:red'>Error connecting to server.</p>"; }
+function renderRankings() {
+    const container = document.getElementById("rankings-container");
+    if (!rankingRows.length) return container.innerHTML = `<p style="color:red">No students with grades to rank.</p>`;
+
+    let html = "<table><tr><th>Rank</th><th>Name</th><th>Average</th><th>Letter</th></tr>";
+    let rank = 0;
+    rankingRows.forEach((student, i) => {
+        // Competition ranking: tied averages share a rank. Ties and order go by the unrounded
+        // average, as on the server; two rounded averages can be equal without being tied
+        if (i === 0 || student.exact_average !== rankingRows[i - 1].exact_average) rank = i + 1;
+        html += `<tr>
+            <td>${rank}</td>
+            <td>${student.name}</td>
+            <td>${student.average}</td>
+            <td>${student.letter}</td>
+        </tr>`;
+    });
+    html += "</table>";
+    container.innerHTML = html;
+}
+
+function applyRankChange(type, change) {
+    rankingRows = rankingRows.filter(row => row.name !== change.name);
+    if (type !== "rank") return;
+    // Same order as the server: higher average first, then name
+    let low = 0, high = rankingRows.length;
+    while (low < high) {
+        const mid = (low + high) >> 1;
+        const row = rankingRows[mid];
+        if (row.exact_average > change.exact_average ||
+            (row.exact_average === change.exact_average && row.name < change.name)) low = mid + 1;
+        else high = mid;
+    }
+    rankingRows.splice(low, 0, {name: change.name, average: change.average, exact_average: change.exact_average, letter: change.letter});
+}
+
+function onRankChange(type, change) {
+    if (rankingsLoading) return queuedChanges.push([type, change]);
+    applyRankChange(type, change);
+    renderRankings();
+}
+
+function rankingsChanged() {
+    // With the change feed connected, the table follows from the events instead
+    if (!liveUpdates) refreshRankings();
+}
+
+function connectChangeFeed() {
+    if (!window.EventSource) return;
+    const source = new EventSource(`${API_BASE}/events`);
+    source.addEventListener("open", () => { liveUpdates = true; refreshRankings(); });
+    source.addEventListener("error", () => { liveUpdates = false; });
+    source.addEventListener("rank", event => onRankChange("rank", JSON.parse(event.data)));
+    source.addEventListener("unranked", event => onRankChange("unranked", JSON.parse(event.data)));
+    source.addEventListener("subject", event => onSubjectChange(JSON.parse(event.data)));
+    source.addEventListener("reset", () => refreshRankings());
 }
 
 // --- View Subject Average ---
+let shownSubject = null;       // kept up to date by the change feed
+
+function showSubjectAverage(subject, average, letter) {
+    shownSubject = subject;
+    document.getElementById("subject-average-container").innerHTML =
+        `<p>Average for <strong>${subject}</strong>: ${average} (${letter})</p>`;
+}
+
+function onSubjectChange(change) {
+    if (change.subject !== shownSubject) return;
+    if (change.average === null) {
+        shownSubject = null;
+        return document.getElementById("subject-average-container").innerHTML =
+            `<p style="color:red">No grades found for ${change.subject}</p>`;
+    }
+    showSubjectAverage(change.subject, change.average, change.letter);
+}
+
 document.getElementById("view-subject-average-btn").addEventListener("click", async () => {
     const subject = document.getElementById("average-subject-name").value.trim();
     const container = document.getElementById("subject-average-container");
     container.innerHTML = "";
+    shownSubject = null;
     if (!subject) return container.innerHTML = `<p style="color:red">Enter a subject!</p>`;
 
     try {
@@ -229,7 +343,7 @@ document.getElementById("view-subject-average-btn").addEventListener("click", as
         const data = await res.json();
         if (!data.success) return container.innerHTML = `<p style="color:red">${data.message}</p>`;
 
-        container.innerHTML = `<p>Average for <strong>${data.subject}</strong>: ${data.average} (${data.letter})</p>`;
+        showSubjectAverage(data.subject, data.average, data.letter);
     } catch { container.innerHTML = "<p style='color:red'>Error connecting to server.</p>"; }
 });
 
@@ -241,3 +355,4 @@ function showMessage(el, text, color) {
 
 // --- Initial load ---
 refreshRankings();
+connectChangeFeed();
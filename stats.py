@@ -0,0 +1,107 @@
+import math
+
+from columnar import LETTER_CUTOFFS, LETTERS
+
+# Running grade distributions for the /stats endpoints.
+# A GradeDistribution takes grades in and out one at a time and answers in constant time:
+#   mean, variance - Welford's running mean and sum of squared deviations, undone on removal
+#   histogram      - one bucket per whole point: [0, 1), [1, 2), ... [99, 100), then 100 and up,
+#                    with one more below 0. The buckets double as the quantile sketch (within
+#                    1 point; exact for whole-number grades) and, as the letter cutoffs fall on
+#                    whole points, give exact letter-grade counts.
+# Unlike most quantile sketches, the buckets support deletes, which removeGrade needs.
+
+BUCKETS = 102
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+
+# Letter of every bucket, from the lower bound of the grades it holds
+_BUCKET_LETTERS = [0] + [sum(1 for cutoff in LETTER_CUTOFFS if low >= cutoff) for low in range(100)] + [len(LETTERS) - 1]
+
+
+def _bucket(grade):
+    if grade < 0:
+        return 0
+    if grade >= 100:
+        return BUCKETS - 1
+    return int(grade) + 1
+
+
+def _bucket_value(bucket):
+    """The grade a bucket stands for in percentile estimates: its lower bound, kept within 0-100."""
+    return min(max(bucket - 1, 0), 100)
+
+
+class GradeDistribution:
+    __slots__ = ("count", "mean", "m2", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, grade):
+        self.count += 1
+        delta = grade - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (grade - self.mean)
+        self.buckets[_bucket(grade)] += 1
+
+    def remove(self, grade):
+        if self.count <= 1:
+            self.__init__()
+            return
+        old_mean = self.mean
+        self.count -= 1
+        self.mean = (old_mean * (self.count + 1) - grade) / self.count
+        self.m2 = max(0.0, self.m2 - (grade - old_mean) * (grade - self.mean))
+        self.buckets[_bucket(grade)] -= 1
+
+    def variance(self):
+        """Population variance of the grades, or None when there are none."""
+        return self.m2 / self.count if self.count else None
+
+    def percentile(self, p):
+        """Estimate the p-th percentile (0-100), interpolating between ranks like numpy's default."""
+        if not self.count:
+            return None
+        position = p / 100 * (self.count - 1)
+        below = math.floor(position)
+        low, high = self._order_statistic(below), self._order_statistic(min(below + 1, self.count - 1))
+        return low + (high - low) * (position - below)
+
+    def _order_statistic(self, k):
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen > k:
+                return _bucket_value(bucket)
+        return 100
+
+    def letter_counts(self):
+        counts = [0] * len(LETTERS)
+        for bucket, count in enumerate(self.buckets):
+            counts[_BUCKET_LETTERS[bucket]] += count
+        return dict(zip(LETTERS, counts))
+
+    def bands(self, width=10):
+        """Counts in `width`-point bands from 0; grades below 0 fall in the first, 100 and up in the last."""
+        counts = [0] * (100 // width)
+        for bucket, count in enumerate(self.buckets):
+            counts[min(_bucket_value(bucket) // width, len(counts) - 1)] += count
+        return [{"from": i * width, "to": (i + 1) * width, "count": c} for i, c in enumerate(counts)]
+
+    def summary(self, percentiles=DEFAULT_PERCENTILES):
+        if not self.count:
+            return {"count": 0}
+        variance = self.variance()
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 2),
+            "variance": round(variance, 2),
+            "stdev": round(math.sqrt(variance), 2),
+            "median": round(self.percentile(50), 2),
+            "percentiles": {f"p{p:g}": round(self.percentile(p), 2) for p in percentiles},
+            "histogram": self.bands(),
+            "letters": self.letter_counts(),
+        }
@@ -0,0 +1,24 @@
+import pytest
+
+import classes
+
+
+@pytest.mark.parametrize("class_id", ["index", "INDEX", "x.frozen", "a.b", "-x", ""])
+def test_reserved_and_dotted_class_ids_are_rejected(class_id):
+    assert not classes.CLASS_ID.fullmatch(class_id)
+
+
+@pytest.mark.parametrize("class_id", ["math-9A", "index2", "my_index", "x"])
+def test_plain_class_ids_are_accepted(class_id):
+    assert classes.CLASS_ID.fullmatch(class_id)
+
+
+def test_class_named_index_cannot_overwrite_the_index(tmp_path):
+    store = classes.ClassStore(str(tmp_path))
+    assert store.create("math")
+    with pytest.raises(ValueError):
+        store.create("index")
+
+    reopened = classes.ClassStore(str(tmp_path))
+    assert list(reopened.classes()) == ["math"]
+    assert reopened.get("math") is not None
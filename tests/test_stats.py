@@ -0,0 +1,17 @@
+from collections import Counter
+
+import firstProj
+
+
+def test_class_stats_letters_match_each_students_letter():
+    data = {"Ann": {"Math": [95]}, "Ben": {"Math": [80]}, "Cal": {"Math": [80, 80]},
+            "Dee": {"Math": [79.5]}, "Eve": {"Math": [50]}, "Fay": {"Math": [100, 59]}}
+    firstProj.reset_students(data)
+    try:
+        result = firstProj.getClassStats()
+        expected = Counter(firstProj.letter_grade(sum(g["Math"]) / len(g["Math"])) for g in data.values())
+        letters = result["students"]["letters"]
+        assert result["students"]["graded"] == len(data)
+        assert {letter: n for letter, n in letters.items() if n} == dict(expected)
+    finally:
+        firstProj.reset_students({})
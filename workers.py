@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+# Multi-process serving: several worker processes accept connections from one
+# listening socket, so reads are served on every core. The workers run with
+# GRADING_SHARED=1 (see firstProj.SHARED_STORE): the SQLite database is the one
+# authoritative store, and each worker applies the others' changes before it
+# serves a request, so no worker answers from stale data.
+#   python workers.py --workers 4 --port 5000             (threaded Werkzeug server per worker)
+#   python workers.py --workers 4 --server async          (asgi.py's server per worker)
+# Under gunicorn or uvicorn, set GRADING_SHARED=1 and use their own --workers option.
+# On first start an existing students_data.json is imported into the database.
+
+# Workers stop on SIGTERM the way they would on Ctrl+C, so atexit handlers run
+_SYNC_WORKER = """
+import signal, sys
+signal.signal(signal.SIGTERM, signal.default_int_handler)
+from werkzeug.serving import make_server
+import app
+try:
+    make_server(sys.argv[1], int(sys.argv[2]), app.app, threaded=True, fd=int(sys.argv[3])).serve_forever()
+except KeyboardInterrupt:
+    pass
+"""
+
+_ASYNC_WORKER = """
+import asyncio, signal, socket, sys
+signal.signal(signal.SIGTERM, signal.default_int_handler)
+import asgi
+try:
+    asyncio.run(asgi.serve(sock=socket.socket(fileno=int(sys.argv[3]))))
+except KeyboardInterrupt:
+    pass
+"""
+
+
+def _import_json_data():
+    """Import FILENAME into a new SQLITE_FILENAME, so workers start from the existing data."""
+    import firstProj
+    from sqlite_storage import SQLiteStorage
+
+    if os.path.exists(firstProj.SQLITE_FILENAME) or not os.path.exists(firstProj.FILENAME):
+        return
+    with open(firstProj.FILENAME, "r") as f:
+        data = json.load(f)
+    storage = SQLiteStorage(firstProj.SQLITE_FILENAME)
+    storage.import_students(data)
+    storage.close()
+    print(f"Imported {len(data)} students from {firstProj.FILENAME} into {firstProj.SQLITE_FILENAME}.")
+
+
+def _spawn(server, host, port, sock):
+    code = _ASYNC_WORKER if server == "async" else _SYNC_WORKER
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    return subprocess.Popen([sys.executable, "-c", code, host, str(port), str(sock.fileno())],
+                            env=env, pass_fds=(sock.fileno(),))
+
+
+def serve(workers, host="127.0.0.1", port=5000, server="sync"):
+    """Run `workers` worker processes on one listening socket until interrupted."""
+    os.environ["GRADING_SHARED"] = "1"
+    _import_json_data()
+
+    sock = socket.create_server((host, port), backlog=4096)
+    sock.set_inheritable(True)
+    processes = [_spawn(server, host, port, sock) for _ in range(workers)]
+    print(f"Serving on http://{host}:{port} with {workers} {server} workers")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        while not stopping:
+            # A worker that dies is replaced; the others keep serving meanwhile
+            for i, process in enumerate(processes):
+                if process.poll() is not None and not stopping:
+                    print(f"Worker {process.pid} exited with status {process.returncode}; starting another.")
+                    processes[i] = _spawn(server, host, port, sock)
+            time.sleep(0.5)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the grading API from several worker processes.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--server", choices=["sync", "async"], default="sync")
+    args = parser.parse_args()
+    serve(args.workers, args.host, args.port, args.server)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import deque
+
+# Background persistence worker with group commit.
+# Request handlers call notify() after changing the data. The worker collects
+# notifications for up to `window` seconds (or `max_batch` of them) and then
+# performs a single write for the whole batch. A failed write is reported to the
+# callers waiting on that batch and retried, with the changes that came since,
+# after RETRY_DELAY seconds; the batch counts as durable only once a write succeeds.
+
+RETRY_DELAY = 1.0
+
+
+def latency_percentiles(samples):
+    """Return p50/p95/p99 (in milliseconds) of a list of durations in seconds."""
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {
+        f"p{p}_ms": round(ordered[min(last, int(round(p / 100 * last)))] * 1000, 3)
+        for p in (50, 95, 99)
+    }
+
+
+class PersistenceWorker:
+    def __init__(self, write, window=0.05, max_batch=100):
+        self.write = write            # called with no arguments to persist the current data
+        self.window = window
+        self.max_batch = max_batch
+
+        self._cond = threading.Condition()
+        self._requested = 0           # notifications received so far
+        self._durable = 0             # notifications covered by a finished write
+        self._failed = 0              # notifications covered by the last failed write, until one succeeds
+        self._error = None            # the exception it raised, likewise
+        self._pending_since = []      # notify times of changes not yet written
+        self._latencies = deque(maxlen=10000)
+        self._batches = 0
+        self._stopping = False
+        self._hurry = False           # set by flush() to close the current window early
+        self._callbacks = []          # (ticket, callback) pairs waiting for on_durable
+        self._retry_at = 0.0          # no write starts before this, after a failure
+        self._thread = threading.Thread(target=self._run, name="persistence-worker", daemon=True)
+        self._thread.start()
+
+    def notify(self, wait=True):
+        """Mark the data dirty. With wait=True, block until it is on disk.
+
+        Raises the write's exception if the write covering this change failed.
+        """
+        with self._cond:
+            self._requested += 1
+            ticket = self._requested
+            self._pending_since.append(time.perf_counter())
+            self._cond.notify_all()
+            if wait:
+                self._wait(ticket)
+
+    def _wait(self, ticket):
+        # Called with _cond held
+        while self._durable < ticket and self._failed < ticket and self._thread.is_alive():
+            self._cond.wait()
+        if self._durable < ticket and self._error is not None:
+            raise self._error
+
+    def on_durable(self, callback):
+        """Call `callback(error)` once every change notified so far is on disk.
+
+        `error` is None, or the exception of the write that failed to save them.
+        The callback runs on the worker thread (or right away if nothing is pending),
+        so it lets async code wait for a write without blocking a thread.
+        """
+        with self._cond:
+            ticket = self._requested
+            if self._durable < ticket and self._thread.is_alive():
+                self._callbacks.append((ticket, callback))
+                return
+        callback(None)
+
+    def flush(self):
+        """Block until every change notified so far has been written, or raise why it was not."""
+        with self._cond:
+            ticket = self._requested
+            self._hurry = True
+            self._cond.notify_all()
+            self._wait(ticket)
+
+    def stop(self):
+        """Write any pending changes and stop the worker thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        with self._cond:
+            result = {
+                "batches": self._batches,
+                "mutations": self._durable,
+                "pending": self._requested - self._durable,
+                "error": None if self._error is None else str(self._error),
+            }
+            result.update(latency_percentiles(list(self._latencies)))
+        return result
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending_since and not self._stopping:
+                    self._cond.wait()
+                if not self._pending_since and self._stopping:
+                    return
+                # After a failed write, wait until the retry is due
+                while not self._stopping and time.perf_counter() < self._retry_at:
+                    self._cond.wait(self._retry_at - time.perf_counter())
+                # Let more changes join the batch until the window closes or it is full
+                deadline = self._pending_since[0] + self.window
+                while (not self._stopping
+                       and not self._hurry
+                       and len(self._pending_since) < self.max_batch
+                       and time.perf_counter() < deadline):
+                    self._cond.wait(deadline - time.perf_counter())
+                ticket = self._requested
+                batch = self._pending_since
+                self._pending_since = []
+                self._hurry = False
+
+            try:
+                self.write()
+                error = None
+            except Exception as e:
+                print(f"Error saving data: {e}")
+                error = e
+
+            done = time.perf_counter()
+            with self._cond:
+                if error is None:
+                    self._durable = ticket
+                    self._failed, self._error = 0, None  # the retry (or a later batch) made it
+                    self._batches += 1
+                    self._latencies.extend(done - t for t in batch)
+                else:
+                    self._failed, self._error = ticket, error
+                    if not self._stopping:
+                        # Still unwritten: they join the next write
+                        self._pending_since = batch + self._pending_since
+                        self._retry_at = done + RETRY_DELAY
+                self._cond.notify_all()
+                ready = [callback for t, callback in self._callbacks if t <= ticket]
+                self._callbacks = [(t, callback) for t, callback in self._callbacks if t > ticket]
+            for callback in ready:
+                callback(error)